@@ -0,0 +1,61 @@
+"""Micro-benchmark of the intersection callback camera computation.
+
+Compares reading the camera from a `pyvista.Plotter` (the previous
+approach) with the analytic `section_camera`, both on their own and as
+part of the intersect + camera steps of the callback.
+
+Usage (from the repository root):
+
+    python -m benchmarks.camera ./data/eclgrid-70729.vtu --polylines 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pyvista
+
+from benchmarks.intersection import random_polylines
+from camera import section_camera
+from grid_intersection import GridIntersector
+
+
+def plotter_camera(section):
+    pll = pyvista.Plotter(off_screen=True)
+    pll.add_mesh(section)
+    position = pll.camera.position
+    pll.close()
+    return position
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("vtu_file")
+    parser.add_argument("--polylines", type=int, default=10)
+    args = parser.parse_args()
+
+    grid = pyvista.read(args.vtu_file).cast_to_explicit_structured_grid()
+    intersector = GridIntersector(grid)
+
+    timings = {"plotter": [], "analytic": [], "callback before": [], "callback after": []}
+    for polyline in random_polylines(grid, args.polylines, vertices=3):
+        start = time.perf_counter()
+        section = intersector.intersect(polyline)
+        intersect_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        plotter_camera(section)
+        timings["plotter"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        section_camera(section.bounds, polyline)
+        timings["analytic"].append(time.perf_counter() - start)
+
+        timings["callback before"].append(intersect_s + timings["plotter"][-1])
+        timings["callback after"].append(intersect_s + timings["analytic"][-1])
+
+    for name, values in timings.items():
+        print(f"{name:>16}: median {np.median(values) * 1000:8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
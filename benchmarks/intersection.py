@@ -0,0 +1,88 @@
+"""Benchmark GridIntersector against pyvista's slice_along_line.
+
+Random polylines crossing the whole grid are intersected with both
+methods. Results are compared on intersected cell ids and section area.
+
+Usage (from the repository root):
+
+    python -m benchmarks.intersection ./data/eclgrid-70729.vtu --polylines 20
+"""
+import argparse
+import time
+
+import numpy as np
+import pyvista
+
+from grid_intersection import GridIntersector
+
+
+def random_polylines(grid, count: int, vertices: int, seed: int = 0):
+    """Polylines with end points outside the grid and random inner vertices"""
+    rng = np.random.default_rng(seed)
+    xmin, xmax, ymin, ymax, _zmin, zmax = grid.bounds
+    center = np.array([xmin + xmax, ymin + ymax]) / 2
+    radius = np.hypot(xmax - xmin, ymax - ymin)
+    for _ in range(count):
+        angle = rng.uniform(0, 2 * np.pi)
+        start = center + radius * np.array([np.cos(angle), np.sin(angle)])
+        end = center - radius * np.array([np.cos(angle), np.sin(angle)])
+        inner = center + rng.uniform(-0.3, 0.3, (vertices - 2, 2)) * radius
+        xy = np.vstack([start, inner, end])
+        yield np.column_stack([xy, np.full(len(xy), zmax)])
+
+
+def _area(section) -> float:
+    if section.n_cells == 0:
+        return 0.0
+    return float(section.compute_cell_sizes()["Area"].sum())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("vtu_file")
+    parser.add_argument("--polylines", type=int, default=10)
+    parser.add_argument("--vertices", type=int, default=3)
+    args = parser.parse_args()
+
+    grid = pyvista.read(args.vtu_file).cast_to_explicit_structured_grid()
+    grid.cell_data["cell_id"] = np.arange(grid.n_cells)
+    print(f"Grid dimensions {tuple(grid.dimensions)}, {grid.n_cells} cells")
+
+    start = time.perf_counter()
+    intersector = GridIntersector(grid)
+    print(f"GridIntersector setup: {time.perf_counter() - start:.3f}s")
+
+    rows = []
+    for polyline in random_polylines(grid, args.polylines, args.vertices):
+        start = time.perf_counter()
+        section = intersector.intersect(polyline)
+        engine_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reference = grid.slice_along_line(pyvista.MultipleLines(polyline))
+        slice_s = time.perf_counter() - start
+
+        cells, reference_cells = set(section["cell_id"]), set(
+            reference["cell_id"] if reference.n_cells else []
+        )
+        union = cells | reference_cells
+        jaccard = len(cells & reference_cells) / len(union) if union else 1.0
+        area, reference_area = _area(section), _area(reference)
+        area_diff = abs(area - reference_area) / reference_area if reference_area else 0
+        rows.append((engine_s, slice_s, jaccard, area_diff))
+
+    print(f"{'engine':>10} {'slice':>10} {'speedup':>8} {'jaccard':>8} {'area diff':>10}")
+    for engine_s, slice_s, jaccard, area_diff in rows:
+        print(
+            f"{engine_s * 1000:8.1f}ms {slice_s * 1000:8.1f}ms "
+            f"{slice_s / engine_s:7.1f}x {jaccard:8.4f} {area_diff:9.2%}"
+        )
+    engine_s, slice_s, jaccard, area_diff = np.median(rows, axis=0)
+    print(
+        f"Median: {slice_s / engine_s:.1f}x faster, "
+        f"cell id jaccard {jaccard:.4f}, area difference {area_diff:.2%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
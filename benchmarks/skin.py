@@ -0,0 +1,86 @@
+"""Benchmark grid_skin against vtkExplicitStructuredGridSurfaceFilter.
+
+The skin of the grid is extracted with both, and with a random set of
+cells hidden, and the results are compared quad by quad: same cell ids,
+and the same corner coordinates in the same order.
+
+Usage (from the repository root):
+
+    python -m benchmarks.skin ./data/eclgrid-70729.vtu --hidden 0.2
+"""
+import argparse
+import time
+
+import numpy as np
+import pyvista
+from vtkmodules.vtkFiltersGeometry import vtkExplicitStructuredGridSurfaceFilter
+
+from column_index import HIDDEN_CELL
+from grid_properties import CELL_IDS_NAME
+from grid_skin import extract_skin
+from grid_store import load_grid
+
+
+def _vtk_skin(grid):
+    skin_filter = vtkExplicitStructuredGridSurfaceFilter()
+    skin_filter.SetInputData(grid)
+    skin_filter.PassThroughCellIdsOn()
+    skin_filter.Update()
+    return pyvista.wrap(skin_filter.GetOutput())
+
+
+def _quads(skin) -> np.ndarray:
+    return np.asarray(skin.points)[skin.faces.reshape(-1, 5)[:, 1:]]
+
+
+def _equal(skin, reference) -> bool:
+    return (
+        skin.n_cells == reference.n_cells
+        and np.array_equal(
+            skin.cell_data[CELL_IDS_NAME], reference.cell_data[CELL_IDS_NAME]
+        )
+        and np.array_equal(_quads(skin), _quads(reference))
+    )
+
+
+def _timed(function, repeat: int):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return result, float(np.median(seconds))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("vtu_file")
+    parser.add_argument("--hidden", type=float, default=0.1, help="Fraction hidden")
+    parser.add_argument("--threads", type=int, help="All cores by default")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    grid = load_grid(args.vtu_file)
+    print(f"Grid dimensions {tuple(grid.dimensions)}, {grid.n_cells} cells")
+
+    rng = np.random.default_rng(0)
+    ghosts = np.asarray(grid.cell_data["vtkGhostType"]).copy()
+    hidden = ghosts.copy()
+    hidden[rng.random(grid.n_cells) < args.hidden] |= HIDDEN_CELL
+
+    print(f"{'case':>10} {'vtk':>10} {'numpy':>10} {'speedup':>8} {'quads':>9} equal")
+    for case, values in (("grid", ghosts), ("hidden", hidden)):
+        grid.cell_data["vtkGhostType"] = values
+        reference, vtk_s = _timed(lambda: _vtk_skin(grid), args.repeat)
+        skin, numpy_s = _timed(
+            lambda: extract_skin(grid, threads=args.threads), args.repeat
+        )
+        print(
+            f"{case:>10} {vtk_s * 1000:8.1f}ms {numpy_s * 1000:8.1f}ms "
+            f"{vtk_s / numpy_s:7.1f}x {skin.n_cells:9d} {_equal(skin, reference)}"
+        )
+    grid.cell_data["vtkGhostType"] = ghosts
+
+
+if __name__ == "__main__":
+    main()
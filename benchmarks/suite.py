@@ -0,0 +1,329 @@
+"""End-to-end benchmark suite over synthetic grids and surfaces.
+
+Times each pipeline stage used by the apps, with the peak resident memory
+above the level at the start of the stage, for grids of 10k to 5M cells
+and surfaces of 100 to 2000 nodes per side:
+
+    grid:    read, read (per .vtu compression), cast, skin, skin_numpy,
+             extract_geometry, slice_along_line, intersect,
+             to_mesh_state (json/binary), json_encode
+    surface: structured_grid, extract_surface, contour, marching_squares,
+             to_mesh_state, json_encode, tiles_build, tiles_mesh
+
+Synthetic inputs are generated once into benchmarks/data. Each run is
+saved to benchmarks/results as JSON with the git commit it was run on, so
+runs on different commits can be compared.
+
+Usage (from the repository root):
+
+    python -m benchmarks.suite run --grids 10k 100k --surfaces 100 500
+    python -m benchmarks.suite compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pyvista
+import vtk
+from plotly.io.json import to_json_plotly
+from vtkmodules.vtkFiltersGeometry import vtkExplicitStructuredGridSurfaceFilter
+
+from benchmarks.intersection import random_polylines
+from benchmarks.synthetic import (
+    GRID_SIZES,
+    SURFACE_SIZES,
+    grid_file,
+    synthetic_surface,
+)
+from grid_intersection import GridIntersector
+from grid_skin import extract_skin
+from mesh_transport import TRANSPORT_MODES, to_mesh_state
+from surface_contours import DEFAULT_LEVEL_COUNT, marching_squares
+from surface_tiles import SurfaceTiles
+from vtu_output import COMPRESSORS, write_vtu
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# Relative slowdown of the median reported as a regression by `compare`
+REGRESSION_THRESHOLD = 0.10
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class MemorySampler:
+    """Peak resident memory of this process while the block runs.
+
+    VTK allocations are invisible to tracemalloc, so the resident set size
+    is sampled from a background thread instead (Linux only, 0 elsewhere).
+    """
+
+    def __init__(self, interval: float = 0.002) -> None:
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "MemorySampler":
+        if not os.path.exists("/proc/self/statm"):
+            return self
+        self.start = self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, _rss_bytes())
+
+    @property
+    def high_water(self) -> int:
+        """Peak bytes above the resident size when the block started"""
+        return self.peak - self.start if self._thread is not None else 0
+
+
+def measure(function: Callable, repeat: int) -> Dict:
+    """Time `function` `repeat` times, returning timings and its last result"""
+    seconds, high_water, result = [], 0, None
+    for _ in range(repeat):
+        result = None
+        with MemorySampler() as memory:
+            start = time.perf_counter()
+            result = function()
+            seconds.append(time.perf_counter() - start)
+        high_water = max(high_water, memory.high_water)
+    return {
+        "seconds": seconds,
+        "median": float(np.median(seconds)),
+        "min": float(np.min(seconds)),
+        "peak_mb": high_water / 1024**2,
+        "result": result,
+    }
+
+
+class Stages:
+    """Runs and prints the stages of one benchmark case"""
+
+    def __init__(self, case: str, repeat: int) -> None:
+        self.case = case
+        self.repeat = repeat
+        self.rows: List[Dict] = []
+
+    def __call__(self, stage: str, function: Callable, **fields) -> object:
+        timing = measure(function, self.repeat)
+        result = timing.pop("result")
+        self.rows.append({"case": self.case, "stage": stage, **fields, **timing})
+        print(
+            f"{self.case:>14} {stage:>22} {timing['median'] * 1000:10.1f}ms "
+            f"{timing['peak_mb']:8.1f}MB"
+        )
+        return result
+
+
+def _extract_skin(grid):
+    skin_filter = vtkExplicitStructuredGridSurfaceFilter()
+    skin_filter.SetInputData(grid)
+    skin_filter.Update()
+    return pyvista.wrap(skin_filter.GetOutput())
+
+
+def _cast(unstructured):
+    grid = unstructured.cast_to_explicit_structured_grid()
+    grid.ComputeFacesConnectivityFlagsArray()
+    return grid
+
+
+def _slice_all(grid, polylines):
+    return [grid.slice_along_line(pyvista.MultipleLines(p)) for p in polylines]
+
+
+def bench_grid(size: str, repeat: int, polylines: int) -> List[Dict]:
+    path = grid_file(size)
+    stage = Stages(f"grid-{size}", repeat)
+
+    unstructured = stage("read", lambda: pyvista.read(path))
+    grid = stage("cast", lambda: _cast(unstructured), cells=unstructured.n_cells)
+
+    # The same grid written with raw appended arrays per compression
+    with tempfile.TemporaryDirectory() as directory:
+        for compression in COMPRESSORS:
+            compressed = Path(directory) / f"{compression}.vtu"
+            nbytes = write_vtu(grid, compressed, compression)
+            stage(f"read[{compression}]", lambda: pyvista.read(compressed))
+            stage.rows[-1]["nbytes"] = nbytes
+    skin = stage("skin", lambda: _extract_skin(grid))
+    stage("skin_numpy", lambda: extract_skin(grid))
+    stage("extract_geometry", unstructured.extract_geometry)
+
+    lines = list(random_polylines(grid, polylines, vertices=3))
+    stage("slice_along_line", lambda: _slice_all(grid, lines), polylines=polylines)
+    intersector = GridIntersector(grid)
+    stage(
+        "intersect",
+        lambda: [intersector.intersect(line) for line in lines],
+        polylines=polylines,
+    )
+
+    for transport in TRANSPORT_MODES:
+        state = stage(
+            f"to_mesh_state[{transport}]",
+            lambda: to_mesh_state(skin, "scalar", transport=transport),
+            triangles=skin.n_cells,
+        )
+        encoded = stage(f"json_encode[{transport}]", lambda: to_json_plotly(state))
+        stage.rows[-1]["nbytes"] = len(encoded)
+    return stage.rows
+
+
+def bench_surface(size: str, repeat: int) -> List[Dict]:
+    stage = Stages(f"surface-{size}", repeat)
+    n = SURFACE_SIZES[size]
+    sgrid = stage("structured_grid", lambda: synthetic_surface(n), points=n * n)
+    surface = stage("extract_surface", sgrid.extract_surface)
+    contours = stage(
+        "contour",
+        lambda: surface.contour(DEFAULT_LEVEL_COUNT, scalars="Elevation"),
+    )
+    xi, yi, zi = (values[:, :, 0] for values in (sgrid.x, sgrid.y, sgrid.z))
+    # Same levels as the VTK contour filter, on the node arrays
+    levels = np.unique(contours["Elevation"])
+    stage("marching_squares", lambda: marching_squares(xi, yi, zi, levels))
+    for transport in TRANSPORT_MODES:
+        state = stage(
+            f"to_mesh_state[{transport}]",
+            lambda: to_mesh_state(surface, "Elevation", transport=transport),
+        )
+        encoded = stage(f"json_encode[{transport}]", lambda: to_json_plotly(state))
+        stage.rows[-1]["nbytes"] = len(encoded)
+
+    # Tile pyramid, and the mesh served for the fully zoomed out view
+    with tempfile.TemporaryDirectory() as directory:
+        tiles = stage("tiles_build", lambda: SurfaceTiles.build(xi, yi, zi, directory))
+        level = tiles.level_for_extent()
+        mesh = stage(
+            "tiles_mesh", lambda: tiles.mesh(level, tiles.visible_tiles(level))
+        )
+        stage.rows[-1]["cells"] = mesh.n_cells
+    return stage.rows
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def environment() -> Dict:
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pyvista": pyvista.__version__,
+        "vtk": vtk.vtkVersion.GetVTKVersion(),
+    }
+
+
+def run(grids, surfaces, repeat: int, polylines: int, output: Optional[Path]) -> Path:
+    results = []
+    for size in grids:
+        results.extend(bench_grid(size, repeat, polylines))
+    for size in surfaces:
+        results.extend(bench_surface(size, repeat))
+
+    report = {"environment": environment(), "results": results}
+    if output is None:
+        env = report["environment"]
+        stamp = env["timestamp"].replace(":", "").replace("+0000", "")
+        output = RESULTS_DIR / f"{stamp}-{env['commit'] or 'unknown'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+    return output
+
+
+def compare(base_file: Path, head_file: Path, threshold: float) -> int:
+    """Print median ratios head/base per case and stage, count regressions"""
+    base, head = (json.loads(Path(f).read_text()) for f in (base_file, head_file))
+    base_rows = {(r["case"], r["stage"]): r for r in base["results"]}
+    print(f"base {base['environment']['commit']}, head {head['environment']['commit']}")
+    regressions = 0
+    for row in head["results"]:
+        previous = base_rows.get((row["case"], row["stage"]))
+        if previous is None:
+            continue
+        ratio = row["median"] / previous["median"] if previous["median"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  improved"
+        print(
+            f"{row['case']:>14} {row['stage']:>22} "
+            f"{previous['median'] * 1000:10.1f}ms -> {row['median'] * 1000:10.1f}ms "
+            f"{ratio:6.2f}x{flag}"
+        )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument(
+        "--grids", nargs="*", default=list(GRID_SIZES), choices=list(GRID_SIZES)
+    )
+    run_parser.add_argument(
+        "--surfaces",
+        nargs="*",
+        default=list(SURFACE_SIZES),
+        choices=list(SURFACE_SIZES),
+    )
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--polylines", type=int, default=5)
+    run_parser.add_argument("-o", "--output", type=Path)
+
+    compare_parser = commands.add_parser("compare", help="Compare two runs")
+    compare_parser.add_argument("base", type=Path)
+    compare_parser.add_argument("head", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args.grids, args.surfaces, args.repeat, args.polylines, args.output)
+    else:
+        regressions = compare(args.base, args.head, args.threshold)
+        raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Synthetic corner-point grids and surfaces for benchmarking.
+
+Grids have gently dipping, undulating layers cut by a vertical fault with
+a throw, so neighbouring cells across the fault do not share corners, and
+a fraction of inactive cells. Surfaces are undulating elevation maps on a
+regular lattice. Both are deterministic for a given size and seed.
+"""
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pyvista
+
+# Benchmark grid sizes, cells -> (ni, nj, nk)
+GRID_SIZES = {
+    "10k": (25, 20, 20),
+    "100k": (50, 50, 40),
+    "1M": (100, 100, 100),
+    "5M": (200, 125, 200),
+}
+
+# Benchmark surface sizes, nodes per side
+SURFACE_SIZES = {
+    "100": 100,
+    "500": 500,
+    "1000": 1000,
+    "2000": 2000,
+}
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def _undulation(x: np.ndarray, y: np.ndarray, length: float) -> np.ndarray:
+    return 20 * np.sin(2 * np.pi * x / length) * np.cos(2 * np.pi * y / length)
+
+
+def synthetic_corners(
+    ni: int,
+    nj: int,
+    nk: int,
+    cell_size: Tuple[float, float, float] = (50.0, 50.0, 2.0),
+    throw: float = 15.0,
+) -> np.ndarray:
+    """(2ni, 2nj, 2nk, 3) corner array in the layout of ExplicitStructuredGrid"""
+    dx, dy, dz = cell_size
+    # Corner index 2i and 2i + 1 belong to cell i, at nodes i and i + 1
+    nodes_i = (np.arange(2 * ni) + 1) // 2
+    nodes_j = (np.arange(2 * nj) + 1) // 2
+    nodes_k = (np.arange(2 * nk) + 1) // 2
+    x = (nodes_i * dx)[:, None]
+    y = (nodes_j * dy)[None, :]
+    top = 2000 + 0.01 * x + _undulation(x, y, 20 * dx)
+    # Cells in the eastern half are thrown down along a fault at ni / 2
+    cell_i = np.arange(2 * ni) // 2
+    top = top + np.where(cell_i >= ni // 2, throw, 0.0)[:, None]
+
+    corners = np.empty((2 * ni, 2 * nj, 2 * nk, 3), order="F")
+    corners[..., 0] = x[:, :, None]
+    corners[..., 1] = y[:, :, None]
+    corners[..., 2] = -(top[:, :, None] + nodes_k[None, None, :] * dz)
+    return corners
+
+
+def synthetic_grid(
+    ni: int, nj: int, nk: int, inactive_fraction: float = 0.05, seed: int = 0
+) -> pyvista.ExplicitStructuredGrid:
+    """Faulted corner-point grid with a smooth "scalar" cell property"""
+    rng = np.random.default_rng(seed)
+    corners = synthetic_corners(ni, nj, nk)
+    grid = pyvista.ExplicitStructuredGrid(
+        (ni + 1, nj + 1, nk + 1), corners.reshape(-1, 3, order="F")
+    )
+    grid.compute_connectivity(inplace=True)
+
+    i, j, k = np.unravel_index(np.arange(grid.n_cells), (ni, nj, nk), order="F")
+    grid.cell_data["scalar"] = (
+        0.2 + 0.1 * np.sin(i / 7) * np.cos(j / 5) + 0.05 * (k / nk)
+    ) + rng.normal(0, 0.01, grid.n_cells)
+
+    inactive = rng.choice(
+        grid.n_cells, int(inactive_fraction * grid.n_cells), replace=False
+    )
+    grid.hide_cells(np.sort(inactive), inplace=True)
+    return grid
+
+
+def synthetic_surface(n: int, spacing: float = 25.0) -> pyvista.StructuredGrid:
+    """`n` x `n` undulating surface with an "Elevation" point array"""
+    xi, yi = np.meshgrid(np.arange(n) * spacing, np.arange(n) * spacing, indexing="ij")
+    zi = -(2000 + _undulation(xi, yi, n * spacing / 4) + 0.02 * xi)
+    surface = pyvista.StructuredGrid(xi, yi, zi)
+    surface["Elevation"] = zi.flatten(order="F")
+    return surface
+
+
+def grid_file(size: str, directory: Path = DATA_DIR) -> Path:
+    """Path to the synthetic grid `size` as .vtu, generating it if missing"""
+    path = Path(directory) / f"synthetic-{size}.vtu"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        grid = synthetic_grid(*GRID_SIZES[size])
+        # Saved as an unstructured grid, as produced by roff2vtk
+        grid.save(path)
+    return path
@@ -0,0 +1,76 @@
+"""Benchmark well curtains against trajectory sampling density.
+
+A curved synthetic well path is sampled with an increasing number of
+points, and intersected with `slice_along_line`, with `GridIntersector`
+on the raw trajectory and with the simplified `WellCurtain` polyline.
+
+Usage (from the repository root):
+
+    python -m benchmarks.well_curtain ./data/eclgrid-70729.vtu --points 100 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+import pyvista
+
+from grid_intersection import GridIntersector
+from well_curtain import DEFAULT_TOLERANCE, WellCurtain, lateral_cell_size
+
+
+def synthetic_trajectory(grid, count: int) -> np.ndarray:
+    """S-shaped deviated well across the grid, sampled with `count` points"""
+    xmin, xmax, ymin, ymax, zmin, zmax = grid.bounds
+    t = np.linspace(0, 1, count)
+    x = xmin + (xmax - xmin) * (0.1 + 0.8 * t)
+    y = (ymin + ymax) / 2 + 0.3 * (ymax - ymin) * np.sin(2 * np.pi * t)
+    z = zmax - (zmax - zmin) * t
+    return np.column_stack([x, y, z])
+
+
+def _timed(function, repeat: int = 3):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("vtu_file")
+    parser.add_argument("--points", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--no-vtk", action="store_true", help="Skip slice_along_line")
+    args = parser.parse_args()
+
+    grid = pyvista.read(args.vtu_file).cast_to_explicit_structured_grid()
+    intersector = GridIntersector(grid)
+    tolerance = DEFAULT_TOLERANCE * lateral_cell_size(intersector)
+
+    print(
+        f"{'points':>8} {'vertices':>8} {'vtk':>10} {'raw':>10} {'curtain':>10} "
+        f"{'area diff':>10}"
+    )
+    for count in args.points:
+        trajectory = synthetic_trajectory(grid, count)
+        vtk_s = float("nan")
+        if not args.no_vtk:
+            _, vtk_s = _timed(
+                lambda: grid.slice_along_line(pyvista.MultipleLines(trajectory)), 1
+            )
+        raw, raw_s = _timed(lambda: intersector.intersect(trajectory))
+        curtain, curtain_s = _timed(
+            lambda: WellCurtain(trajectory, tolerance).intersect(intersector)
+        )
+        raw_area = raw.compute_cell_sizes()["Area"].sum()
+        area = curtain.compute_cell_sizes()["Area"].sum()
+        print(
+            f"{count:8d} {len(WellCurtain(trajectory, tolerance).polyline):8d} "
+            f"{vtk_s * 1000:8.1f}ms {raw_s * 1000:8.1f}ms {curtain_s * 1000:8.1f}ms "
+            f"{abs(area - raw_area) / raw_area:9.3%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
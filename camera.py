@@ -0,0 +1,46 @@
+"""Analytic camera placement for intersection views.
+
+Computes the camera from the section bounds and polyline direction
+directly, instead of adding the section to a `pyvista.Plotter` and reading
+back its camera, which needs a render window per call.
+
+`dash_vtk.View` only takes a camera position and view up. On a change it
+places the focal point at the origin and resets the camera, fitting the
+view to the shown data as `vtkRenderer.ResetCamera` (and so the Plotter)
+does. The position is therefore sent as the direction towards the camera,
+and the framing is left to the view.
+"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+
+def section_camera(
+    bounds: Sequence[float],
+    polyline: np.ndarray,
+    view_up: Sequence[float] = (0, 0, -1),
+) -> Optional[Dict[str, list]]:
+    """Camera looking perpendicular onto a vertical section.
+
+    The camera is placed on the side of the section where the polyline
+    runs left to right on screen (for the given `view_up`). `position` is
+    a unit vector from the focal point, as `dash_vtk.View` expects.
+    Returns None for an empty section (inverted `bounds`), where there is
+    nothing to frame.
+    """
+    xmin, xmax, ymin, ymax, zmin, zmax = bounds
+    if xmin > xmax or ymin > ymax or zmin > zmax:
+        return None
+
+    polyline = np.atleast_2d(np.asarray(polyline, dtype=float))
+    tangent = polyline[-1, :2] - polyline[0, :2]
+    length = np.hypot(*tangent)
+    tangent = tangent / length if length > 0 else np.array([1.0, 0.0])
+
+    # Direction of projection d satisfies d x view_up = tangent (screen right)
+    up = np.asarray(view_up, dtype=float)
+    right = np.array([tangent[0], tangent[1], 0.0])
+    direction = np.cross(up, right)
+    direction /= np.linalg.norm(direction)
+
+    return {"position": (-direction).tolist(), "view_up": up.tolist()}
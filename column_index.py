@@ -0,0 +1,354 @@
+"""2D spatial index over the (i, j) columns of an ExplicitStructuredGrid.
+
+The XY bounding boxes of all pillars/columns are binned into a uniform
+grid of buckets, stored in CSR form. Point and segment queries only visit
+the buckets they touch, so intersection, well path sampling and cell
+picking never need a pass over the full grid.
+
+The index is built once and saved next to the .vtu file, see
+`ColumnIndex.load_or_build`.
+"""
+import logging
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from vtk.util.numpy_support import vtk_to_numpy
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# Bit set in vtkGhostType for cells hidden with `hide_cells`
+HIDDEN_CELL = 32
+
+# Bump when the on-disk layout changes
+INDEX_VERSION = 1
+
+
+def cell_visibility(grid) -> np.ndarray:
+    """Boolean mask of cells that are not blanked"""
+    ghosts = grid.GetCellData().GetArray("vtkGhostType")
+    if ghosts is None:
+        return np.ones(grid.GetNumberOfCells(), dtype=bool)
+    return (vtk_to_numpy(ghosts) & HIDDEN_CELL) == 0
+
+
+def hex_connectivity(grid) -> np.ndarray:
+    """Point ids of each cell as a (ncells, 8) array"""
+    return vtk_to_numpy(grid.GetCells().GetConnectivityArray()).reshape(-1, 8)
+
+
+def column_bounds(
+    points: np.ndarray, connectivity: np.ndarray, dims: Tuple[int, int, int]
+) -> np.ndarray:
+    """XY bounding box (xmin, xmax, ymin, ymax) of each (i, j) column.
+
+    Returned with shape (nj, ni, 4), reduced layer by layer to avoid
+    materializing the corners of the whole grid.
+    """
+    ni, nj, nk = (d - 1 for d in dims)
+    layers = connectivity.reshape(nk, nj, ni, 8)
+    bounds = np.empty((nj, ni, 4))
+    bounds[..., [0, 2]] = np.inf
+    bounds[..., [1, 3]] = -np.inf
+    for k in range(nk):
+        xy = points[layers[k], :2]
+        np.minimum(bounds[..., 0], xy[..., 0].min(axis=-1), out=bounds[..., 0])
+        np.maximum(bounds[..., 1], xy[..., 0].max(axis=-1), out=bounds[..., 1])
+        np.minimum(bounds[..., 2], xy[..., 1].min(axis=-1), out=bounds[..., 2])
+        np.maximum(bounds[..., 3], xy[..., 1].max(axis=-1), out=bounds[..., 3])
+    return bounds
+
+
+def concatenated_ranges(starts: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, start + size) for each range"""
+    return np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+
+
+def segment_hits_boxes(p0: np.ndarray, p1: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """Mask of (xmin, xmax, ymin, ymax) boxes touched by the XY segment p0-p1.
+
+    `p0` and `p1` are a single segment, or (n, 2) arrays with the segment
+    of each box.
+    """
+    p0, p1 = np.asarray(p0, dtype=float), np.asarray(p1, dtype=float)
+    x0, y0, x1, y1 = p0[..., 0], p0[..., 1], p1[..., 0], p1[..., 1]
+    overlap = (
+        (boxes[:, 0] <= np.maximum(x0, x1))
+        & (boxes[:, 1] >= np.minimum(x0, x1))
+        & (boxes[:, 2] <= np.maximum(y0, y1))
+        & (boxes[:, 3] >= np.minimum(y0, y1))
+    )
+    # The box corners must not all lie on the same side of the line
+    dx, dy = x1 - x0, y1 - y0
+    sides = np.stack(
+        [
+            dx * (boxes[:, 2 + cy] - y0) - dy * (boxes[:, cx] - x0)
+            for cx in (0, 1)
+            for cy in (0, 1)
+        ],
+        axis=1,
+    )
+    return overlap & (sides.min(axis=1) <= 0) & (sides.max(axis=1) >= 0)
+
+
+class ColumnIndex:
+    """Uniform bucket index over column XY bounding boxes"""
+
+    def __init__(
+        self,
+        dims: Tuple[int, int, int],
+        column_boxes: np.ndarray,
+        origin: np.ndarray,
+        bin_size: float,
+        bin_shape: Tuple[int, int],
+        bin_offsets: np.ndarray,
+        bin_columns: np.ndarray,
+    ) -> None:
+        self.dims = tuple(int(d) for d in dims)
+        self.column_boxes = column_boxes
+        self.origin = origin
+        self.bin_size = float(bin_size)
+        self.bin_shape = tuple(int(n) for n in bin_shape)
+        self.bin_offsets = bin_offsets
+        self.bin_columns = bin_columns
+
+    @property
+    def xy_bounds(self) -> np.ndarray:
+        """(xmin, xmax, ymin, ymax) of all columns"""
+        finite = np.isfinite(self.column_boxes).all(axis=1)
+        xmin, _, ymin, _ = self.column_boxes[finite].min(axis=0)
+        _, xmax, _, ymax = self.column_boxes[finite].max(axis=0)
+        return np.array([xmin, xmax, ymin, ymax])
+
+    @classmethod
+    def from_boxes(
+        cls, dims: Tuple[int, int, int], column_boxes: np.ndarray
+    ) -> "ColumnIndex":
+        finite = np.flatnonzero(np.isfinite(column_boxes).all(axis=1))
+        boxes = column_boxes[finite]
+        origin = boxes[:, [0, 2]].min(axis=0)
+        # Buckets about the size of a typical column
+        bin_size = float(
+            np.median(np.maximum(boxes[:, 1] - boxes[:, 0], boxes[:, 3] - boxes[:, 2]))
+        )
+        bin_size = bin_size if bin_size > 0 else 1.0
+        extent = boxes[:, [1, 3]].max(axis=0) - origin
+        bin_shape = tuple(np.floor(extent / bin_size).astype(int) + 1)
+
+        # Bucket ranges covered by each column box
+        low = np.floor((boxes[:, [0, 2]] - origin) / bin_size).astype(int)
+        high = np.floor((boxes[:, [1, 3]] - origin) / bin_size).astype(int)
+        span = high - low + 1
+        count = span[:, 0] * span[:, 1]
+        owner = np.repeat(np.arange(len(boxes)), count)
+        local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        bx = low[owner, 0] + local % span[owner, 0]
+        by = low[owner, 1] + local // span[owner, 0]
+        bins = bx + bin_shape[0] * by
+
+        order = np.argsort(bins, kind="stable")
+        bin_offsets = np.zeros(bin_shape[0] * bin_shape[1] + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(bins, minlength=bin_shape[0] * bin_shape[1]),
+            out=bin_offsets[1:],
+        )
+        return cls(
+            dims,
+            column_boxes,
+            origin,
+            bin_size,
+            bin_shape,
+            bin_offsets,
+            finite[owner[order]],
+        )
+
+    @classmethod
+    def from_grid(cls, grid) -> "ColumnIndex":
+        dims = tuple(grid.dimensions)
+        points = vtk_to_numpy(grid.GetPoints().GetData())
+        ni, nj, _nk = (d - 1 for d in dims)
+        boxes = column_bounds(points, hex_connectivity(grid), dims)
+        return cls.from_boxes(dims, boxes.reshape(ni * nj, 4))
+
+    @staticmethod
+    def index_file(vtu_file: str) -> Path:
+        return Path(vtu_file).with_suffix(".columns.npz")
+
+    def save(self, path: Path, source: Optional[Path] = None) -> None:
+        stat = source.stat() if source is not None else None
+        np.savez(
+            path,
+            version=INDEX_VERSION,
+            source_mtime=stat.st_mtime_ns if stat else -1,
+            source_size=stat.st_size if stat else -1,
+            dims=self.dims,
+            column_boxes=self.column_boxes,
+            origin=self.origin,
+            bin_size=self.bin_size,
+            bin_shape=self.bin_shape,
+            bin_offsets=self.bin_offsets,
+            bin_columns=self.bin_columns,
+        )
+
+    @classmethod
+    def load(cls, path: Path, source: Optional[Path] = None) -> Optional["ColumnIndex"]:
+        """Load a saved index, None if missing or stale compared to `source`"""
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                return None
+            if source is not None:
+                stat = source.stat()
+                if (int(data["source_mtime"]), int(data["source_size"])) != (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                ):
+                    return None
+            return cls(
+                data["dims"],
+                data["column_boxes"],
+                data["origin"],
+                data["bin_size"],
+                data["bin_shape"],
+                data["bin_offsets"],
+                data["bin_columns"],
+            )
+
+    @classmethod
+    def load_or_build(cls, vtu_file: str, grid) -> "ColumnIndex":
+        """Load the index saved next to `vtu_file`, building it if needed.
+
+        The index only holds XY footprints, so it stays valid for grids
+        that are scaled or flipped in z after reading.
+        """
+        source = Path(vtu_file)
+        path = cls.index_file(vtu_file)
+        index = cls.load(path, source)
+        if index is not None and index.dims == tuple(grid.dimensions):
+            return index
+        index = cls.from_grid(grid)
+        try:
+            index.save(path, source)
+        except OSError as exc:
+            LOGGER.warning("Could not save column index to %s: %s", path, exc)
+        return index
+
+    def _bin_columns(self, bins: np.ndarray) -> np.ndarray:
+        bins = np.unique(bins)
+        starts, ends = self.bin_offsets[bins], self.bin_offsets[bins + 1]
+        return np.unique(self.bin_columns[concatenated_ranges(starts, ends - starts)])
+
+    def _bin_index(self, xy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Bucket of each point, and whether the point is inside the buckets"""
+        cell = np.floor((np.atleast_2d(xy) - self.origin) / self.bin_size).astype(int)
+        inside = (
+            (cell[:, 0] >= 0)
+            & (cell[:, 0] < self.bin_shape[0])
+            & (cell[:, 1] >= 0)
+            & (cell[:, 1] < self.bin_shape[1])
+        )
+        return cell[:, 0] + self.bin_shape[0] * cell[:, 1], inside
+
+    def _bins_at(self, xy: np.ndarray) -> np.ndarray:
+        bins, inside = self._bin_index(xy)
+        return bins[inside]
+
+    def query_point(self, x: float, y: float) -> np.ndarray:
+        """Flat column indices (i + ni * j) whose footprint contains (x, y)"""
+        columns = self._bin_columns(self._bins_at(np.array([x, y])))
+        boxes = self.column_boxes[columns]
+        inside = (
+            (boxes[:, 0] <= x)
+            & (boxes[:, 1] >= x)
+            & (boxes[:, 2] <= y)
+            & (boxes[:, 3] >= y)
+        )
+        return columns[inside]
+
+    def segment_bins(
+        self, p0: np.ndarray, p1: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(segment, bucket) pairs of the buckets visited by each segment.
+
+        The parameters where the segments cross bucket boundaries are
+        found for all segments at once. The midpoints between consecutive
+        crossings of a segment give all buckets it visits.
+        """
+        p0 = np.asarray(p0, dtype=float)[:, :2]
+        p1 = np.asarray(p1, dtype=float)[:, :2]
+        direction = p1 - p0
+        nsegments = len(p0)
+        owners = [np.arange(nsegments), np.arange(nsegments)]
+        crossings = [np.zeros(nsegments), np.ones(nsegments)]
+        for axis in (0, 1):
+            moving = np.flatnonzero(direction[:, axis] != 0)
+            # Boundaries strictly between the ends of each segment
+            low = np.minimum(p0[moving, axis], p1[moving, axis])
+            high = np.maximum(p0[moving, axis], p1[moving, axis])
+            first = np.floor((low - self.origin[axis]) / self.bin_size) + 1
+            last = np.floor((high - self.origin[axis]) / self.bin_size)
+            first = np.clip(first, 0, self.bin_shape[axis]).astype(np.int64)
+            last = np.clip(last, -1, self.bin_shape[axis]).astype(np.int64)
+            count = np.maximum(last - first + 1, 0)
+            owner = np.repeat(moving, count)
+            edges = self.origin[axis] + self.bin_size * concatenated_ranges(
+                first, count
+            )
+            t = (edges - p0[owner, axis]) / direction[owner, axis]
+            inside = (t > 0) & (t < 1)
+            owners.append(owner[inside])
+            crossings.append(t[inside])
+        owner, t = np.concatenate(owners), np.concatenate(crossings)
+        order = np.lexsort((t, owner))
+        owner, t = owner[order], t[order]
+        distinct = np.r_[True, (owner[1:] != owner[:-1]) | (t[1:] != t[:-1])]
+        owner, t = owner[distinct], t[distinct]
+
+        following = np.flatnonzero(owner[1:] == owner[:-1])
+        owner = owner[following]
+        middle = (t[following] + t[following + 1]) / 2
+        bins, inside = self._bin_index(p0[owner] + middle[:, None] * direction[owner])
+        return owner[inside], bins[inside]
+
+    def query_segment(self, p0: np.ndarray, p1: np.ndarray) -> np.ndarray:
+        """Flat column indices (i + ni * j) whose footprint the segment touches"""
+        _, columns = self.query_segments(np.atleast_2d(p0), np.atleast_2d(p1))
+        return columns
+
+    def query_segments(
+        self, p0: np.ndarray, p1: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(segment, column) pairs of the columns touched by each segment.
+
+        Segments are grouped by the buckets they visit, so the columns of
+        a bucket shared by several segments (e.g. where sections cross or
+        a well path runs through it) are gathered once, and all candidate
+        columns are tested against their segment in one pass. Pairs are
+        sorted by segment, then column.
+        """
+        p0 = np.asarray(p0, dtype=float)[:, :2]
+        p1 = np.asarray(p1, dtype=float)[:, :2]
+        segments, bins = self.segment_bins(p0, p1)
+        if not len(bins):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        unique_bins, bin_of_pair = np.unique(bins, return_inverse=True)
+
+        # Columns of each visited bucket, then of each (segment, bucket) pair
+        starts = self.bin_offsets[unique_bins][bin_of_pair]
+        sizes = self.bin_offsets[unique_bins + 1][bin_of_pair] - starts
+        positions = concatenated_ranges(starts, sizes)
+        ncolumns = len(self.column_boxes)
+        pairs = np.unique(
+            np.repeat(segments, sizes) * ncolumns + self.bin_columns[positions]
+        )
+        segments, columns = np.divmod(pairs, ncolumns)
+        hits = segment_hits_boxes(
+            p0[segments], p1[segments], self.column_boxes[columns]
+        )
+        return segments[hits], columns[hits]
+
+    def column_ij(self, columns: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ni = self.dims[0] - 1
+        return columns % ni, columns // ni
@@ -0,0 +1,198 @@
+"""Fence diagrams: many sections of a grid at once, without the Dash app.
+
+A fence is a set of sections, along several wells or a lattice of section
+lines across the field. The polylines are split into chunks, and each
+chunk is intersected with `GridIntersector.intersect_many` in one batched
+pass. Chunks run in a process pool for batches of `POOL_MIN_SECTIONS` or
+more; every worker maps the same .npy grid cache (see grid_store), so the
+grid is not copied per worker.
+
+Usage (from the repository root):
+
+    python fence.py ./data/eclgrid-70729.vtu --lines 10 10 -o fence --format vtp
+    python fence.py ./data/eclgrid-70729.vtu --wells wells/*.w --workers 4
+    python fence.py ./data/eclgrid-70729.vtu --polylines polylines.json --format npz
+
+Polylines files are JSON, a list of [[x, y(, z)], ...] polylines or an
+object of them by name.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pyvista
+
+from column_index import ColumnIndex
+from grid_intersection import GridIntersector
+from grid_store import load_grid
+from perf import span
+from well_curtain import WellCurtain
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+FORMATS = ("vtp", "npz")
+
+# Smaller batches are computed in this process. Measured on the 100k and 1M
+# cell synthetic grids: the pool costs 40-100ms to start and returning a
+# section 3-9ms, a third of computing it, so with 4 workers it breaks even
+# at 12-31 sections.
+POOL_MIN_SECTIONS = 32
+
+# Intersector of the grid in each pool worker, set by `_init_worker`
+_INTERSECTOR: Optional[GridIntersector] = None
+
+
+def load_intersector(vtu_file: str) -> GridIntersector:
+    grid = load_grid(vtu_file)
+    return GridIntersector(grid, ColumnIndex.load_or_build(vtu_file, grid))
+
+
+def _init_worker(vtu_file: str) -> None:
+    global _INTERSECTOR
+    _INTERSECTOR = load_intersector(vtu_file)
+
+
+def _intersect_chunk(args) -> List[pyvista.PolyData]:
+    polylines, scalar, unroll = args
+    return _INTERSECTOR.intersect_many(polylines, scalar, unroll)
+
+
+def section_lines(xy_bounds: Sequence[float], nx: int, ny: int) -> List[np.ndarray]:
+    """`nx` north-south and `ny` east-west lines evenly spaced across the bounds"""
+    xmin, xmax, ymin, ymax = xy_bounds
+    lines = [
+        np.array([[x, ymin], [x, ymax]]) for x in np.linspace(xmin, xmax, nx + 2)[1:-1]
+    ]
+    lines += [
+        np.array([[xmin, y], [xmax, y]]) for y in np.linspace(ymin, ymax, ny + 2)[1:-1]
+    ]
+    return lines
+
+
+def fence(
+    vtu_file: str,
+    polylines: Sequence[np.ndarray],
+    workers: Optional[int] = None,
+    scalar: Optional[str] = "scalar",
+    unroll: bool = False,
+    chunk_size: Optional[int] = None,
+) -> List[pyvista.PolyData]:
+    """Sections along all `polylines`, in order.
+
+    With `workers` 1, or fewer than `POOL_MIN_SECTIONS` polylines, the
+    sections are computed in this process, otherwise in a pool of `workers`
+    processes (all cores by default), in chunks of `chunk_size` polylines.
+    """
+    polylines = [np.asarray(polyline, dtype=float) for polyline in polylines]
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(polylines) < POOL_MIN_SECTIONS:
+        return load_intersector(vtu_file).intersect_many(polylines, scalar, unroll)
+
+    chunk_size = chunk_size or max(1, -(-len(polylines) // workers))
+    chunks = [
+        (polylines[start : start + chunk_size], scalar, unroll)
+        for start in range(0, len(polylines), chunk_size)
+    ]
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        initializer=_init_worker,
+        initargs=(vtu_file,),
+    ) as executor:
+        return [
+            section
+            for sections in executor.map(_intersect_chunk, chunks)
+            for section in sections
+        ]
+
+
+def write_section(section: pyvista.PolyData, path: Path) -> Path:
+    """Save a section as .vtp, or as .npz with points, faces and cell arrays"""
+    if path.suffix == ".npz":
+        np.savez(
+            path,
+            points=np.asarray(section.points),
+            faces=np.asarray(section.faces),
+            **{name: np.asarray(section.cell_data[name]) for name in section.cell_data},
+        )
+    else:
+        section.save(path)
+    return path
+
+
+def read_polylines(path: Path) -> Dict[str, np.ndarray]:
+    """Polylines by name from a JSON list or object of polylines"""
+    polylines = json.loads(Path(path).read_text())
+    if isinstance(polylines, list):
+        polylines = {f"section-{index:03d}": p for index, p in enumerate(polylines)}
+    return {name: np.asarray(p, dtype=float) for name, p in polylines.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("vtu_file")
+    parser.add_argument("--polylines", type=Path, help="JSON file with polylines")
+    parser.add_argument(
+        "--wells", type=Path, nargs="+", default=[], help="Well trajectory files"
+    )
+    parser.add_argument(
+        "--lines",
+        type=int,
+        nargs=2,
+        metavar=("NX", "NY"),
+        help="Lattice of north-south and east-west section lines",
+    )
+    parser.add_argument("-o", "--output-dir", type=Path, default=Path("fence"))
+    parser.add_argument("--format", choices=FORMATS, default="vtp")
+    parser.add_argument("--workers", type=int, help="Processes, all cores by default")
+    parser.add_argument("--scalar", default="scalar", help="Cell array to include")
+    parser.add_argument(
+        "--unroll", action="store_true", help="Sections in 2D, along the polyline"
+    )
+    args = parser.parse_args()
+
+    with span("prepare", args.vtu_file):
+        intersector = load_intersector(args.vtu_file)
+        polylines = {}
+        if args.polylines is not None:
+            polylines.update(read_polylines(args.polylines))
+        for well_file in args.wells:
+            curtain = WellCurtain.from_file(well_file, intersector)
+            polylines[f"well-{well_file.stem}"] = curtain.polyline
+        if args.lines is not None:
+            lines = section_lines(intersector.xy_bounds, *args.lines)
+            polylines.update(
+                {f"line-{index:03d}": line for index, line in enumerate(lines)}
+            )
+    if not polylines:
+        parser.error("No polylines, give --polylines, --wells or --lines")
+    scalar = args.scalar if args.scalar in intersector.grid.cell_data else None
+
+    start = time.perf_counter()
+    with span("fence", f"sections={len(polylines)}"):
+        sections = fence(
+            args.vtu_file, list(polylines.values()), args.workers, scalar, args.unroll
+        )
+    seconds = time.perf_counter() - start
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    with span("write", str(args.output_dir)):
+        for name, section in zip(polylines, sections):
+            write_section(section, args.output_dir / f"{name}.{args.format}")
+    cells = sum(section.n_cells for section in sections)
+    print(
+        f"{len(sections)} sections, {cells} cells in {seconds:.2f}s, "
+        f"written to {args.output_dir}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from perf import estimate_nbytes
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# Default upper bound for the total size of cached geometries
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def _array_digest(array: Optional[np.ndarray]) -> Optional[str]:
+    if array is None:
+        return None
+    array = np.ascontiguousarray(array)
+    return hashlib.blake2b(array.view(np.uint8), digest_size=16).hexdigest()
+
+
+class GeometryCache:
+    """LRU cache of extracted geometries (polydata + serialized mesh state).
+
+    Entries are keyed by source file, its modification time, an optional
+    cell visibility mask and the transform applied to the geometry.
+    Least recently used entries are evicted when `max_bytes` is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, Tuple[Any, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(
+        source_file: str,
+        kind: str = "skin",
+        visibility: Optional[np.ndarray] = None,
+        flip_z: bool = False,
+        scale: Sequence[float] = (1, 1, 1),
+        **extra: Any,
+    ) -> tuple:
+        path = Path(source_file).resolve()
+        return (
+            kind,
+            str(path),
+            path.stat().st_mtime_ns,
+            _array_digest(visibility),
+            bool(flip_z),
+            tuple(float(s) for s in scale),
+            tuple(sorted(extra.items())),
+        )
+
+    def get(self, key: tuple) -> Optional[Tuple[Any, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: tuple, polydata: Any, mesh_state: Any) -> None:
+        size = estimate_nbytes(polydata) + estimate_nbytes(mesh_state)
+        if size > self.max_bytes:
+            LOGGER.debug("Not caching geometry of %d bytes, above memory cap", size)
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[2]
+            self._entries[key] = (polydata, mesh_state, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+
+    def get_or_compute(
+        self, key: tuple, compute: Callable[[], Tuple[Any, Any]]
+    ) -> Tuple[Any, Any]:
+        """Return cached (polydata, mesh_state) for `key`, computing it on a miss"""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        polydata, mesh_state = compute()
+        self.put(key, polydata, mesh_state)
+        return polydata, mesh_state
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def transform_polydata(
+    polydata: Any,
+    flip_z: bool = False,
+    scale: Sequence[float] = (1, 1, 1),
+    center: Optional[Sequence[float]] = None,
+) -> Any:
+    """Return a transformed copy of `polydata`, leaving the input untouched.
+
+    Flipping is done about `center` (defaults to the polydata center), so
+    geometry extracted from a subset of a grid can be flipped about the
+    center of the full grid. Scaling is applied after flipping.
+    """
+    polydata = polydata.copy()
+    if flip_z:
+        polydata.flip_z(point=center, inplace=True)
+    if tuple(scale) != (1, 1, 1):
+        polydata.scale(list(scale), inplace=True)
+    return polydata
+
+
+# Cache shared by all apps in this process
+GEOMETRY_CACHE = GeometryCache()
@@ -0,0 +1,86 @@
+"""Cell properties of a grid, loaded lazily for recoloring.
+
+A grid can carry many cell properties (e.g. pressure per time step), but
+the rendered skins and sections only need the values of the cells they
+show. Skins keep the id of the grid cell behind each polygon
+(`CELL_IDS_NAME`, from the skin filter) and sections their `cell_id`, so
+switching property is a lookup of those ids in the new property, and only
+the resulting scalar array is sent to the client. Properties are mapped
+from the .npy grid cache when present, so unused ones are never read.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from grid_store import (
+    CELL_IDS_NAME,
+    FACE_FLAGS_NAME,
+    cache_dir,
+    read_manifest,
+    read_cell_property,
+)
+
+# Cell arrays stored with the grid which are not properties to color by
+INTERNAL_ARRAYS = {
+    "vtkGhostType",
+    FACE_FLAGS_NAME,
+    CELL_IDS_NAME,
+    "BLOCK_I",
+    "BLOCK_J",
+    "BLOCK_K",
+}
+
+# Copy of the first property, kept for apps reading a single scalar
+SCALAR_NAME = "scalar"
+
+
+class GridProperties:
+    """Cell properties of the grid in `vtu_file`, by name"""
+
+    def __init__(self, vtu_file: str, grid) -> None:
+        self.grid = grid
+        self.directory = cache_dir(vtu_file)
+        self._manifest = read_manifest(self.directory, Path(vtu_file)) or {}
+        self._values: Dict[str, np.ndarray] = {}
+        self._ranges: Dict[str, Tuple[float, float]] = {}
+
+    @property
+    def names(self) -> List[str]:
+        """Property names, without the `scalar` copy of the first property"""
+        names = [
+            name for name in self.grid.cell_data.keys() if name not in INTERNAL_ARRAYS
+        ]
+        if len(names) > 1 and SCALAR_NAME in names:
+            names.remove(SCALAR_NAME)
+        return names + [
+            name for name in self._manifest.get("properties", []) if name not in names
+        ]
+
+    @property
+    def default(self) -> Optional[str]:
+        names = self.names
+        return names[0] if names else None
+
+    def values(self, name: str) -> np.ndarray:
+        """Values of property `name` for all grid cells"""
+        if name not in self._values:
+            if name in self.grid.cell_data:
+                values = np.asarray(self.grid.cell_data[name])
+            elif name in self._manifest.get("properties", []):
+                values = read_cell_property(self.directory, name)
+            else:
+                raise KeyError(f"No cell property {name!r}, have {self.names}")
+            self._values[name] = values
+        return self._values[name]
+
+    def data_range(self, name: str) -> Tuple[float, float]:
+        """Range of the property over the whole grid, fixed across views"""
+        if name not in self._ranges:
+            values = self.values(name)
+            self._ranges[name] = (float(np.nanmin(values)), float(np.nanmax(values)))
+        return self._ranges[name]
+
+    def sample(self, name: str, cell_ids: np.ndarray) -> np.ndarray:
+        """Property values for the given grid cells, e.g. of a skin"""
+        return np.asarray(self.values(name))[np.asarray(cell_ids)]
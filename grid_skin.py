@@ -0,0 +1,151 @@
+"""Vectorized skin extraction of ExplicitStructuredGrids.
+
+`vtkExplicitStructuredGridSurfaceFilter` walks every cell of the grid in
+a single thread. Its rule is simple on the structured (i, j, k) indices:
+a face of a visible cell is on the skin if the cell has no neighbour
+across it, the neighbour is hidden, or the two cells do not share the
+face points (a fault), as recorded in the connectivity flags from
+`ComputeFacesConnectivityFlagsArray`. Here that rule is evaluated with
+NumPy for all cells at once, in k-slabs run on a thread pool, and the
+faces are emitted as quads in the same order and orientation as the VTK
+filter, with the id of the cell behind each face.
+
+`benchmarks/skin.py` checks the result against the VTK filter.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+import pyvista
+from vtk.util.numpy_support import numpy_to_vtkIdTypeArray, vtk_to_numpy
+from vtkmodules.vtkCommonDataModel import vtkCellArray
+
+from column_index import cell_visibility, hex_connectivity
+from grid_properties import CELL_IDS_NAME
+from grid_store import FACE_FLAGS_NAME
+
+# Point ids of the faces of a VTK hexahedron, facing -i, +i, -j, +j, -k, +k.
+# Bit f of the connectivity flags is set if face f is shared with the
+# neighbour across it.
+HEX_FACES = np.array(
+    [
+        [0, 4, 7, 3],
+        [1, 2, 6, 5],
+        [0, 1, 5, 4],
+        [3, 7, 6, 2],
+        [0, 3, 2, 1],
+        [4, 5, 6, 7],
+    ]
+)
+
+# Cells per slab below which slabs are not worth a thread
+MIN_SLAB_CELLS = 50_000
+
+
+def _slab_faces(
+    k_range: Tuple[int, int],
+    shape: Tuple[int, int, int],
+    visible: np.ndarray,
+    flags: np.ndarray,
+    connectivity: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Cell ids and grid point ids of the skin quads of layers k0 <= k < k1"""
+    ni, nj, nk = shape
+    k0, k1 = k_range
+    layer = ni * nj
+    cells = np.arange(k0 * layer, k1 * layer)
+    i = cells % ni
+    j = (cells // ni) % nj
+    k = cells // layer
+
+    emit = np.zeros((len(cells), 6), dtype=bool)
+    for face, (index, step, count, stride) in enumerate(
+        [
+            (i, -1, ni, 1),
+            (i, 1, ni, 1),
+            (j, -1, nj, ni),
+            (j, 1, nj, ni),
+            (k, -1, nk, layer),
+            (k, 1, nk, layer),
+        ]
+    ):
+        inside = (index + step >= 0) & (index + step < count)
+        neighbour = np.where(inside, cells + step * stride, 0)
+        connected = (flags[cells] >> face) & 1 == 1
+        emit[:, face] = ~inside | ~visible[neighbour] | ~connected
+    emit &= visible[cells, None]
+    # Row-major nonzero gives faces ordered by cell, then face, as VTK
+    rows, faces = np.nonzero(emit)
+    # Gather from the flat connectivity, faster than 2D fancy indexing
+    corners = np.take(HEX_FACES, faces, axis=0)
+    corners += (cells[rows] * 8)[:, None]
+    return cells[rows], np.take(connectivity, corners)
+
+
+def skin_arrays(
+    grid, visible: Optional[np.ndarray] = None, threads: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Points (n, 3), quads (m, 4) and the cell id behind each quad.
+
+    `visible` overrides the cell visibility of the grid (from
+    `vtkGhostType`), e.g. an active cell mask or an index filter. Only
+    points used by the quads are returned. The connectivity flags are
+    computed if the grid has none.
+    """
+    dims = [0, 0, 0]
+    grid.GetDimensions(dims)
+    shape = tuple(d - 1 for d in dims)
+    visible = cell_visibility(grid) if visible is None else np.asarray(visible, bool)
+    if grid.GetCellData().GetArray(FACE_FLAGS_NAME) is None:
+        grid.ComputeFacesConnectivityFlagsArray()
+    flags = vtk_to_numpy(grid.GetCellData().GetArray(FACE_FLAGS_NAME))
+
+    nk = shape[2]
+    slabs = max(1, min(threads or os.cpu_count() or 1, visible.size // MIN_SLAB_CELLS))
+    bounds = np.linspace(0, nk, min(slabs, nk) + 1).astype(int)
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    connectivity = hex_connectivity(grid).ravel()
+    slab_args = (shape, visible, flags, connectivity)
+    if len(ranges) == 1:
+        results = [_slab_faces(ranges[0], *slab_args)]
+    else:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            results = list(executor.map(lambda r: _slab_faces(r, *slab_args), ranges))
+    cells = np.concatenate([cells for cells, _ in results])
+    quads = np.concatenate([quads for _, quads in results])
+
+    points = vtk_to_numpy(grid.GetPoints().GetData())
+    used = np.zeros(len(points), dtype=bool)
+    used[quads.ravel()] = True
+    if not used.all():
+        used = np.flatnonzero(used)
+        point_ids = np.zeros(len(points), dtype=np.int64)
+        point_ids[used] = np.arange(len(used))
+        points, quads = np.take(points, used, axis=0), np.take(point_ids, quads)
+    return points, quads, cells
+
+
+def extract_skin(
+    grid, visible: Optional[np.ndarray] = None, threads: Optional[int] = None
+) -> pyvista.PolyData:
+    """Skin as polydata with the grid cell arrays and `CELL_IDS_NAME`.
+
+    A drop-in for `vtkExplicitStructuredGridSurfaceFilter` with
+    PassThroughCellIdsOn, see `skin_arrays`.
+    """
+    points, quads, cells = skin_arrays(grid, visible, threads)
+    polys = vtkCellArray()
+    polys.SetData(
+        numpy_to_vtkIdTypeArray(np.arange(0, 4 * len(quads) + 1, 4), deep=False),
+        numpy_to_vtkIdTypeArray(quads.astype(np.int64).ravel(), deep=False),
+    )
+    skin = pyvista.PolyData()
+    skin.points = points
+    skin.SetPolys(polys)
+    cell_data = grid.GetCellData()
+    for index in range(cell_data.GetNumberOfArrays()):
+        name = cell_data.GetArrayName(index)
+        skin.cell_data[name] = vtk_to_numpy(cell_data.GetArray(index))[cells]
+    skin.cell_data[CELL_IDS_NAME] = cells
+    return skin
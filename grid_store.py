@@ -0,0 +1,329 @@
+"""Memory-mapped columnar cache of explicit structured grids.
+
+Parsing a .vtu, casting it to an ExplicitStructuredGrid and computing the
+face connectivity flags takes seconds for large grids, in every process.
+The prepared grid is instead written once as separate .npy files (points,
+connectivity, offsets and each cell array) next to the .vtu. Loading maps
+these files with `np.memmap` and wraps them in VTK arrays without copying,
+so all workers on a host share the same pages from the page cache.
+
+The mapped grid is shared and must be treated as read-only: pages written
+to are copied into the writing process. Transforms such as flipping and
+vertical exaggeration are applied to extracted geometry through a
+`ViewTransform` instead of to the grid.
+"""
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Sequence
+
+import numpy as np
+import pyvista
+from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray, vtk_to_numpy
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import (
+    VTK_HEXAHEDRON,
+    vtkCellArray,
+    vtkExplicitStructuredGrid,
+    vtkUnstructuredGrid,
+)
+
+from geometry_cache import transform_polydata
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# Bump when the on-disk layout changes
+CACHE_VERSION = 1
+
+FACE_FLAGS_NAME = "ConnectivityFlags"
+
+# Grid cell ids per skin polygon, added by PassThroughCellIdsOn
+CELL_IDS_NAME = "vtkOriginalCellIds"
+
+
+def cache_dir(vtu_file: str) -> Path:
+    return Path(vtu_file).with_suffix(".npycache")
+
+
+def _source_stat(source: Optional[Path]) -> dict:
+    if source is None:
+        return {}
+    stat = Path(source).stat()
+    return {"source_mtime": stat.st_mtime_ns, "source_size": stat.st_size}
+
+
+@contextmanager
+def staged_cache(target: Path) -> Iterator[Path]:
+    """Temporary directory to write a cache into, renamed to `target` after.
+
+    Workers starting at the same time never map a partially written cache.
+    The manifest must be written last, e.g. with `write_manifest`.
+    """
+    target = Path(target)
+    directory = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+    directory.mkdir(parents=True, exist_ok=True)
+    try:
+        yield directory
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    # Replaces a stale cache. Mapped files of a replaced cache stay valid
+    # for processes using them until they are unmapped.
+    if target.exists():
+        shutil.rmtree(target, ignore_errors=True)
+    try:
+        os.replace(directory, target)
+    except OSError:
+        # Another process wrote the cache first, complete as it was staged
+        shutil.rmtree(directory, ignore_errors=True)
+        if not (target / "manifest.json").exists():
+            raise
+
+
+def write_manifest(
+    directory: Path,
+    dimensions: Sequence[int],
+    cell_arrays: Sequence[str],
+    source: Optional[Path] = None,
+    **extra,
+) -> None:
+    """Write the manifest, which makes the cache in `directory` valid"""
+    manifest = {
+        "version": CACHE_VERSION,
+        "dimensions": [int(d) for d in dimensions],
+        "cell_arrays": list(cell_arrays),
+        **_source_stat(source),
+        **extra,
+    }
+    _write_manifest(Path(directory), manifest)
+
+
+def _write_manifest(directory: Path, manifest: dict) -> None:
+    _replace(
+        directory / "manifest.json",
+        lambda file: file.write(json.dumps(manifest).encode()),
+    )
+
+
+def _replace(path: Path, write: Callable) -> None:
+    """Write `path` through a temporary file which then replaces it.
+
+    Processes which have the old file open or mapped keep reading it.
+    """
+    partial = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    try:
+        with open(partial, "wb") as file:
+            write(file)
+        os.replace(partial, path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+
+def write_grid_cache(grid, directory: Path, source: Optional[Path] = None) -> None:
+    """Write an ExplicitStructuredGrid as .npy files to `directory`.
+
+    Face connectivity flags are computed first if missing, so readers get
+    a grid that is ready for skin extraction.
+    """
+    if grid.GetCellData().GetArray(FACE_FLAGS_NAME) is None:
+        grid.ComputeFacesConnectivityFlagsArray()
+
+    with staged_cache(directory) as staging:
+        cells = grid.GetCells()
+        np.save(staging / "points.npy", vtk_to_numpy(grid.GetPoints().GetData()))
+        np.save(
+            staging / "connectivity.npy",
+            vtk_to_numpy(cells.GetConnectivityArray()).astype(np.int64),
+        )
+        np.save(
+            staging / "offsets.npy",
+            vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64),
+        )
+        cell_data = grid.GetCellData()
+        cell_arrays = []
+        for index in range(cell_data.GetNumberOfArrays()):
+            name = cell_data.GetArrayName(index)
+            np.save(
+                staging / f"cell-{name}.npy", vtk_to_numpy(cell_data.GetArray(index))
+            )
+            cell_arrays.append(name)
+
+        dimensions = [0, 0, 0]
+        grid.GetDimensions(dimensions)
+        # Written last, so a partially written cache is never considered valid
+        write_manifest(staging, dimensions, cell_arrays, source)
+
+
+def read_manifest(directory: Path, source: Optional[Path] = None) -> Optional[dict]:
+    """Cache manifest, None if the cache is missing or stale"""
+    path = Path(directory) / "manifest.json"
+    if not path.exists():
+        return None
+    manifest = json.loads(path.read_text())
+    if manifest.get("version") != CACHE_VERSION:
+        return None
+    stat = _source_stat(source)
+    if any(manifest.get(key) != value for key, value in stat.items()):
+        return None
+    return manifest
+
+
+def _map(path: Path) -> np.ndarray:
+    # Copy-on-write: pages are shared until a process writes to them
+    return np.load(path, mmap_mode="c")
+
+
+def read_cell_property(directory: Path, name: str) -> np.ndarray:
+    """Memory-mapped values of cell array or property `name`"""
+    return _map(Path(directory) / f"cell-{name}.npy")
+
+
+def write_cell_property(directory: Path, name: str, values: np.ndarray) -> None:
+    """Add a property to an existing cache, or replace one.
+
+    Properties are listed separately from the cell arrays in the manifest,
+    so they are not attached to the grid when it is loaded, but read on
+    demand with `read_cell_property`. Names of the cell arrays of the grid
+    are rejected, their files are mapped by the workers. A replaced
+    property is written to a new file, so workers mapping the old one keep
+    their values.
+    """
+    directory = Path(directory)
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No valid grid cache in {directory}")
+    if name in manifest["cell_arrays"] or name == CELL_IDS_NAME:
+        raise ValueError(f"{name!r} is a cell array of the grid, not a property")
+    _replace(directory / f"cell-{name}.npy", lambda file: np.save(file, values))
+    if name not in manifest.setdefault("properties", []):
+        manifest["properties"].append(name)
+    _write_manifest(directory, manifest)
+
+
+def _mapped_points(directory: Path) -> vtkPoints:
+    points = vtkPoints()
+    points.SetData(numpy_to_vtk(_map(directory / "points.npy"), deep=False))
+    return points
+
+
+def _mapped_cells(directory: Path) -> vtkCellArray:
+    cells = vtkCellArray()
+    cells.SetData(
+        numpy_to_vtkIdTypeArray(_map(directory / "offsets.npy"), deep=False),
+        numpy_to_vtkIdTypeArray(_map(directory / "connectivity.npy"), deep=False),
+    )
+    return cells
+
+
+def _add_mapped_cell_arrays(grid, directory: Path, manifest: dict) -> None:
+    for name in manifest["cell_arrays"]:
+        array = numpy_to_vtk(_map(directory / f"cell-{name}.npy"), deep=False)
+        array.SetName(name)
+        grid.GetCellData().AddArray(array)
+
+
+def read_grid_cache(directory: Path, manifest: Optional[dict] = None):
+    """Build an ExplicitStructuredGrid on top of the memory-mapped arrays"""
+    directory = Path(directory)
+    manifest = manifest or read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No valid grid cache in {directory}")
+
+    grid = vtkExplicitStructuredGrid()
+    grid.SetDimensions(*manifest["dimensions"])
+    grid.SetPoints(_mapped_points(directory))
+    grid.SetCells(_mapped_cells(directory))
+    _add_mapped_cell_arrays(grid, directory, manifest)
+    grid.SetFacesConnectivityFlagsArrayName(FACE_FLAGS_NAME)
+    return pyvista.wrap(grid)
+
+
+def read_unstructured_cache(directory: Path, manifest: Optional[dict] = None):
+    """Hexahedron UnstructuredGrid on top of the memory-mapped arrays.
+
+    For writing a cached grid as .vtu without casting, which copies it.
+    """
+    directory = Path(directory)
+    manifest = manifest or read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No valid grid cache in {directory}")
+
+    grid = vtkUnstructuredGrid()
+    grid.SetPoints(_mapped_points(directory))
+    grid.SetCells(VTK_HEXAHEDRON, _mapped_cells(directory))
+    _add_mapped_cell_arrays(grid, directory, manifest)
+    return pyvista.wrap(grid)
+
+
+def load_grid(vtu_file: str, write_cache: bool = True):
+    """ExplicitStructuredGrid for `vtu_file`, from the .npy cache if valid.
+
+    On a cache miss the .vtu is parsed, cast and prepared as before, and
+    the cache is written and mapped, so this process shares the grid with
+    the next ones instead of keeping a private copy.
+    """
+    source = Path(vtu_file)
+    directory = cache_dir(vtu_file)
+    manifest = read_manifest(directory, source)
+    if manifest is not None:
+        return read_grid_cache(directory, manifest)
+
+    grid = pyvista.read(vtu_file).cast_to_explicit_structured_grid()
+    grid.ComputeFacesConnectivityFlagsArray()
+    if write_cache:
+        try:
+            write_grid_cache(grid, directory, source)
+            return read_grid_cache(directory)
+        except OSError as exc:
+            LOGGER.warning("Could not write grid cache to %s: %s", directory, exc)
+    return grid
+
+
+class ViewTransform:
+    """Flip and scale applied to geometry extracted from a shared grid.
+
+    Points are flipped in z about `center` first, then scaled about the
+    origin, as `geometry_cache.transform_polydata` does.
+    """
+
+    def __init__(
+        self,
+        scale: Sequence[float] = (1, 1, 1),
+        flip_z: bool = False,
+        center: Sequence[float] = (0, 0, 0),
+    ) -> None:
+        self.scale = tuple(float(s) for s in scale)
+        self.flip_z = flip_z
+        self.center = tuple(float(c) for c in center)
+
+    @property
+    def is_identity(self) -> bool:
+        return not self.flip_z and self.scale == (1, 1, 1)
+
+    def to_view(self, points: np.ndarray) -> np.ndarray:
+        """Grid coordinates to view coordinates"""
+        points = np.array(points, dtype=float)
+        if self.flip_z:
+            points[..., 2] = 2 * self.center[2] - points[..., 2]
+        return points * self.scale
+
+    def to_grid(self, points: np.ndarray) -> np.ndarray:
+        """View coordinates (e.g. a clicked position) to grid coordinates"""
+        points = np.asarray(points, dtype=float) / self.scale
+        if self.flip_z:
+            points[..., 2] = 2 * self.center[2] - points[..., 2]
+        return points
+
+    def apply(self, polydata):
+        """Transformed copy of `polydata`, the input is left untouched"""
+        if self.is_identity:
+            return polydata
+        return transform_polydata(
+            pyvista.wrap(polydata), self.flip_z, self.scale, self.center
+        )
@@ -1,10 +1,6 @@
 import logging
 import json
-import numpy as np
-from vtk.util.numpy_support import vtk_to_numpy
-import pyvista
 from dash import (
-    Dash,
     html,
     dcc,
     callback,
@@ -12,66 +8,152 @@ from dash import (
     Output,
     no_update,
     State,
-    callback_context,
+    ctx,
 )
 import dash_vtk
-from dash_vtk.utils import to_mesh_state
 from webviz_config._plugin_abc import WebvizPluginABC
-from webviz_subsurface._utils.perf_timer import PerfTimer
 import webviz_core_components as wcc
-from vtkmodules.vtkFiltersGeometry import vtkGeometryFilter
-from vtkmodules.vtkFiltersGeometry import vtkExplicitStructuredGridSurfaceFilter
 
-TIMER = PerfTimer()
+from geometry_cache import GEOMETRY_CACHE
+from camera import section_camera
+from column_index import ColumnIndex
+from grid_intersection import GridIntersector
+from grid_properties import CELL_IDS_NAME, GridProperties
+from grid_skin import extract_skin
+from grid_store import ViewTransform, load_grid
+from mesh_delta import (
+    array_digest,
+    polydata_arrays,
+    digest_arrays,
+    delta_update,
+    delta_nbytes,
+)
+from mesh_transport import encode_array
+from perf import span, request, new_request_id
+from perf_panel import perf_panel
+from response_cache import DEFAULT_TOLERANCE, ResponseCache, polyline_digest
+from skin_lod import SkinPyramid
+from well_curtain import WellCurtain
+
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
 
-def time_it(text: str) -> str:
-    return print(f"TIME: {text} {TIMER.lap_s():.2f}s")
-
-
 class IntersectionApp(WebvizPluginABC):
     """Testing vtk performance"""
 
+    # Vertical exaggeration applied to the rendered skin and sections
+    SCALE = (1, 1, 5)
+
     def __init__(
         self,
         vtu_file,
+        transport="json",
+        float32=False,
+        triangle_budget=None,
+        well_file=None,
+        background_manager=None,
+        response_cache_dir=None,
+        section_tolerance=DEFAULT_TOLERANCE,
     ) -> None:
         super().__init__(self)
-        time_it("Initializing app")
+
+        self.vtu_file = vtu_file
+        self.transport = transport
+        self.float32 = float32
 
         # Preparing 3D grid
-        self.grid = pyvista.read(vtu_file)
-        time_it(f"Read unstructured grid, type={type(self.grid)}")
+        # Memory-mapped from the .npy cache, cast and with face flags. The
+        # grid is shared with other workers and left untouched, the scale is
+        # applied to the extracted geometry.
+        with span("read", vtu_file) as record:
+            self.grid = load_grid(vtu_file)
+            record["cells"] = self.grid.n_cells
+        self.view = ViewTransform(scale=self.SCALE)
+        self.properties = GridProperties(vtu_file, self.grid)
+
+        with span("column_index"):
+            self.intersector = GridIntersector(
+                self.grid, ColumnIndex.load_or_build(vtu_file, self.grid)
+            )
+
+        # Sections by polyline, property and transport. The disk tier is
+        # shared with the background processes computing the sections.
+        self.sections = ResponseCache(response_cache_dir)
+        self.section_tolerance = section_tolerance
 
-        TIMER.lap_s()
-        self.grid = self.grid.cast_to_explicit_structured_grid()
-        self.grid.ComputeFacesConnectivityFlagsArray()
-        self.grid.scale([1, 1, 5], inplace=True)
-        extractSkinFilter = vtkExplicitStructuredGridSurfaceFilter()
+        self.well = None
+        if well_file is not None:
+            with span("well_curtain", str(well_file)):
+                self.well = WellCurtain.from_file(well_file, self.intersector)
 
-        print("Num grid cells: ", self.grid.GetNumberOfCells())
+        with span("lod"):
+            self.pyramid = SkinPyramid.load_or_build(
+                vtu_file,
+                self._extract_skin,
+                tag="skin-scale-{}-{}-{}".format(*self.SCALE),
+            )
+        self.lod_steps = self.pyramid.refinement_steps(triangle_budget)
 
-        extractSkinFilter.SetInputData(self.grid)
-        extractSkinFilter.Update()
-        polydata = extractSkinFilter.GetOutput()
-        TIMER.lap_s()
-        self.mesh_state = to_mesh_state(polydata, field_to_keep="scalar")
-        time_it("TO MESH STATE")
+        # --------------------------
+        # Callback to progressively refine the 3D grid skin, and recolor it
+        # when the property changes. The coarsest level is sent first.
+        @callback(
+            Output("vtk-3d-grid-polydata", "points"),
+            Output("vtk-3d-grid-polydata", "polys"),
+            Output("vtk-3d-grid-array", "values"),
+            Output("skin-hashes", "data"),
+            Output("vtk-3d-grid-representation", "colorDataRange"),
+            Input("lod-interval", "n_intervals"),
+            Input("property", "value"),
+            State("skin-hashes", "data"),
+        )
+        @request("refine_skin")
+        def _update_skin(n_intervals, property_name, previous_hashes):
+            level = self.lod_steps[min(n_intervals or 0, len(self.lod_steps) - 1)]
+            arrays, hashes, polydata = self._level_arrays(level)
+            arrays, hashes = self._recolor(
+                arrays, hashes, polydata, property_name, CELL_IDS_NAME
+            )
+            with span("to_mesh_state", self.transport) as record:
+                outputs, hashes = delta_update(
+                    arrays,
+                    ["points", "polys", "scalars"],
+                    previous_hashes,
+                    transport=self.transport,
+                    float32=self.float32,
+                    hashes=hashes,
+                )
+                record["nbytes"] = delta_nbytes(outputs)
+            return (*outputs, hashes, self.properties.data_range(property_name))
 
         # --------------------------
         # Callback to store edited polyline
         @callback(
             Output("stored-polyline", "children"),
+            Output("picked-cell", "children"),
+            Output("polyline-request", "data"),
             Input("vtk-3d-view", "clickInfo"),
             Input("clear", "n_clicks"),
+            Input("well", "n_clicks"),
             State("stored-polyline", "children"),
         )
-        def _store_polyline(clickdata, _n_clicks, stored_polyline):
+        @request("store_polyline")
+        def _store_polyline(clickdata, _n_clicks, _well_clicks, stored_polyline):
             stored_polyline = json.loads(stored_polyline)
-            if "n_clicks" in callback_context.triggered[0]["prop_id"]:
-                return json.dumps([])
+            if ctx.triggered_id == "clear":
+                return json.dumps([]), "", new_request_id()
+            if ctx.triggered_id == "well":
+                # Simplified curtain polyline instead of the dense trajectory,
+                # stored in view coordinates as clicked points are
+                return (
+                    json.dumps(
+                        self.view.to_view(self.well.polyline).tolist(), indent=2
+                    ),
+                    f"Well curtain: {len(self.well.polyline)} of "
+                    f"{len(self.well.trajectory)} trajectory points",
+                    new_request_id(),
+                )
             if clickdata:
                 if (
                     "representationId" in clickdata
@@ -79,40 +161,177 @@ class IntersectionApp(WebvizPluginABC):
                 ):
                     stored_polyline.append(clickdata["worldPosition"])
 
-                    return json.dumps(stored_polyline, indent=2)
-            return no_update
+                    with span("pick"):
+                        cell = self.intersector.pick_cell(
+                            *self.view.to_grid(clickdata["worldPosition"])
+                        )
+                    picked = (
+                        f"Picked cell (i, j, k): {self.intersector.cell_ijk(cell)}"
+                        if cell is not None
+                        else ""
+                    )
+                    return (
+                        json.dumps(stored_polyline, indent=2),
+                        picked,
+                        new_request_id(),
+                    )
+            return no_update, no_update, no_update
 
         # --------------------------
         # Callback to slice grid from polyline and update intersection mesh in both views
+        background = {}
+        if background_manager is not None:
+            # Sliced in a separate process, so Dash workers are only polling.
+            # The renderer terminates the job of a superseded polyline when
+            # the next one is submitted.
+            background = {
+                "background": True,
+                "manager": background_manager,
+                # Polling period in ms, the default second is noticeable
+                "interval": 200,
+                "running": [
+                    (Output("section-status", "children"), "Computing section...", "")
+                ],
+                "cancel": [Input("clear", "n_clicks")],
+            }
+
+        # The section is shown in both views, so each array is output twice
         @callback(
-            Output("vtk-intersection-mesh", "state"),
+            Output("vtk-intersection-polydata", "points"),
+            Output("vtk-intersection-polydata", "polys"),
+            Output("vtk-intersection-array", "values"),
+            Output("vtk-3d-intersection-polydata", "points"),
+            Output("vtk-3d-intersection-polydata", "polys"),
+            Output("vtk-3d-intersection-array", "values"),
+            Output("section-hashes", "data"),
+            Output("vtk-intersection-representation", "colorDataRange"),
+            Output("vtk-3d-intersect-representation", "colorDataRange"),
             Output("vtk-intersection-view", "cameraPosition"),
-            Output("vtk-3d-intersection-mesh", "state"),
+            Output("vtk-intersection-view", "cameraViewUp"),
             Input("stored-polyline", "children"),
+            Input("property", "value"),
+            State("section-hashes", "data"),
+            State("polyline-request", "data"),
+            **background,
         )
-        def _store_polyline(stored_polyline):
-            stored_polyline = json.loads(stored_polyline)
-            if len(stored_polyline) < 2:
-                return {}, no_update, {}
+        def _store_polyline(
+            stored_polyline, property_name, previous_hashes, request_id
+        ):
+            # Spans are tagged with the id of the polyline edit
+            with request("intersection", request_id):
+                return self._section_outputs(
+                    json.loads(stored_polyline),
+                    property_name,
+                    previous_hashes,
+                    update_camera=ctx.triggered_id != "property",
+                )
+
+    def _extract_skin(self):
+        # Grid cell id per polygon, for recoloring by other properties
+        return self.view.apply(extract_skin(self.grid))
+
+    def _level_arrays(self, level):
+        key = GEOMETRY_CACHE.key(
+            self.vtu_file,
+            kind="skin",
+            scale=self.SCALE,
+            level=self.pyramid.fractions[level],
+        )
+        polydata = self.pyramid.levels[level]
+        with span("skin", f"level={level}", cells=polydata.n_cells):
+            _polydata, (arrays, hashes) = GEOMETRY_CACHE.get_or_compute(
+                key, lambda: (polydata, self._split_arrays(polydata))
+            )
+        return arrays, hashes, polydata
+
+    @staticmethod
+    def _split_arrays(polydata):
+        arrays = polydata_arrays(polydata)
+        return arrays, digest_arrays(arrays)
 
-            # Had to make a `pyvista.Spline` to be able to slice...
-            spline_from_polyline = pyvista.Spline(
-                np.array(stored_polyline),
-                n_points=None,  # Increase points to e.g. 1000 to simulate well path
+    def _recolor(self, arrays, hashes, polydata, property_name, cell_ids):
+        """Scalars of `property_name` for the grid cells behind `polydata`"""
+        with span("recolor", property_name):
+            scalars = self.properties.sample(
+                property_name, polydata.cell_data[cell_ids]
             )
+        return {**arrays, "scalars": scalars}, {
+            **hashes,
+            "scalars": array_digest(scalars),
+        }
 
-            TIMER.lap_s()
-            intersection = self.grid.slice_along_line(spline_from_polyline)
-            time_it("Slicing grid")
+    def _section_outputs(
+        self, stored_polyline, property_name, previous_hashes, update_camera
+    ):
+        data_range = self.properties.data_range(property_name)
+        if len(stored_polyline) < 2:
+            return (*[[]] * 6, {}, data_range, data_range, no_update, no_update)
+
+        key = self.sections.key(
+            self.vtu_file,
+            kind="section",
+            scale=self.SCALE,
+            polyline=polyline_digest(
+                self.view.to_grid(stored_polyline), self.section_tolerance
+            ),
+            property=property_name,
+            transport=self.transport,
+            float32=self.float32,
+        )
+        with span("section_cache") as record:
+            response, record["tier"] = self.sections.lookup(key)
+        if response is None:
+            response = self._compute_section(stored_polyline, property_name)
+            self.sections.store(key, response)
+
+        with span("to_mesh_state", self.transport) as record:
+            outputs, hashes = delta_update(
+                response["encoded"],
+                ["points", "polys", "scalars"],
+                previous_hashes,
+                hashes=response["hashes"],
+                encoded=True,
+            )
+            record["nbytes"] = delta_nbytes(outputs)
+
+        # The view resets its camera to fit the section when these change
+        camera = response["camera"] if update_camera else None
+        return (
+            *outputs,
+            *outputs,
+            hashes,
+            data_range,
+            data_range,
+            camera["position"] if camera is not None else no_update,
+            camera["view_up"] if camera is not None else no_update,
+        )
 
-            # Using pyvista plotter to calculate camera position...
-            pll = pyvista.Plotter()
-            pll.add_mesh(intersection)
-            camera_position = pll.camera.position
+    def _compute_section(self, stored_polyline, property_name):
+        """Encoded section arrays, their hashes and the section camera"""
+        with span("slice", f"vertices={len(stored_polyline)}") as record:
+            intersection = self.intersector.intersect(
+                self.view.to_grid(stored_polyline)
+            )
+            record["cells"] = intersection.n_cells
+        intersection = self.view.apply(intersection)
 
-            mesh_state = to_mesh_state(intersection, field_to_keep="scalar")
+        with span("camera"):
+            camera = section_camera(intersection.bounds, stored_polyline)
 
-            return mesh_state, camera_position, mesh_state
+        arrays, hashes = self._split_arrays(intersection)
+        arrays, hashes = self._recolor(
+            arrays, hashes, intersection, property_name, "cell_id"
+        )
+        with span("encode", self.transport):
+            encoded = {
+                name: encode_array(values, self.transport, self.float32)
+                for name, values in arrays.items()
+            }
+        return {
+            "encoded": encoded,
+            "hashes": hashes,
+            "camera": camera,
+        }
 
     @property
     def layout(self) -> html.Div:
@@ -130,9 +349,19 @@ class IntersectionApp(WebvizPluginABC):
                                     dash_vtk.GeometryRepresentation(
                                         id="vtk-3d-grid-representation",
                                         children=[
-                                            dash_vtk.Mesh(
-                                                id="vtk-3d-grid-mesh",
-                                                state=self.mesh_state,
+                                            dash_vtk.PolyData(
+                                                id="vtk-3d-grid-polydata",
+                                                children=[
+                                                    dash_vtk.CellData(
+                                                        [
+                                                            dash_vtk.DataArray(
+                                                                id="vtk-3d-grid-array",
+                                                                registration="setScalars",
+                                                                name="scalar",
+                                                            )
+                                                        ]
+                                                    )
+                                                ],
                                             )
                                         ],
                                         property={"edgeVisibility": True},
@@ -140,9 +369,19 @@ class IntersectionApp(WebvizPluginABC):
                                     dash_vtk.GeometryRepresentation(
                                         id="vtk-3d-intersect-representation",
                                         children=[
-                                            dash_vtk.Mesh(
-                                                id="vtk-3d-intersection-mesh",
-                                                state={},
+                                            dash_vtk.PolyData(
+                                                id="vtk-3d-intersection-polydata",
+                                                children=[
+                                                    dash_vtk.CellData(
+                                                        [
+                                                            dash_vtk.DataArray(
+                                                                id="vtk-3d-intersection-array",
+                                                                registration="setScalars",
+                                                                name="scalar",
+                                                            )
+                                                        ]
+                                                    )
+                                                ],
                                             )
                                         ],
                                         property={"edgeVisibility": True},
@@ -185,9 +424,19 @@ class IntersectionApp(WebvizPluginABC):
                                     dash_vtk.GeometryRepresentation(
                                         id="vtk-intersection-representation",
                                         children=[
-                                            dash_vtk.Mesh(
-                                                id="vtk-intersection-mesh",
-                                                state={},
+                                            dash_vtk.PolyData(
+                                                id="vtk-intersection-polydata",
+                                                children=[
+                                                    dash_vtk.CellData(
+                                                        [
+                                                            dash_vtk.DataArray(
+                                                                id="vtk-intersection-array",
+                                                                registration="setScalars",
+                                                                name="scalar",
+                                                            )
+                                                        ]
+                                                    )
+                                                ],
                                             )
                                         ],
                                         property={"edgeVisibility": False},
@@ -195,16 +444,41 @@ class IntersectionApp(WebvizPluginABC):
                                 ],
                             ),
                         ),
+                        dcc.Interval(
+                            id="lod-interval",
+                            interval=500,
+                            max_intervals=len(self.lod_steps) - 1,
+                        ),
                         html.Button(
                             id="clear",
                             style={"fontSize": "10em"},
                             children="clear polyline",
                         ),
+                        html.Button(
+                            id="well",
+                            style={"fontSize": "10em"},
+                            children="well curtain",
+                            disabled=self.well is None,
+                        ),
                     ],
                 ),
                 html.Div(
                     style={"flex": 1},
-                    children=html.Pre(id="stored-polyline", children=json.dumps([])),
+                    children=[
+                        dcc.Dropdown(
+                            id="property",
+                            options=self.properties.names,
+                            value=self.properties.default,
+                            clearable=False,
+                        ),
+                        dcc.Store(id="skin-hashes", data={}),
+                        dcc.Store(id="section-hashes", data={}),
+                        dcc.Store(id="polyline-request"),
+                        html.Pre(id="section-status"),
+                        html.Pre(id="picked-cell"),
+                        perf_panel(),
+                        html.Pre(id="stored-polyline", children=json.dumps([])),
+                    ],
                 ),
             ],
         )
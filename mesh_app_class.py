@@ -1,85 +1,218 @@
 import logging
+import time
 
-from vtk.util.numpy_support import vtk_to_numpy
-import pyvista
-from dash import Dash, html, dcc, callback, Input, Output, no_update
+import numpy as np
+from dash import html, dcc, callback, Input, Output, State, no_update
 import dash_vtk
-from dash_vtk.utils import to_mesh_state
 from webviz_config._plugin_abc import WebvizPluginABC
-from webviz_subsurface._utils.perf_timer import PerfTimer
 
-from vtkmodules.vtkFiltersGeometry import vtkGeometryFilter
-from vtkmodules.vtkFiltersGeometry import vtkExplicitStructuredGridSurfaceFilter
+from vtkmodules.vtkCommonDataModel import vtkExplicitStructuredGrid
+
+from geometry_cache import GEOMETRY_CACHE, transform_polydata
+from grid_properties import CELL_IDS_NAME, GridProperties
+from grid_skin import extract_skin
+from grid_store import load_grid
+from mesh_delta import (
+    array_digest,
+    polydata_arrays,
+    digest_arrays,
+    delta_update,
+    delta_nbytes,
+)
+from perf import span, request, record_duration, estimate_nbytes
+from perf_panel import perf_panel
+from skin_lod import SkinPyramid, DEFAULT_FRACTIONS
 
-TIMER = PerfTimer()
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
 
-def time_it(text: str) -> str:
-    return print(f"TIME: {text} {TIMER.lap_s():.2f}s")
-
-
 class MeshApp(WebvizPluginABC):
     """Testing vtk performance"""
 
     def __init__(
         self,
         vtu_file,
+        transport="json",
+        float32=False,
+        triangle_budget=None,
     ) -> None:
         super().__init__(self)
-        time_it("Initializing app")
 
-        self.grid = pyvista.read(vtu_file)
-        time_it(f"Read unstructured grid, type={type(self.grid)}")
-
-        TIMER.lap_s()
-        self.grid = self.grid.cast_to_explicit_structured_grid()
-        self.grid.ComputeFacesConnectivityFlagsArray()
-        time_it("Cast to ExplicitStructuredGrid")
+        self.vtu_file = vtu_file
+        self.transport = transport
+        self.float32 = float32
+        # Memory-mapped from the .npy cache, cast and with face flags
+        with span("read", vtu_file) as record:
+            self.grid = load_grid(vtu_file)
+            record["cells"] = self.grid.n_cells
+        self.properties = GridProperties(vtu_file, self.grid)
+        # Cells along i, j and k
+        self.shape = tuple(d - 1 for d in self.grid.dimensions)
 
+        with span("lod", f"levels={DEFAULT_FRACTIONS}"):
+            self.pyramid = SkinPyramid.load_or_build(vtu_file, self._extract_skin)
+        self.lod_steps = self.pyramid.refinement_steps(triangle_budget)
 
         @callback(
-            Output("vtk-mesh", "state"),
+            Output("vtk-polydata", "points"),
+            Output("vtk-polydata", "polys"),
+            Output("vtk-array", "values"),
+            Output("mesh-hashes", "data"),
+            Output("vtk-representation", "colorDataRange"),
             Output("vtk-view", "triggerResetCamera"),
+            Output("sent-at", "data"),
             Input("click", "n_clicks"),
+            Input("lod-interval", "n_intervals"),
+            Input("property", "value"),
+            Input("i-range", "value"),
+            Input("j-range", "value"),
+            Input("k-range", "value"),
+            State("mesh-hashes", "data"),
         )
-        def _update(nclicks):
-            # Flipping z to trigger a change
-            self.grid.flip_z(inplace=True)
-
-            TIMER.lap_s()
+        @request("mesh")
+        def _update(
+            nclicks,
+            n_intervals,
+            property_name,
+            i_range,
+            j_range,
+            k_range,
+            previous_hashes,
+        ):
+            # Flipping z to trigger a change. The flip follows the clicks,
+            # so all workers agree on it. The grid itself is left
+            # untouched, only the (cached) skin is flipped.
+            flip_z = (nclicks or 0) % 2 == 0
 
-            if self.grid.IsA("vtkUnstructuredGrid"):
-                print("it is a vtkUnstructuredGrid")
-                extractSkinFilter = vtkGeometryFilter()
-            elif self.grid.IsA("vtkExplicitStructuredGrid"):
-                print("it is a vtkExplicitStructuredGrid")
-                extractSkinFilter = vtkExplicitStructuredGridSurfaceFilter()
-            else:
-                print("TROUBLE!!!!!!!!!!!!!!!")
+            # Coarse level first, refined on each interval tick
+            level = self.lod_steps[min(n_intervals or 0, len(self.lod_steps) - 1)]
+            extent = self._extent(i_range, j_range, k_range)
 
-            print("Num grid cells: ", self.grid.GetNumberOfCells())
+            with span("skin", f"level={level} extent={extent}") as record:
+                polydata, (arrays, hashes) = self._get_skin(flip_z, level, extent)
+                record.update(cells=polydata.n_cells, cache_hits=GEOMETRY_CACHE.hits)
 
-            extractSkinFilter.SetInputData(self.grid)
-            extractSkinFilter.Update()
-            polydata = extractSkinFilter.GetOutput()
+            # Colored by looking up the grid cell behind each skin polygon,
+            # switching property leaves the geometry resident on the client
+            with span("recolor", property_name):
+                scalars = self.properties.sample(
+                    property_name, polydata.cell_data[CELL_IDS_NAME]
+                )
+                arrays = {**arrays, "scalars": scalars}
+                hashes = {**hashes, "scalars": array_digest(scalars)}
 
-            time_it("CREATE POLYDATA")
-
-            TIMER.lap_s()
-            mesh_state = to_mesh_state(polydata, field_to_keep="scalar")
-            time_it("TO MESH STATE")
-            return mesh_state, nclicks
+            # Only arrays that changed since the last update are sent,
+            # a flip leaves polys and scalars resident on the client
+            with span("to_mesh_state", self.transport) as record:
+                outputs, hashes = delta_update(
+                    arrays,
+                    ["points", "polys", "scalars"],
+                    previous_hashes,
+                    transport=self.transport,
+                    float32=self.float32,
+                    hashes=hashes,
+                )
+                record["nbytes"] = delta_nbytes(outputs)
+            return (
+                *outputs,
+                hashes,
+                self.properties.data_range(property_name),
+                nclicks,
+                time.time(),
+            )
 
         @callback(
             Output("dummy", "data"),
-            Input("vtk-mesh", "state"),
+            Input("sent-at", "data"),
         )
-        def _update(_):
-            time_it("Package delivered")
+        def _delivered(sent_at):
+            # Serialization, transfer and client side deserialization
+            if sent_at is not None:
+                record_duration("deliver", time.time() - sent_at)
             return no_update
 
+    @span("extract_skin")
+    def _extract_skin(self, grid=None):
+        grid = self.grid if grid is None else grid
+        if not grid.IsA("vtkExplicitStructuredGrid"):
+            raise TypeError(
+                f"Cannot extract skin of {grid.GetClassName()}, "
+                "expected vtkExplicitStructuredGrid"
+            )
+        LOGGER.debug("Extracting skin of %d grid cells", grid.GetNumberOfCells())
+        # Same skin as vtkExplicitStructuredGridSurfaceFilter, vectorized
+        return extract_skin(grid)
+
+    def _extent(self, i_range, j_range, k_range):
+        """Cell index box (i0, i1, j0, j1, k0, k1), None for the whole grid"""
+        extent = []
+        for index_range, count in zip((i_range, j_range, k_range), self.shape):
+            start, end = index_range or (0, count - 1)
+            extent.extend([max(int(start), 0), min(int(end), count - 1)])
+        full = tuple(v for count in self.shape for v in (0, count - 1))
+        return None if tuple(extent) == full else tuple(extent)
+
+    def _extract_box_skin(self, extent):
+        """Skin of the cells in the index box, with their grid cell ids.
+
+        The box is cut out of the grid by its structured extent, so only
+        the cells inside it are visited.
+        """
+        i0, i1, j0, j1, k0, k1 = extent
+        with span("crop", str(extent)) as record:
+            box = vtkExplicitStructuredGrid()
+            # Point extent, one more point than cells along each axis
+            box.Crop(self.grid, [i0, i1 + 1, j0, j1 + 1, k0, k1 + 1], False)
+            box.ComputeFacesConnectivityFlagsArray()
+            record["cells"] = box.GetNumberOfCells()
+        polydata = self._extract_skin(box)
+
+        # Box cell ids to grid cell ids, both in F order
+        ni, nj, _nk = self.shape
+        bi, bj, bk = np.unravel_index(
+            polydata.cell_data[CELL_IDS_NAME],
+            (i1 - i0 + 1, j1 - j0 + 1, k1 - k0 + 1),
+            order="F",
+        )
+        polydata.cell_data[CELL_IDS_NAME] = (i0 + bi) + ni * (
+            (j0 + bj) + nj * (k0 + bk)
+        )
+        return polydata
+
+    def _get_skin(self, flip_z, level=0, extent=None):
+        # Boxes are skinned at full resolution, they are small and scrubbing
+        # through them reuses the skins cached per extent
+        key = GEOMETRY_CACHE.key(
+            self.vtu_file,
+            kind="skin",
+            flip_z=flip_z,
+            level=self.pyramid.fractions[level] if extent is None else 1.0,
+            extent=extent,
+        )
+        return GEOMETRY_CACHE.get_or_compute(
+            key, lambda: self._compute_skin(flip_z, level, extent)
+        )
+
+    def _compute_skin(self, flip_z, level, extent=None):
+        if flip_z:
+            # Reuse the unflipped skin instead of re-running the filter
+            polydata, _ = self._get_skin(False, level, extent)
+            with span("flip_z", cells=polydata.n_cells):
+                polydata = transform_polydata(
+                    polydata, flip_z=True, center=self.grid.center
+                )
+        elif extent is not None:
+            polydata = self._extract_box_skin(extent)
+        else:
+            polydata = self.pyramid.levels[level]
+
+        with span("hash_arrays") as record:
+            arrays = polydata_arrays(polydata, field_to_keep="scalar")
+            hashes = digest_arrays(arrays)
+            record["nbytes"] = estimate_nbytes(arrays)
+        return polydata, (arrays, hashes)
+
     @property
     def layout(self) -> html.Div:
         return html.Div(
@@ -90,7 +223,22 @@ class MeshApp(WebvizPluginABC):
                     children=[
                         dash_vtk.GeometryRepresentation(
                             id="vtk-representation",
-                            children=[dash_vtk.Mesh(id="vtk-mesh", state={})],
+                            children=[
+                                dash_vtk.PolyData(
+                                    id="vtk-polydata",
+                                    children=[
+                                        dash_vtk.CellData(
+                                            [
+                                                dash_vtk.DataArray(
+                                                    id="vtk-array",
+                                                    registration="setScalars",
+                                                    name="scalar",
+                                                )
+                                            ]
+                                        )
+                                    ],
+                                )
+                            ],
                             property={"edgeVisibility": True},
                         ),
                     ],
@@ -100,6 +248,37 @@ class MeshApp(WebvizPluginABC):
                     style={"fontSize": "10em"},
                     children="click",
                 ),
+                dcc.Dropdown(
+                    id="property",
+                    options=self.properties.names,
+                    value=self.properties.default,
+                    clearable=False,
+                ),
+                *[
+                    html.Div(
+                        [
+                            html.Label(f"{axis} range"),
+                            dcc.RangeSlider(
+                                id=f"{axis}-range",
+                                min=0,
+                                max=count - 1,
+                                step=1,
+                                value=[0, count - 1],
+                                marks=None,
+                                tooltip={"placement": "bottom"},
+                            ),
+                        ]
+                    )
+                    for axis, count in zip("ijk", self.shape)
+                ],
+                dcc.Interval(
+                    id="lod-interval",
+                    interval=500,
+                    max_intervals=len(self.lod_steps) - 1,
+                ),
+                dcc.Store(id="mesh-hashes", data={}),
+                dcc.Store(id="sent-at"),
                 dcc.Store(id="dummy"),
+                perf_panel(),
             ],
         )
@@ -0,0 +1,92 @@
+"""Incremental mesh updates.
+
+Meshes are split into separate arrays (points, polys/lines, scalars) which
+are sent to separate dash_vtk properties. A content hash per array is kept
+on the client in a `dcc.Store`, and only arrays whose hash changed are
+re-sent, leaving e.g. the topology resident on the client when only the
+point coordinates change.
+"""
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dash import no_update
+from vtk.util.numpy_support import vtk_to_numpy
+
+from mesh_transport import encode_array
+
+
+def array_digest(values: np.ndarray) -> str:
+    values = np.ascontiguousarray(values)
+    digest = hashlib.blake2b(values.view(np.uint8), digest_size=16)
+    digest.update(str(values.dtype).encode())
+    return digest.hexdigest()
+
+
+def polydata_arrays(
+    polydata, field_to_keep: Optional[str] = None, prefix: str = ""
+) -> Dict[str, np.ndarray]:
+    """Split polydata into the arrays sent to a dash_vtk.PolyData.
+
+    Keys are `points`, `polys`, `lines` (only if present) and `scalars`
+    (if `field_to_keep` is given and the polydata has it, e.g. box skins
+    and LOD levels may not), prepended with `prefix`.
+    """
+    arrays = {f"{prefix}points": vtk_to_numpy(polydata.GetPoints().GetData()).ravel()}
+    for name, cells in (("polys", polydata.GetPolys()), ("lines", polydata.GetLines())):
+        if cells.GetNumberOfCells():
+            arrays[f"{prefix}{name}"] = vtk_to_numpy(cells.GetData())
+    if field_to_keep is not None:
+        array = polydata.GetCellData().GetArray(field_to_keep)
+        if array is None:
+            array = polydata.GetPointData().GetArray(field_to_keep)
+        if array is not None:
+            arrays[f"{prefix}scalars"] = vtk_to_numpy(array)
+    return arrays
+
+
+def digest_arrays(arrays: Dict[str, np.ndarray]) -> Dict[str, str]:
+    return {name: array_digest(values) for name, values in arrays.items()}
+
+
+def delta_update(
+    arrays: Dict[str, np.ndarray],
+    names: Sequence[str],
+    previous_hashes: Optional[Dict[str, str]],
+    transport: str = "json",
+    float32: bool = False,
+    hashes: Optional[Dict[str, str]] = None,
+    encoded: bool = False,
+) -> Tuple[List, Dict[str, str]]:
+    """Return one output per name in `names`, `no_update` for unchanged arrays.
+
+    `previous_hashes` is the content of the client side hash store, and the
+    returned hashes should be written back to it. Precomputed `hashes` can
+    be passed to avoid rehashing cached arrays. With `encoded`, `arrays`
+    are cached outputs of `encode_array` and are sent as they are, the
+    `hashes` of the original arrays must then be given.
+    """
+    previous_hashes = previous_hashes or {}
+    hashes = hashes if hashes is not None else digest_arrays(arrays)
+    outputs = []
+    for name in names:
+        if name not in arrays:
+            outputs.append([])
+        elif previous_hashes.get(name) == hashes[name]:
+            outputs.append(no_update)
+        elif encoded:
+            outputs.append(arrays[name])
+        else:
+            outputs.append(encode_array(arrays[name], transport, float32))
+    return outputs, hashes
+
+
+def delta_nbytes(outputs: List) -> int:
+    """Size of the arrays actually sent, for logging"""
+    return sum(
+        output.nbytes
+        if isinstance(output, np.ndarray)
+        else len(output.get("bvals", ""))
+        for output in outputs
+        if output is not no_update and not isinstance(output, list)
+    )
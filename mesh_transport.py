@@ -0,0 +1,138 @@
+"""Encoding of mesh geometry sent to dash_vtk components.
+
+Two transport modes are supported, so they can be benchmarked against
+each other:
+
+- "json": arrays are sent as plain JSON lists (`dash_vtk.utils.to_mesh_state`).
+- "binary": arrays are sent as base64 encoded typed buffers
+  (`{"bvals": ..., "dtype": ..., "shape": ...}`) which dash_vtk decodes
+  directly into JavaScript typed arrays.
+
+Compression of the buffers is left to the HTTP layer (`Dash(compress=True)`),
+as the browser inflates gzip responses natively.
+"""
+import base64
+from typing import Any, Optional
+
+import numpy as np
+from vtk.util.numpy_support import vtk_to_numpy
+import dash_vtk.utils
+from plotly.io.json import to_json_plotly
+from vtkmodules.vtkFiltersGeometry import vtkGeometryFilter
+
+TRANSPORT_MODES = ("json", "binary")
+
+# vtk.js typed array names per numpy dtype
+TYPED_ARRAYS = {
+    "int8": "Int8Array",
+    "uint8": "Uint8Array",
+    "int16": "Int16Array",
+    "uint16": "Uint16Array",
+    "int32": "Int32Array",
+    "uint32": "Uint32Array",
+    "float32": "Float32Array",
+    "float64": "Float64Array",
+}
+
+
+def _check_mode(transport: str) -> None:
+    if transport not in TRANSPORT_MODES:
+        raise ValueError(
+            f"Unknown transport {transport!r}, expected one of {TRANSPORT_MODES}"
+        )
+
+
+def _to_typed(values: np.ndarray, float32: bool) -> np.ndarray:
+    """Cast to a dtype that has a JavaScript typed array counterpart"""
+    if values.dtype.kind == "f" and (float32 or values.dtype != np.float64):
+        return values.astype(np.float32, copy=False)
+    if values.dtype.kind in "iu" and values.dtype.itemsize == 8:
+        # No 64-bit typed arrays in vtk.js, connectivity always fits in 32 bits
+        if values.size and values.max() > np.iinfo(np.int32).max:
+            raise ValueError("Integer array does not fit in a 32-bit typed array")
+        return values.astype(np.int32)
+    if values.dtype == bool:
+        return values.astype(np.uint8)
+    return values
+
+
+def encode_array(values: Any, transport: str = "json", float32: bool = False) -> Any:
+    """Encode a numpy array for a dash_vtk `values`/`points`/`polys` property.
+
+    `float32` down-casts floating point arrays, and only applies to the
+    binary transport (JSON has no notion of precision).
+    """
+    _check_mode(transport)
+    values = np.asarray(values)
+    if transport == "json":
+        return values
+    values = np.ascontiguousarray(_to_typed(values.ravel(), float32))
+    return {
+        "bvals": base64.b64encode(memoryview(values)).decode("ascii"),
+        "dtype": str(values.dtype),
+        "shape": values.shape,
+    }
+
+
+def _binary_mesh_state(dataset: Any, field_to_keep: Optional[str], float32: bool):
+    if dataset.IsA("vtkPolyData"):
+        polydata = dataset
+    else:
+        geometry_filter = vtkGeometryFilter()
+        geometry_filter.SetInputData(dataset)
+        geometry_filter.Update()
+        polydata = geometry_filter.GetOutput()
+
+    mesh = {
+        "points": encode_array(
+            vtk_to_numpy(polydata.GetPoints().GetData()), "binary", float32
+        )
+    }
+    for name, cells in (
+        ("verts", polydata.GetVerts()),
+        ("lines", polydata.GetLines()),
+        ("polys", polydata.GetPolys()),
+        ("strips", polydata.GetStrips()),
+    ):
+        if cells.GetNumberOfCells():
+            mesh[name] = encode_array(vtk_to_numpy(cells.GetData()), "binary")
+    state = {"mesh": mesh}
+
+    if field_to_keep is not None:
+        for location, data in (
+            ("CellData", polydata.GetCellData()),
+            ("PointData", polydata.GetPointData()),
+        ):
+            array = data.GetArray(field_to_keep)
+            if array is None:
+                continue
+            values = _to_typed(vtk_to_numpy(array), float32)
+            state["field"] = {
+                "name": field_to_keep,
+                "location": location,
+                "registration": "setScalars",
+                "type": TYPED_ARRAYS[str(values.dtype)],
+                "numberOfComponents": array.GetNumberOfComponents(),
+                "dataRange": list(array.GetRange(-1)),
+                "values": encode_array(values, "binary"),
+            }
+            break
+    return state
+
+
+def to_mesh_state(
+    dataset: Any,
+    field_to_keep: Optional[str] = None,
+    transport: str = "json",
+    float32: bool = False,
+) -> dict:
+    """Drop-in for `dash_vtk.utils.to_mesh_state` with a selectable transport"""
+    _check_mode(transport)
+    if transport == "json":
+        return dash_vtk.utils.to_mesh_state(dataset, field_to_keep=field_to_keep)
+    return _binary_mesh_state(dataset, field_to_keep, float32)
+
+
+def payload_nbytes(obj: Any) -> int:
+    """Size in bytes of `obj` once JSON encoded by Dash"""
+    return len(to_json_plotly(obj))
@@ -0,0 +1,217 @@
+"""Per-stage performance instrumentation.
+
+Timings are recorded as spans, measured locally with `time.perf_counter`
+so concurrent callbacks never share laps:
+
+    with span("skin", cells=grid.n_cells) as record:
+        polydata = extract_skin(grid)
+        record["nbytes"] = estimate_nbytes(polydata)
+
+`span` also works as a decorator. Spans are labelled by stage (e.g.
+"read", "skin", "to_mesh_state", "slice", "serialize") and tagged with the
+id of the request they belong to (see `request`), the thread, and
+optionally payload size in bytes and number of cells.
+
+Records are kept in rolling windows per stage for p50/p95 statistics
+(shown by `perf_panel.perf_panel`), and appended to a JSON lines log when
+`PERF_LOG` is set or `RECORDER.configure(jsonl_path=...)` is called.
+
+Spans recorded in other processes, such as Dash background callback
+workers, only reach this process through that log: `RECORDER.ingest_log()`
+adds the records other processes appended since the last call.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+# Number of records per stage used for rolling statistics
+WINDOW = 500
+
+_context = threading.local()
+
+
+def estimate_nbytes(obj: Any) -> int:
+    """Rough size in bytes of numpy arrays, vtk objects and mesh states"""
+    if obj is None:
+        return 0
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if isinstance(obj, (bytes, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(estimate_nbytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        if obj and isinstance(obj[0], (int, float)):
+            # Flat lists of numbers, as in JSON mesh states, can be long
+            return 8 * len(obj)
+        return sum(estimate_nbytes(value) for value in obj)
+    if isinstance(obj, (int, float)):
+        return 8
+    if hasattr(obj, "GetActualMemorySize"):
+        # VTK reports kibibytes
+        return obj.GetActualMemorySize() * 1024
+    return 0
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class PerfRecorder:
+    """Thread safe sink for span records"""
+
+    def __init__(self, window: int = WINDOW, echo: bool = True) -> None:
+        self.echo = echo
+        self.jsonl_path: Optional[Path] = None
+        self._windows: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self._log_offset = 0
+        if os.environ.get("PERF_LOG"):
+            self.configure(jsonl_path=os.environ["PERF_LOG"])
+
+    def configure(
+        self, jsonl_path: Optional[str] = None, echo: Optional[bool] = None
+    ) -> None:
+        if jsonl_path is not None:
+            self.jsonl_path = Path(jsonl_path)
+            # Only records appended from now on are ingested
+            try:
+                self._log_offset = self.jsonl_path.stat().st_size
+            except OSError:
+                self._log_offset = 0
+        if echo is not None:
+            self.echo = echo
+
+    def record(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._windows[record["stage"]].append(record)
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, "a") as log:
+                    log.write(json.dumps(record, default=str) + "\n")
+        if self.echo:
+            detail = f" {record['detail']}" if record.get("detail") else ""
+            size = f" ({record['nbytes']} bytes)" if record.get("nbytes") else ""
+            print(f"TIME: [{record['stage']}]{detail} {record['seconds']:.2f}s{size}")
+
+    def ingest_log(self) -> int:
+        """Add records appended to the log by other processes since last call.
+
+        Returns the number of records added. Records of this process are
+        already in the windows and are skipped.
+        """
+        if self.jsonl_path is None:
+            return 0
+        with self._lock:
+            try:
+                with open(self.jsonl_path, "rb") as log:
+                    log.seek(self._log_offset)
+                    data = log.read()
+            except OSError:
+                return 0
+            # A line still being written is left for the next call
+            data = data[: data.rfind(b"\n") + 1]
+            self._log_offset += len(data)
+            added = 0
+            pid = os.getpid()
+            for line in data.splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("pid") == pid or "stage" not in record:
+                    continue
+                self._windows[record["stage"]].append(record)
+                added += 1
+        return added
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Rolling count, p50 and p95 (seconds) and mean bytes per stage"""
+        with self._lock:
+            windows = {stage: list(records) for stage, records in self._windows.items()}
+        stats = {}
+        for stage, records in windows.items():
+            seconds = [r["seconds"] for r in records]
+            nbytes = [r["nbytes"] for r in records if r.get("nbytes") is not None]
+            stats[stage] = {
+                "count": len(records),
+                "p50": _percentile(seconds, 0.50),
+                "p95": _percentile(seconds, 0.95),
+                "last": seconds[-1],
+                "mean_nbytes": sum(nbytes) / len(nbytes) if nbytes else None,
+            }
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._windows.clear()
+
+
+RECORDER = PerfRecorder()
+
+
+def current_request() -> Optional[str]:
+    return getattr(_context, "request_id", None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def request(name: str = "", request_id: Optional[str] = None) -> Iterator[str]:
+    """Tag all spans in this thread with a request id, fresh by default.
+
+    Use as `with request("intersection"):` or as a decorator on callbacks.
+    """
+    previous = current_request(), getattr(_context, "request_name", None)
+    request_id = request_id or new_request_id()
+    _context.request_id, _context.request_name = request_id, name
+    try:
+        yield request_id
+    finally:
+        _context.request_id, _context.request_name = previous
+
+
+def _new_record(stage: str, detail: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "stage": stage,
+        "detail": detail,
+        "request_id": current_request(),
+        "request": getattr(_context, "request_name", None),
+        "thread": threading.current_thread().name,
+        "pid": os.getpid(),
+        "time": time.time(),
+        **fields,
+    }
+
+
+@contextmanager
+def span(stage: str, detail: str = "", **fields: Any) -> Iterator[Dict[str, Any]]:
+    """Time the enclosed block as `stage`.
+
+    The yielded record can be updated inside the block, e.g. with
+    `nbytes` or `cells` once they are known.
+    """
+    record = _new_record(stage, detail, fields)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        RECORDER.record(record)
+
+
+def record_duration(
+    stage: str, seconds: float, detail: str = "", **fields: Any
+) -> None:
+    """Record a duration measured elsewhere, e.g. a client round trip"""
+    record = _new_record(stage, detail, fields)
+    record["seconds"] = seconds
+    RECORDER.record(record)
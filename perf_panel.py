@@ -0,0 +1,62 @@
+"""Dash panel with rolling per-stage timings from `perf.RECORDER`.
+
+Timings of background callbacks are recorded in the worker processes and
+only shown when `PERF_LOG` is set, read back from the shared log.
+"""
+from dash import html, dcc, callback, Input, Output
+
+from perf import RECORDER
+
+_REGISTERED = False
+
+
+def _register_callback() -> None:
+    global _REGISTERED
+    if _REGISTERED:
+        return
+    _REGISTERED = True
+
+    @callback(
+        Output("perf-table", "children"),
+        Input("perf-interval", "n_intervals"),
+    )
+    def _update_perf_table(_n_intervals):
+        RECORDER.ingest_log()
+        header = html.Tr(
+            [html.Th(name) for name in ("stage", "n", "p50", "p95", "last", "bytes")]
+        )
+        rows = [
+            html.Tr(
+                [
+                    html.Td(stage),
+                    html.Td(stats["count"]),
+                    html.Td(f"{stats['p50'] * 1000:.1f} ms"),
+                    html.Td(f"{stats['p95'] * 1000:.1f} ms"),
+                    html.Td(f"{stats['last'] * 1000:.1f} ms"),
+                    html.Td(
+                        f"{stats['mean_nbytes'] / 1e6:.2f} MB"
+                        if stats["mean_nbytes"] is not None
+                        else ""
+                    ),
+                ]
+            )
+            for stage, stats in sorted(RECORDER.stats().items())
+        ]
+        return [header, *rows]
+
+
+def perf_panel(interval_ms: int = 2000) -> html.Div:
+    """Table of p50/p95 per stage, refreshed every `interval_ms`"""
+    _register_callback()
+    return html.Div(
+        style={"fontFamily": "monospace", "fontSize": "0.8em"},
+        children=[
+            dcc.Interval(id="perf-interval", interval=interval_ms),
+            html.Table(id="perf-table"),
+            html.Div(
+                "Set PERF_LOG to include timings of background callbacks"
+                if RECORDER.jsonl_path is None
+                else ""
+            ),
+        ],
+    )
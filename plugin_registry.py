@@ -0,0 +1,136 @@
+"""Lazy plugin registry and warm-up for run_app.py.
+
+Importing a plugin module pulls in vtk, pyvista, dash_vtk and (for
+surfaces) xtgeo, and constructing the plugin reads and prepares its data.
+Plugins are therefore registered by module and class name, and only the
+selected one is imported. `WarmUp` imports and constructs it in a
+background thread, so the server accepts requests right away and serves
+a placeholder page, reloading itself, until the plugin is ready.
+
+Dash registers the callbacks of a plugin (made with `dash.callback` in
+its `__init__`) on the first request it handles, so Dash must not see any
+request before the plugin is constructed. The placeholder is served from
+a `before_request` hook on the Flask server, registered before the Dash
+app is created so that it runs ahead of the Dash hooks.
+
+Import, construction and total startup times are recorded as spans
+("import", "construct", "startup").
+"""
+import importlib
+import logging
+import threading
+import time
+import traceback
+from html import escape
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import request
+
+from perf import record_duration, span
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# Plugin name -> (module, class)
+PLUGINS: Dict[str, Tuple[str, str]] = {
+    "polydata": ("polydata_app_class", "PolyDataApp"),
+    "mesh": ("mesh_app_class", "MeshApp"),
+    "surface": ("surface_class", "SurfaceApp"),
+    "intersection": ("intersection_class", "IntersectionApp"),
+}
+
+# Seconds between reloads of the placeholder page
+PLACEHOLDER_REFRESH = 1
+
+PLACEHOLDER = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+{refresh}<title>Starting {name}</title>
+</head>
+<body style="font-family: sans-serif; margin: 2em">
+<p>{message}</p>
+</body>
+</html>
+"""
+
+
+def load_plugin_class(name: str) -> type:
+    """Import the module of plugin `name` and return its class"""
+    if name not in PLUGINS:
+        raise ValueError(f"Unknown plugin {name!r}, use one of {list(PLUGINS)}")
+    module_name, class_name = PLUGINS[name]
+    with span("import", module_name):
+        module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+class WarmUp:
+    """Constructs a plugin in a background thread, serving a placeholder meanwhile.
+
+    `kwargs` returns the constructor arguments and is called in the
+    background thread, so heavy setup there (e.g. a background callback
+    manager) is deferred too. `on_ready` is called with the plugin once it
+    is constructed, before requests reach Dash, e.g. to set the layout.
+    """
+
+    def __init__(
+        self,
+        server,
+        name: str,
+        kwargs: Callable[[], Dict[str, Any]],
+        on_ready: Callable[[Any], None],
+        started_at: Optional[float] = None,
+    ) -> None:
+        self.name = name
+        self.kwargs = kwargs
+        self.on_ready = on_ready
+        # perf_counter at process start, for the total startup time
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.plugin = None
+        self.error: Optional[str] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        server.before_request(self._placeholder)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def _placeholder(self):
+        if self.ready and self.error is None:
+            return None
+        if request.path != "/":
+            # Dash endpoints are unavailable until the plugin is registered
+            return "Starting up", 503, {"Retry-After": str(PLACEHOLDER_REFRESH)}
+        if self.error is not None:
+            refresh = ""
+            message = f"Could not start {self.name}:<pre>{escape(self.error)}</pre>"
+        else:
+            refresh = f'<meta http-equiv="refresh" content="{PLACEHOLDER_REFRESH}">\n'
+            seconds = time.perf_counter() - self.started_at
+            message = f"Preparing {self.name}... ({seconds:.0f}s)"
+        return PLACEHOLDER.format(refresh=refresh, name=self.name, message=message)
+
+    def _run(self) -> None:
+        try:
+            plugin_class = load_plugin_class(self.name)
+            with span("construct", self.name):
+                self.plugin = plugin_class(**self.kwargs())
+            self.on_ready(self.plugin)
+        except Exception:
+            self.error = traceback.format_exc()
+            LOGGER.error("Could not start plugin %s:\n%s", self.name, self.error)
+        else:
+            record_duration("startup", time.perf_counter() - self.started_at, self.name)
+        finally:
+            self._ready.set()
+
+    def start(self) -> "WarmUp":
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the plugin is constructed (or failed)"""
+        return self._ready.wait(timeout)
@@ -1,61 +1,110 @@
 import logging
+import time
 
 from vtk.util.numpy_support import vtk_to_numpy
 import pyvista
 from dash import Dash, html, dcc, callback, Input, Output, no_update
 import dash_vtk
 from webviz_config._plugin_abc import WebvizPluginABC
-from webviz_subsurface._utils.perf_timer import PerfTimer
 
-TIMER = PerfTimer()
+from geometry_cache import GEOMETRY_CACHE, transform_polydata
+from mesh_transport import encode_array
+from perf import span, request, record_duration, estimate_nbytes
+from perf_panel import perf_panel
+
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
 
-def time_it(text: str) -> str:
-    return print(f"TIME: {text} {TIMER.lap_s():.2f}s")
-
-
 class PolyDataApp(WebvizPluginABC):
     """Testing vtk performance"""
 
     def __init__(
         self,
         vtu_file,
+        transport="json",
+        float32=False,
     ) -> None:
         super().__init__(self)
-        time_it("Initializing app")
 
-        self.grid = pyvista.read(vtu_file)
-        time_it("Read unstructured grid")
+        self.vtu_file = vtu_file
+        self.transport = transport
+        self.float32 = float32
+        with span("read", vtu_file) as record:
+            self.grid = pyvista.read(vtu_file)
+            record["cells"] = self.grid.n_cells
 
         @callback(
             Output("vtk-polydata", "polys"),
             Output("vtk-polydata", "points"),
             Output("vtk-array", "values"),
             Output("vtk-view", "triggerResetCamera"),
+            Output("sent-at", "data"),
             Input("click", "n_clicks"),
         )
+        @request("polydata")
         def _update(nclicks):
-            TIMER.lap_s()
-            # Flipping z to trigger a change
-            self.grid.flip_z(inplace=True)
-            polydata = self.grid.extract_geometry()
-            time_it("EXTRACT GEOMETRY")
-            polys = vtk_to_numpy(polydata.GetPolys().GetData())
-            points = polydata.points.ravel()
-            scalar = polydata["scalar"]
-            TIMER.lap_s()
-            return polys, points, scalar, nclicks
+            # Flipping z to trigger a change. The flip follows the clicks,
+            # so all workers agree on it.
+            with span("geometry") as record:
+                polydata, arrays = self._get_geometry(flip_z=(nclicks or 0) % 2 == 0)
+                record.update(
+                    cells=polydata.n_cells,
+                    nbytes=estimate_nbytes(arrays),
+                    cache_hits=GEOMETRY_CACHE.hits,
+                )
+            return (
+                arrays["polys"],
+                arrays["points"],
+                arrays["scalar"],
+                nclicks,
+                time.time(),
+            )
 
         @callback(
             Output("dummy", "data"),
-            Input("vtk-polydata", "polys"),
+            Input("sent-at", "data"),
         )
-        def _update(_):
-            time_it("Package delivered")
+        def _delivered(sent_at):
+            if sent_at is not None:
+                record_duration("deliver", time.time() - sent_at)
             return no_update
 
+    def _get_geometry(self, flip_z):
+        key = GEOMETRY_CACHE.key(
+            self.vtu_file,
+            kind="geometry",
+            flip_z=flip_z,
+            transport=self.transport,
+            float32=self.float32,
+        )
+        return GEOMETRY_CACHE.get_or_compute(
+            key, lambda: self._compute_geometry(flip_z)
+        )
+
+    def _compute_geometry(self, flip_z):
+        if flip_z:
+            polydata, _ = self._get_geometry(flip_z=False)
+            polydata = transform_polydata(
+                polydata, flip_z=True, center=self.grid.center
+            )
+        else:
+            with span("extract_geometry", cells=self.grid.n_cells):
+                polydata = self.grid.extract_geometry()
+        with span("to_mesh_state", self.transport):
+            arrays = {
+                "polys": encode_array(
+                    vtk_to_numpy(polydata.GetPolys().GetData()), self.transport
+                ),
+                "points": encode_array(
+                    polydata.points.ravel(), self.transport, self.float32
+                ),
+                "scalar": encode_array(
+                    polydata["scalar"], self.transport, self.float32
+                ),
+            }
+        return polydata, arrays
+
     @property
     def layout(self) -> html.Div:
         return html.Div(
@@ -91,6 +140,8 @@ class PolyDataApp(WebvizPluginABC):
                     style={"fontSize": "10em"},
                     children="click",
                 ),
+                dcc.Store(id="sent-at"),
                 dcc.Store(id="dummy"),
+                perf_panel(),
             ],
         )
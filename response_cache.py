@@ -0,0 +1,152 @@
+"""Cache of callback responses, in memory and optionally on disk.
+
+Users come back to the same sections, redrawing a favourite line or
+opening the same well, and every return used to recompute the section,
+its camera and the encoded mesh state. Responses are cached by content:
+the key holds what the response depends on, e.g. the grid file, the
+property and the polyline normalized by `normalize_polyline`.
+
+The memory tier is the LRU of `GeometryCache`. The disk tier stores each
+response as a pickle named by the digest of its key, written atomically,
+so it is shared by all workers and background processes of the app (which
+do not share memory) and survives restarts. Files are evicted oldest
+first above `max_disk_bytes`.
+"""
+import hashlib
+import logging
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Optional, Tuple, Union
+
+import numpy as np
+
+from geometry_cache import DEFAULT_MAX_BYTES, GeometryCache
+from mesh_delta import array_digest
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# Default size of the disk tier
+DEFAULT_MAX_DISK_BYTES = 1024**3
+
+# Polyline vertices closer than this (in map units) give the same key
+DEFAULT_TOLERANCE = 1.0
+
+# Bumped when the layout of cached responses changes
+CACHE_VERSION = 2
+
+
+def normalize_polyline(
+    polyline: np.ndarray, tolerance: float = DEFAULT_TOLERANCE
+) -> np.ndarray:
+    """XY vertices quantized to `tolerance`, without repeated vertices.
+
+    Sections are vertical, so z (where the polyline was clicked on the
+    skin) does not change them and is dropped.
+    """
+    xy = np.atleast_2d(np.asarray(polyline, dtype=float))[:, :2]
+    quantized = np.round(xy / tolerance).astype(np.int64)
+    repeated = np.r_[False, (np.diff(quantized, axis=0) == 0).all(axis=1)]
+    return quantized[~repeated]
+
+
+def polyline_digest(polyline: np.ndarray, tolerance: float = DEFAULT_TOLERANCE) -> str:
+    return array_digest(normalize_polyline(polyline, tolerance))
+
+
+class ResponseCache(GeometryCache):
+    """Responses by key in an in-memory LRU, backed by an optional disk tier.
+
+    Keys are tuples as built by `GeometryCache.key`. Values are any
+    picklable response.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Union[str, Path]] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ) -> None:
+        super().__init__(max_bytes)
+        self.directory = Path(directory) if directory is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: tuple) -> Path:
+        digest = hashlib.blake2b(
+            repr((CACHE_VERSION, key)).encode(), digest_size=16
+        ).hexdigest()
+        return self.directory / f"{digest}.pkl"
+
+    def _read(self, key: tuple) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cached:
+                stored_key, value = pickle.load(cached)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if stored_key != key:
+            return None
+        # Used files are kept longest
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _write(self, key: tuple, value: Any) -> None:
+        path = self._path(key)
+        partial = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+        try:
+            with open(partial, "wb") as cached:
+                pickle.dump((key, value), cached, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(partial, path)
+        except OSError as error:
+            LOGGER.debug("Could not write response to %s: %s", path, error)
+            partial.unlink(missing_ok=True)
+            return
+        self._evict_files()
+
+    def _evict_files(self) -> None:
+        files = []
+        for path in self.directory.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files, key=lambda item: item[0]):
+            if total <= self.max_disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def lookup(self, key: tuple) -> Tuple[Optional[Any], Optional[str]]:
+        """Cached value and the tier it came from ("memory" or "disk")"""
+        cached = self.get(key)
+        if cached is not None:
+            return cached[1], "memory"
+        if self.directory is None:
+            return None, None
+        value = self._read(key)
+        if value is None:
+            return None, None
+        with self._lock:
+            self.disk_hits += 1
+        super().put(key, None, value)
+        return value, "disk"
+
+    def store(self, key: tuple, value: Any) -> None:
+        super().put(key, None, value)
+        if self.directory is not None:
+            self._write(key, value)
+
+    def clear(self) -> None:
+        super().clear()
+        if self.directory is not None:
+            for path in self.directory.glob("*.pkl"):
+                path.unlink(missing_ok=True)
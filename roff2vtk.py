@@ -1,70 +1,547 @@
+"""Convert grids and grid properties on Roxar open file format (ROFF) to VTK.
+
+Geogrid is the originally constructed grid, used for geomodelling.
+Eclgrid is the upscaled grid used for simulation.
+
+Single conversion, adding one cell array per property:
+
+    python roff2vtk.py ./data/eclgrid.roff -p ./data/eclgrid--pressure.roff
+
+Batch conversion of many grid/property sets in a process pool, from a
+JSON file with a list of {"grid": ..., "properties": [...]} entries:
+
+    python roff2vtk.py --batch ensemble.json --workers 8
+
+Further properties, e.g. pressure per time step, can be added to the
+.npy grid cache of a converted grid without rewriting the .vtu. They are
+read by the apps only when selected:
+
+    python roff2vtk.py --append ./data/eclgrid-70729.vtu -p ./data/eclgrid--pressure_20200101.roff
+
+Large grids can be written with faster compression, or partitioned into
+pieces of k-layers or i/j column blocks in a .pvtu, so only the pieces
+needed are read:
+
+    python roff2vtk.py ./data/geogrid.roff -p ./data/geogrid--phit.roff --compression lz4 --partition k --partition-size 10
+
+A JSON timing report per stage is written with --report.
+"""
+import argparse
+import json
 import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
 import numpy as np
 import xtgeo
 import pyvista
 
-from webviz_subsurface._utils.perf_timer import PerfTimer
+from column_index import HIDDEN_CELL
+from grid_properties import SCALAR_NAME
+from grid_store import (
+    FACE_FLAGS_NAME,
+    cache_dir,
+    read_manifest,
+    read_unstructured_cache,
+    staged_cache,
+    write_cell_property,
+    write_grid_cache,
+    write_manifest,
+)
+from perf import span
+from vtu_output import COMPRESSORS, PARTITIONS, write_partitioned, write_vtu
 
 
-TIMER = PerfTimer()
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
 
-def time_it(text: str) -> str:
-    return print(f"TIME: {text} {TIMER.lap_s():.2f}s")
+class StageTimer:
+    """Collects perf spans per conversion stage for the timing report"""
+
+    def __init__(self, label: str = "") -> None:
+        self.label = label
+        self.stages: List[Dict] = []
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[Dict]:
+        with span(stage, self.label) as record:
+            yield record
+        self.stages.append(
+            {
+                key: record[key]
+                for key in ("stage", "seconds", "nbytes")
+                if key in record
+            }
+        )
+
+    def elapsed_s(self) -> float:
+        return time.perf_counter() - self.start
+
+
+def property_name(property_file: Path) -> str:
+    """'eclgrid--pressure.roff' -> 'pressure'"""
+    return property_file.stem.split("--")[-1]
+
+
+def _refined_layers(dims, corners, refine: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """Parent layer and (2ni, 2nj, 2, 3) top/bottom corners of each sublayer.
+
+    Works directly on the VTK corner array, the (2ni, 2nj, 2nk) F-ordered
+    grid of cell corners expected by `pyvista.ExplicitStructuredGrid`.
+    Sublayer corners are interpolated linearly between the top and bottom
+    corners on the same pillar, which is what `refine_vertically` does.
+    """
+    ni, nj, nk = (int(d) - 1 for d in dims)
+    corners = np.reshape(corners, (2 * ni, 2 * nj, 2 * nk, 3), order="F")
+    for k in range(nk):
+        top, bottom = corners[:, :, 2 * k], corners[:, :, 2 * k + 1]
+        thickness = bottom - top
+        for sub in range(refine):
+            yield k, np.stack(
+                (
+                    top + thickness * (sub / refine),
+                    top + thickness * ((sub + 1) / refine),
+                ),
+                axis=2,
+            )
+
+
+def refine_vtk_geometries(dims, corners, inactive, refine: int):
+    """Split each layer (k) into `refine` equally thick sublayers, in memory.
+
+    `convert` streams the refined grid to the .npy cache with
+    `write_refined_cache` instead, this is the reference it is tested
+    against.
+    """
+    ni, nj, nk = (int(d) - 1 for d in dims)
+    refined = np.empty((2 * ni, 2 * nj, 2 * nk * refine, 3), order="F")
+    for layer, (_k, layer_corners) in enumerate(_refined_layers(dims, corners, refine)):
+        refined[:, :, 2 * layer : 2 * layer + 2] = layer_corners
+
+    # Cell c = ij + ni * nj * k becomes ij + ni * nj * (k * refine + sub)
+    columns, layers = np.divmod(np.asarray(inactive), ni * nj)[::-1]
+    inactive = (
+        columns[:, None] + ni * nj * (layers[:, None] * refine + np.arange(refine))
+    ).ravel()
+
+    refined_dims = (ni + 1, nj + 1, nk * refine + 1)
+    return refined_dims, refined.reshape(-1, 3, order="F"), np.sort(inactive)
+
+
+def refine_cell_values(values: np.ndarray, dims, refine: int) -> np.ndarray:
+    """Repeat F-ordered cell values for each sublayer of their parent layer"""
+    ni, nj, _nk = (int(d) - 1 for d in dims)
+    return np.repeat(values.reshape(-1, ni * nj), refine, axis=0).ravel()
+
+
+def _layer_points(layer_corners: np.ndarray) -> np.ndarray:
+    """Points of the cells of one layer, 8 per cell, in cell order.
+
+    `pyvista.ExplicitStructuredGrid(dims, corners)` gives each cell its
+    own 8 points, the four corners at k then at k + 1, counter-clockwise
+    from (i, j), in the F order of the cells. No points are merged.
+    """
+    faces = [
+        layer_corners[di::2, dj::2, side]
+        for side in (0, 1)
+        for di, dj in ((0, 0), (1, 0), (1, 1), (0, 1))
+    ]
+    return np.stack(faces, axis=2).transpose(1, 0, 2, 3).reshape(-1, 3)
+
+
+def write_refined_cache(
+    dims,
+    corners,
+    inactive,
+    scalars: Dict[str, np.ndarray],
+    refine: int,
+    directory: Path,
+) -> Tuple[int, int, int]:
+    """Write the refined, z-flipped grid as a .npy grid cache, layer by layer.
+
+    Gives the cache `write_grid_cache` writes for the grid built by
+    `convert` from `refine_vtk_geometries`, with the BLOCK_I/J/K arrays of
+    its .vtu added. Each refined layer is interpolated and written to
+    memory-mapped files, so the refined grid is never held in memory, and
+    the .vtu is written from the mapped cache. Returns the refined
+    dimensions. The manifest has no source, set it with `write_manifest`
+    once the .vtu is written.
+    """
+    ni, nj, nk = (int(d) - 1 for d in dims)
+    layer_size = ni * nj
+    ncells = layer_size * nk * refine
+    hidden = np.zeros(layer_size * nk, dtype=bool)
+    hidden[np.asarray(inactive, dtype=np.int64)] = True
+
+    # Cell arrays in the order of the .vtu written by `convert`
+    cell_arrays = {
+        "BLOCK_I": np.int32,
+        "BLOCK_J": np.int32,
+        "BLOCK_K": np.int32,
+        FACE_FLAGS_NAME: np.uint8,
+        "vtkGhostType": np.uint8,
+    }
+    for index, (name, values) in enumerate(scalars.items()):
+        cell_arrays[name] = values.dtype
+        if index == 0:
+            cell_arrays[SCALAR_NAME] = values.dtype
+    layer_values = {
+        name: values.reshape(nk, layer_size) for name, values in scalars.items()
+    }
+    if scalars:
+        layer_values[SCALAR_NAME] = next(iter(layer_values.values()))
+
+    with staged_cache(directory) as staging:
+
+        def _open(name, dtype, shape):
+            return np.lib.format.open_memmap(
+                staging / f"{name}.npy", mode="w+", dtype=dtype, shape=shape
+            )
+
+        points = _open("points", np.float64, (8 * ncells, 3))
+        connectivity = _open("connectivity", np.int64, (8 * ncells,))
+        offsets = _open("offsets", np.int64, (ncells + 1,))
+        arrays = {
+            name: _open(f"cell-{name}", dtype, (ncells,))
+            for name, dtype in cell_arrays.items()
+        }
+        block_i = np.tile(np.arange(ni, dtype=np.int32), nj)
+        block_j = np.repeat(np.arange(nj, dtype=np.int32), ni)
+
+        zmin, zmax = np.inf, -np.inf
+        for layer, (k, layer_corners) in enumerate(
+            _refined_layers(dims, corners, refine)
+        ):
+            cells = slice(layer * layer_size, (layer + 1) * layer_size)
+            vertices = slice(8 * cells.start, 8 * cells.stop)
+            points[vertices] = _layer_points(layer_corners)
+            zmin = min(zmin, layer_corners[..., 2].min())
+            zmax = max(zmax, layer_corners[..., 2].max())
+            connectivity[vertices] = np.arange(vertices.start, vertices.stop)
+            offsets[cells.start + 1 : cells.stop + 1] = np.arange(
+                vertices.start + 8, vertices.stop + 1, 8
+            )
+            arrays["BLOCK_I"][cells] = block_i
+            arrays["BLOCK_J"][cells] = block_j
+            arrays["BLOCK_K"][cells] = layer
+            # Cells share no points, so no face is connected
+            arrays[FACE_FLAGS_NAME][cells] = 0
+            arrays["vtkGhostType"][cells] = np.where(
+                hidden[k * layer_size : (k + 1) * layer_size], HIDDEN_CELL, 0
+            )
+            for name, values in layer_values.items():
+                arrays[name][cells] = values[k]
+        offsets[0] = 0
+
+        # Flipped about the center of the bounds, as `flip_z` does
+        center = (zmin + zmax) / 2
+        for start in range(0, len(points), 8 * layer_size):
+            chunk = slice(start, start + 8 * layer_size)
+            points[chunk, 2] = 2 * center - points[chunk, 2]
+
+        for array in (points, connectivity, offsets, *arrays.values()):
+            array.flush()
+        refined_dims = (ni + 1, nj + 1, nk * refine + 1)
+        write_manifest(staging, refined_dims, list(cell_arrays))
+    return refined_dims
+
+
+def convert(
+    grid_file: Path,
+    property_files: Sequence[Path],
+    output_dir: Path = Path("data"),
+    refine: int = 1,
+    npy_cache: bool = False,
+    compression: str = "zlib",
+    partition: Optional[str] = None,
+    partition_size: int = 10,
+) -> Dict:
+    """Convert one grid with its properties, returning a timing report.
+
+    `refine` multiplies the number of layers (k), 1 is no refinement.
+    With `npy_cache` the memory-mappable grid cache read by the apps is
+    written next to the .vtu as well. With `partition` ("k" or "ij") a
+    .pvtu with pieces of `partition_size` layers or columns is written
+    instead of a single .vtu.
+    """
+    grid_file = Path(grid_file)
+    timer = StageTimer(label=grid_file.name)
+
+    with timer.stage("read_grid"):
+        xtg_grid = xtgeo.grid_from_file(grid_file)
+
+    scalars = {}
+    with timer.stage("read_properties"):
+        for property_file in property_files:
+            prop = xtgeo.gridproperty_from_file(Path(property_file))
+            scalars[property_name(Path(property_file))] = prop.get_npvalues1d(order="F")
+
+    with timer.stage("vtk_geometries") as record:
+        dims, corners, inactive = xtg_grid.get_vtk_geometries()
+        record["nbytes"] = corners.nbytes
+
+    ni, nj, nk = (int(d) - 1 for d in dims)
+    ncells = ni * nj * nk * refine
+    nactive = ncells - len(inactive) * refine
+    LOGGER.info("Cells, total: %d, active: %d", ncells, nactive)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_file = output_dir / f"{grid_file.stem}-{nactive}.vtu"
+    if partition is not None:
+        output_file = output_file.with_suffix(".pvtu")
+
+    scratch = None
+    if refine > 1:
+        # Streamed to the .npy cache, to a scratch one if none is wanted
+        if npy_cache:
+            directory = cache_dir(output_file)
+        else:
+            scratch = Path(tempfile.mkdtemp(dir=output_dir))
+            directory = scratch / "grid.npycache"
+        with timer.stage("refine") as record:
+            dims = write_refined_cache(
+                dims, corners, inactive, scalars, refine, directory
+            )
+            record["nbytes"] = (directory / "points.npy").stat().st_size
+        grid = read_unstructured_cache(directory)
+    else:
+        with timer.stage("explicit_structured_grid"):
+            grid = pyvista.ExplicitStructuredGrid(dims, corners)
+
+        with timer.stage("connectivity"):
+            grid.compute_connectivity(inplace=True)
+
+        with timer.stage("hide_inactive"):
+            grid.hide_cells(inactive, inplace=True)
+
+        with timer.stage("flip_z"):
+            grid.flip_z(inplace=True)
+
+        with timer.stage("add_scalars"):
+            for index, (name, values) in enumerate(scalars.items()):
+                grid.cell_data[name] = values
+                if index == 0:
+                    grid.cell_data[SCALAR_NAME] = values
+
+    try:
+        with timer.stage("save") as record:
+            if partition is None:
+                record["nbytes"] = write_vtu(grid, output_file, compression)
+            else:
+                manifest = write_partitioned(
+                    grid, output_file, partition, partition_size, compression, dims
+                )
+                record["nbytes"] = sum(
+                    piece["nbytes"] for piece in manifest["pieces"].values()
+                )
 
+        if npy_cache:
+            with timer.stage("npy_cache"):
+                if refine > 1:
+                    # Valid once the .vtu it was written for exists
+                    manifest = read_manifest(directory)
+                    write_manifest(
+                        directory,
+                        manifest["dimensions"],
+                        manifest["cell_arrays"],
+                        source=output_file,
+                    )
+                else:
+                    write_grid_cache(grid, cache_dir(output_file), source=output_file)
+    finally:
+        if scratch is not None:
+            # Unmapped first
+            del grid
+            shutil.rmtree(scratch, ignore_errors=True)
 
-# Input data on Roxar open file format(ROFF)
-# Geogrid is the originally constructed grid,
-# used for geomodelling. Eclgrid is the upscaled
-# grid used for simulation.
+    total = timer.elapsed_s()
+    LOGGER.info("Converted %s in %.2fs", grid_file.name, total)
+    return {
+        "grid": str(grid_file),
+        "properties": [str(p) for p in property_files],
+        "output": str(output_file),
+        "refine": refine,
+        "compression": compression,
+        "partition": partition,
+        "cells_total": ncells,
+        "cells_active": nactive,
+        "stages": timer.stages,
+        "total_seconds": total,
+    }
 
-ROFFGRID = Path("./data/eclgrid.roff")
-ROFFSCALAR = Path("./data/eclgrid--pressure.roff")
-# ROFFGRID = Path("./data/geogrid.roff")
-# ROFFSCALAR = Path("./data/geogrid--phit.roff")
 
-# Adjust this integer to multiply number of layers(k)
-# 1 is no refinement
-REFINE_VERTICALLY = 1
+def append_properties(vtu_file: Path, property_files: Sequence[Path]) -> Dict:
+    """Add properties to the .npy cache of an already converted grid.
 
+    Values of a vertically refined grid are refined to match, from the
+    ratio between the number of cells in the grid and in the property.
+    """
+    vtu_file = Path(vtu_file)
+    directory = cache_dir(vtu_file)
+    manifest = read_manifest(directory, vtu_file)
+    if manifest is None:
+        raise FileNotFoundError(
+            f"No valid grid cache for {vtu_file}, convert with --npy-cache first"
+        )
+    dims = manifest["dimensions"]
+    ncells = int(np.prod(np.asarray(dims) - 1))
+    timer = StageTimer(label=vtu_file.name)
 
-xtg_grid = xtgeo.grid_from_file(ROFFGRID)
-time_it("Reading xtgeo grid to roff")
+    names = []
+    for property_file in property_files:
+        name = property_name(Path(property_file))
+        with timer.stage("append_property") as record:
+            values = xtgeo.gridproperty_from_file(Path(property_file)).get_npvalues1d(
+                order="F"
+            )
+            if ncells % len(values):
+                raise ValueError(
+                    f"{property_file} has {len(values)} cells, grid has {ncells}"
+                )
+            refine = ncells // len(values)
+            if refine > 1:
+                values = refine_cell_values(values, dims, refine)
+            write_cell_property(directory, name, values)
+            record["nbytes"] = values.nbytes
+        names.append(name)
 
-prop = xtgeo.gridproperty_from_file(ROFFSCALAR)
-scalar = prop.get_npvalues1d(order="F")
-time_it("Reading xtgeo grid parameter to roff")
+    return {
+        "grid": str(vtu_file),
+        "properties": names,
+        "stages": timer.stages,
+        "total_seconds": timer.elapsed_s(),
+    }
 
-if REFINE_VERTICALLY > 1:
-    xtg_grid.refine_vertically(REFINE_VERTICALLY)
-    scalar = np.repeat(scalar, REFINE_VERTICALLY)
-    time_it("Refining grid")
 
-print(f"(Cells, total: {xtg_grid.ntotal}, active: {xtg_grid.nactive})")
+def _convert_job(job: Dict) -> Dict:
+    return convert(
+        Path(job["grid"]),
+        [Path(p) for p in job.get("properties", [])],
+        Path(job.get("output_dir", "data")),
+        int(job.get("refine", 1)),
+        bool(job.get("npy_cache", False)),
+        job.get("compression", "zlib"),
+        job.get("partition"),
+        int(job.get("partition_size", 10)),
+    )
 
-dims, corners, inactive = xtg_grid.get_vtk_geometries()
-time_it("Extracting corners and dimensions")
 
-egrid = pyvista.ExplicitStructuredGrid(dims, corners)
-time_it("Converting to explicit structured grid")
+def convert_batch(jobs: List[Dict], workers: Optional[int] = None) -> Dict:
+    """Convert many grid/property sets in a process pool"""
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        reports = list(executor.map(_convert_job, jobs))
+    wall = time.perf_counter() - start
+    cells = sum(report["cells_total"] for report in reports)
+    return {
+        "workers": workers or os.cpu_count(),
+        "wall_seconds": wall,
+        "cells_total": cells,
+        "cells_per_second": cells / wall if wall > 0 else None,
+        "conversions": reports,
+    }
 
-egrid.compute_connectivity(inplace=True)
-time_it("Compute connectivity")
 
-egrid.hide_cells(inactive, inplace=True)
-time_it("Hide inactive cells")
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("grid", nargs="?", type=Path, help="ROFF grid file")
+    parser.add_argument(
+        "-p",
+        "--property",
+        dest="properties",
+        action="append",
+        type=Path,
+        default=[],
+        help="ROFF grid property file, can be given several times",
+    )
+    parser.add_argument("-o", "--output-dir", type=Path, default=Path("data"))
+    parser.add_argument(
+        "--refine",
+        type=int,
+        default=1,
+        help="Multiply number of layers (k), 1 is no refinement",
+    )
+    parser.add_argument(
+        "--npy-cache",
+        action="store_true",
+        help="Also write the memory-mappable .npy grid cache used by the apps",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSORS,
+        default="zlib",
+        help="Compression of the .vtu arrays, lz4 is fastest to read",
+    )
+    parser.add_argument(
+        "--partition",
+        choices=PARTITIONS,
+        help="Write a .pvtu with pieces of k-layers or i/j column blocks",
+    )
+    parser.add_argument(
+        "--partition-size",
+        type=int,
+        default=10,
+        help="Layers (k) or columns per side (ij) in each piece",
+    )
+    parser.add_argument(
+        "--append",
+        type=Path,
+        metavar="VTU",
+        help="Add the properties to the .npy cache of this converted grid",
+    )
+    parser.add_argument("--batch", type=Path, help="JSON file with conversion jobs")
+    parser.add_argument("--workers", type=int, help="Processes used in batch mode")
+    parser.add_argument("--report", type=Path, help="Write JSON timing report here")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-egrid.flip_z(inplace=True)
-time_it("Flip z")
+    if args.append is not None:
+        report = append_properties(args.append, args.properties)
+    elif args.batch is not None:
+        jobs = json.loads(args.batch.read_text())
+        for job in jobs:
+            job.setdefault("output_dir", str(args.output_dir))
+            job.setdefault("refine", args.refine)
+            job.setdefault("npy_cache", args.npy_cache)
+            job.setdefault("compression", args.compression)
+            job.setdefault("partition", args.partition)
+            job.setdefault("partition_size", args.partition_size)
+        report = convert_batch(jobs, args.workers)
+        # No rate without elapsed time
+        rate = report["cells_per_second"]
+        rate = f"{rate:.0f}" if rate is not None else "n/a"
+        print(
+            f"Converted {len(jobs)} grids in {report['wall_seconds']:.2f}s "
+            f"({rate} cells/s)"
+        )
+    elif args.grid is not None:
+        report = convert(
+            args.grid,
+            args.properties,
+            args.output_dir,
+            args.refine,
+            args.npy_cache,
+            args.compression,
+            args.partition,
+            args.partition_size,
+        )
+    else:
+        parser.error("Either a grid file or --batch is required")
 
-egrid.cell_data["scalar"] = scalar
-time_it("Add a scalar")
+    if args.report is not None:
+        args.report.write_text(json.dumps(report, indent=2))
 
-egrid.save(f"data/{ROFFGRID.stem}-{xtg_grid.nactive}.vtu")
-time_it("Save to file")
 
-print(f"TOTAL TIME: {TIMER.elapsed_s():.2f}s")
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,102 @@
-from dash import Dash
+import time
 
-from polydata_app_class import PolyDataApp
-from mesh_app_class import MeshApp
-from surface_class import SurfaceApp
-from intersection_class import IntersectionApp
+# Startup is timed from here, before any other import
+STARTED_AT = time.perf_counter()
+
+import logging
+import os
+
+from flask import Flask
+
+from perf import span
+from plugin_registry import PLUGINS, WarmUp
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# One of polydata, mesh, surface or intersection. Only the selected plugin
+# module (and vtk, pyvista, ... through it) is imported.
+PLUGIN = os.environ.get("PLUGIN", "intersection")
 
 # VTU_FILE = "./data/eclgrid-70729.vtu"
 VTU_FILE = "./data/geogrid-652508.vtu"
 
-# PLUGIN = PolyDataApp(VTU_FILE)
-# PLUGIN = MeshApp(VTU_FILE)
-PLUGIN = IntersectionApp(VTU_FILE)
+IRAP_FILE = "data/topvolantis_depth.irapbin"
+
+# Well trajectory (RMS well or x, y, z columns) for the well curtain mode
+WELL_FILE = None
+
+# Mesh transport, "json" or "binary" (base64 encoded typed arrays).
+# FLOAT32 down-casts points and scalars in binary mode.
+TRANSPORT = "binary"
+FLOAT32 = True
+
+# Gzip compress responses, requires `pip install flask-compress`
+COMPRESS = False
+
+# Compute intersections in background processes, superseded requests are
+# terminated. Requires `pip install dash[diskcache]`, without it the
+# callbacks run in the foreground.
+BACKGROUND = True
+
+# Sections cached on disk by polyline and property, shared by the workers
+# and background processes. None keeps the cache in memory only.
+RESPONSE_CACHE_DIR = "./cache/sections"
+
+DEBUG = True
+
+
+def background_manager():
+    if not BACKGROUND:
+        return None
+    try:
+        import diskcache
+    except ImportError:
+        LOGGER.warning(
+            "diskcache is not installed, running callbacks in the foreground. "
+            "Install it with `pip install dash[diskcache]`."
+        )
+        return None
+    from dash import DiskcacheManager
+
+    return DiskcacheManager(diskcache.Cache("./cache"))
+
+
+def plugin_kwargs():
+    """Constructor arguments of the selected plugin, called during warm-up"""
+    common = {"transport": TRANSPORT, "float32": FLOAT32}
+    if PLUGIN == "surface":
+        return {"irap_file": IRAP_FILE, **common}
+    if PLUGIN == "intersection":
+        return {
+            "vtu_file": VTU_FILE,
+            "well_file": WELL_FILE,
+            "background_manager": background_manager(),
+            "response_cache_dir": RESPONSE_CACHE_DIR,
+            **common,
+        }
+    return {"vtu_file": VTU_FILE, **common}
+
+
+if PLUGIN not in PLUGINS:
+    raise SystemExit(f"Unknown plugin {PLUGIN!r}, use one of {list(PLUGINS)}")
 
+with span("import", "dash"):
+    from dash import Dash
 
-# PLUGIN = SurfaceApp(irap_file="data/topvolantis_depth.irapbin")
+# The warm-up hook is registered on the server before Dash adds its own
+server = Flask(__name__)
+warm_up = WarmUp(
+    server,
+    PLUGIN,
+    plugin_kwargs,
+    on_ready=lambda plugin: setattr(app, "layout", plugin.layout),
+    started_at=STARTED_AT,
+)
+app = Dash(server=server, compress=COMPRESS)
 
-app = Dash()
-app.layout = PLUGIN.layout
-app.run_server(debug=True)
+# With the debug reloader this module also runs in the watching parent
+# process, which never serves requests
+if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    warm_up.start()
+app.run_server(debug=DEBUG)
@@ -0,0 +1,132 @@
+"""Level-of-detail pyramid for grid skins.
+
+The full resolution skin of a large grid has far more triangles than a
+browser viewport can usefully show. At load time the skin is decimated to
+a few levels (e.g. 100%, 25% and 5% of the triangles), which are cached on
+disk next to the .vtu file. Apps send the coarsest level first and refine
+progressively, or pick the finest level within a triangle budget.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+import pyvista
+
+from grid_properties import CELL_IDS_NAME, SCALAR_NAME
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# Fraction of the skin triangles kept at each level, finest first
+DEFAULT_FRACTIONS = (1.0, 0.25, 0.05)
+
+# Cell arrays carried over to decimated levels, the grid cell id of each
+# polygon allows recoloring the skin by any grid property
+DEFAULT_CELL_ARRAYS = (SCALAR_NAME, CELL_IDS_NAME)
+
+
+def decimate_skin(
+    skin: pyvista.PolyData,
+    fraction: float,
+    cell_arrays: Sequence[str] = DEFAULT_CELL_ARRAYS,
+) -> pyvista.PolyData:
+    """Decimate a skin to `fraction` of its triangles, keeping cell arrays.
+
+    Decimation drops cell data, so each coarse triangle gets the values of
+    the closest cell of the full resolution skin.
+    """
+    if fraction >= 1:
+        return skin
+    surface = pyvista.PolyData(skin.points, skin.faces).triangulate()
+    decimated = surface.decimate(1 - fraction)
+    names = [name for name in cell_arrays if name in skin.cell_data]
+    if names:
+        closest = skin.find_closest_cell(decimated.cell_centers().points)
+        for name in names:
+            decimated.cell_data[name] = skin.cell_data[name][closest]
+    return decimated
+
+
+class SkinPyramid:
+    """Skin decimated to several levels, `levels[0]` being the finest"""
+
+    def __init__(
+        self, fractions: Sequence[float], levels: List[pyvista.PolyData]
+    ) -> None:
+        self.fractions = list(fractions)
+        self.levels = levels
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    @property
+    def coarsest(self) -> int:
+        return len(self.levels) - 1
+
+    @classmethod
+    def build(
+        cls,
+        skin: pyvista.PolyData,
+        fractions: Sequence[float] = DEFAULT_FRACTIONS,
+        cell_arrays: Sequence[str] = DEFAULT_CELL_ARRAYS,
+    ) -> "SkinPyramid":
+        fractions = sorted(fractions, reverse=True)
+        return cls(fractions, [decimate_skin(skin, f, cell_arrays) for f in fractions])
+
+    @staticmethod
+    def cache_dir(vtu_file: str) -> Path:
+        return Path(vtu_file).with_suffix(".lod")
+
+    @classmethod
+    def load_or_build(
+        cls,
+        vtu_file: str,
+        compute_skin: Callable[[], pyvista.PolyData],
+        fractions: Sequence[float] = DEFAULT_FRACTIONS,
+        tag: str = "skin",
+        cell_arrays: Sequence[str] = DEFAULT_CELL_ARRAYS,
+    ) -> "SkinPyramid":
+        """Load the pyramid cached next to `vtu_file`, building it if stale.
+
+        `tag` separates pyramids of differently transformed skins of the
+        same grid.
+        """
+        fractions = sorted(fractions, reverse=True)
+        directory = cls.cache_dir(vtu_file)
+        manifest_file = directory / f"{tag}.json"
+        stat = Path(vtu_file).stat()
+        manifest = {
+            "source_mtime": stat.st_mtime_ns,
+            "source_size": stat.st_size,
+            "fractions": fractions,
+            "cell_arrays": list(cell_arrays),
+        }
+        files = [directory / f"{tag}-{fraction:g}.vtp" for fraction in fractions]
+
+        if manifest_file.exists() and all(f.exists() for f in files):
+            if json.loads(manifest_file.read_text()) == manifest:
+                return cls(fractions, [pyvista.read(f) for f in files])
+
+        pyramid = cls.build(pyvista.wrap(compute_skin()), fractions, cell_arrays)
+        try:
+            directory.mkdir(exist_ok=True)
+            for level, path in zip(pyramid.levels, files):
+                level.save(path)
+            manifest_file.write_text(json.dumps(manifest))
+        except OSError as exc:
+            LOGGER.warning("Could not cache skin pyramid in %s: %s", directory, exc)
+        return pyramid
+
+    def level_for_budget(self, max_triangles: Optional[int]) -> int:
+        """Finest level with at most `max_triangles` cells (coarsest if none)"""
+        if max_triangles is None:
+            return 0
+        for index, level in enumerate(self.levels):
+            if level.n_cells <= max_triangles:
+                return index
+        return self.coarsest
+
+    def refinement_steps(self, max_triangles: Optional[int] = None) -> List[int]:
+        """Level indices to send in order, coarse to fine within budget"""
+        return list(range(self.coarsest, self.level_for_budget(max_triangles) - 1, -1))
@@ -1,84 +1,184 @@
 import logging
+import time
 
 import xtgeo
 import numpy as np
-from vtk.util.numpy_support import vtk_to_numpy
-import pyvista
-from dash import Dash, html, dcc, callback, Input, Output, no_update
+from dash import html, dcc, callback, Input, Output, State, no_update
 import dash_vtk
-from dash_vtk.utils import to_mesh_state
+import plotly.graph_objects as go
 from webviz_config._plugin_abc import WebvizPluginABC
-from webviz_subsurface._utils.perf_timer import PerfTimer
 
-from vtkmodules.vtkFiltersGeometry import vtkGeometryFilter
-from vtkmodules.vtkFiltersGeometry import vtkExplicitStructuredGridSurfaceFilter
+from geometry_cache import GEOMETRY_CACHE
+from grid_store import ViewTransform
+from mesh_delta import polydata_arrays, delta_update, delta_nbytes
+from perf import span, request, record_duration
+from perf_panel import perf_panel
+from surface_contours import SurfaceContours
+from surface_tiles import MAX_TILES, SurfaceTiles
 
-TIMER = PerfTimer()
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
 
-def time_it(text: str) -> str:
-    return print(f"TIME: {text} {TIMER.lap_s():.2f}s")
-
-
 class SurfaceApp(WebvizPluginABC):
     """Testing vtk performance"""
 
     def __init__(
         self,
         irap_file,
+        transport="json",
+        float32=False,
+        max_tiles=MAX_TILES,
     ) -> None:
         super().__init__(self)
-        time_it("Initializing app")
-
-        surface = xtgeo.surface_from_file(irap_file)
-        surface.values = surface.values * -1
-        self.value_range = [np.min(surface.values), np.max(surface.values)]
-        time_it("Read xtgeo surface")
-
-        # surface.coarsen(4)
-        time_it("Reduce resolution")
+        self.irap_file = irap_file
+        self.transport = transport
+        self.float32 = float32
+        self.max_tiles = max_tiles
 
-        xi, yi = surface.get_xy_values(asmasked=False)
-        zi = surface.values
-        zif = np.ma.filled(zi, fill_value=np.nan)
-        time_it("Extract xyz from surface")
+        # Quadtree of tiles cached next to the surface file, the surface is
+        # only read when the tiles are (re)built
+        with span("tiles", irap_file):
+            self.tiles = SurfaceTiles.load_or_build(
+                irap_file, lambda: self._read_surface(irap_file)
+            )
+        self.value_range = list(self.tiles.value_range)
+        xmin, xmax, ymin, ymax = self.tiles.extent
+        self.center = ((xmin + xmax) / 2, (ymin + ymax) / 2, np.mean(self.value_range))
 
-        self.sgrid = pyvista.StructuredGrid(xi, yi, zif)
-        self.sgrid["Elevation"] = zif.flatten(order="F")
-        time_it("Convert to structured grid")
+        # Contours of the default interval are ready before they are asked for
+        self.contours = SurfaceContours(irap_file, self.tiles)
+        self.contours.precompute()
 
         @callback(
-            Output("vtk-mesh", "state"),
-            Output("vtk-contours-mesh", "state"),
+            Output("vtk-surface-polydata", "points"),
+            Output("vtk-surface-polydata", "polys"),
+            Output("vtk-surface-array", "values"),
+            Output("vtk-contours-polydata", "points"),
+            Output("vtk-contours-polydata", "lines"),
+            Output("vtk-contours-array", "values"),
+            Output("mesh-hashes", "data"),
             Output("vtk-view", "triggerResetCamera"),
+            Output("tile-status", "children"),
+            Output("sent-at", "data"),
             Input("click", "n_clicks"),
+            Input("overview", "relayoutData"),
+            Input("contour-interval", "value"),
+            State("mesh-hashes", "data"),
         )
-        def _update(nclicks):
-            # Flipping z to trigger a change
-            self.sgrid.flip_z(inplace=True)
-            # sgrid = self.sgrid.decimate_boundary(0.75)
-            # time_it("Decimate")
-            TIMER.lap_s()
-            contours = self.sgrid.contour()
-            time_it("Make contours")
-
-            mesh_state = to_mesh_state(self.sgrid, field_to_keep="Elevation")
-
-            time_it("TO MESH STATE")
-            contours_mesh_state = to_mesh_state(contours, field_to_keep="Elevation")
-            time_it("CONTOURS TO MESH STATE")
-            return mesh_state, contours_mesh_state, nclicks
+        @request("surface")
+        def _update(nclicks, relayout, interval, previous_hashes):
+            # Only the tiles in the extent shown in the overview map, at the
+            # finest level within the tile budget
+            extent = self._relayout_extent(relayout)
+            level = self.tiles.level_for_extent(extent, self.max_tiles)
+            tiles = self.tiles.visible_tiles(level, extent)
+            with span("tiles", f"level={level}") as record:
+                mesh, _ = GEOMETRY_CACHE.get_or_compute(
+                    GEOMETRY_CACHE.key(
+                        self.irap_file, kind="tiles", level=level, tiles=tuple(tiles)
+                    ),
+                    lambda: (self.tiles.mesh(level, tiles), None),
+                )
+                record["cells"] = mesh.n_cells
+
+            # Flipping z to trigger a change. The flip follows the clicks
+            # instead of mutating the surface, so every worker serving the
+            # client agrees on it.
+            view = ViewTransform(flip_z=(nclicks or 0) % 2 == 0, center=self.center)
+            surface = view.apply(mesh)
+            arrays = polydata_arrays(surface, field_to_keep="Elevation")
+            # Contours of the same tiles, from the cache per interval
+            if interval:
+                with span("contours", f"interval={interval}") as record:
+                    contours = view.apply(
+                        self.contours.contours(level, tiles, interval)
+                    )
+                    record["cells"] = contours.n_cells
+                if contours.n_cells:
+                    arrays.update(
+                        polydata_arrays(
+                            contours, field_to_keep="Elevation", prefix="contours_"
+                        )
+                    )
+            # Only the point coordinates change on a flip, topology and
+            # scalars stay resident on the client
+            with span("to_mesh_state", self.transport) as record:
+                outputs, hashes = delta_update(
+                    arrays,
+                    [
+                        "points",
+                        "polys",
+                        "scalars",
+                        "contours_points",
+                        "contours_lines",
+                        "contours_scalars",
+                    ],
+                    previous_hashes,
+                    transport=self.transport,
+                    float32=self.float32,
+                )
+                record["nbytes"] = delta_nbytes(outputs)
+            status = (
+                f"Level {level} of {self.tiles.finest}: {len(tiles)} tiles, "
+                f"{mesh.n_cells} cells"
+            )
+            return (*outputs, hashes, nclicks, status, time.time())
 
         @callback(
             Output("dummy", "data"),
-            Input("vtk-mesh", "state"),
+            Input("sent-at", "data"),
         )
-        def _update(_):
-            time_it("Package delivered")
+        def _delivered(sent_at):
+            if sent_at is not None:
+                record_duration("deliver", time.time() - sent_at)
             return no_update
 
+    @staticmethod
+    def _read_surface(irap_file):
+        with span("read", irap_file):
+            surface = xtgeo.surface_from_file(irap_file)
+            surface.values = surface.values * -1
+
+        # surface.coarsen(4)
+
+        xi, yi = surface.get_xy_values(asmasked=False)
+        return xi, yi, np.ma.filled(surface.values, fill_value=np.nan)
+
+    def _relayout_extent(self, relayout):
+        """Extent zoomed to in the overview map, None when fully zoomed out"""
+        relayout = relayout or {}
+        xmin, xmax, ymin, ymax = self.tiles.extent
+        if "xaxis.range[0]" in relayout:
+            xmin, xmax = sorted(
+                [relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]]
+            )
+        if "yaxis.range[0]" in relayout:
+            ymin, ymax = sorted(
+                [relayout["yaxis.range[0]"], relayout["yaxis.range[1]"]]
+            )
+        extent = (xmin, xmax, ymin, ymax)
+        return None if extent == self.tiles.extent else extent
+
+    def _overview_figure(self) -> go.Figure:
+        """Coarsest tile as a map to zoom in, the zoomed extent is served"""
+        x, y, z = (values.ravel() for values in self.tiles.tile(0, 0, 0))
+        figure = go.Figure(
+            go.Scattergl(
+                x=x,
+                y=y,
+                mode="markers",
+                marker={"color": z, "colorscale": "Viridis", "size": 3},
+                hoverinfo="skip",
+            )
+        )
+        figure.update_layout(
+            margin={"l": 0, "r": 0, "t": 0, "b": 0},
+            yaxis={"scaleanchor": "x"},
+            dragmode="zoom",
+        )
+        return figure
+
     @property
     def layout(self) -> html.Div:
         return html.Div(
@@ -90,7 +190,20 @@ class SurfaceApp(WebvizPluginABC):
                         dash_vtk.GeometryRepresentation(
                             id="vtk-representation",
                             children=[
-                                dash_vtk.Mesh(id="vtk-mesh", state={}),
+                                dash_vtk.PolyData(
+                                    id="vtk-surface-polydata",
+                                    children=[
+                                        dash_vtk.PointData(
+                                            [
+                                                dash_vtk.DataArray(
+                                                    id="vtk-surface-array",
+                                                    registration="setScalars",
+                                                    name="Elevation",
+                                                )
+                                            ]
+                                        )
+                                    ],
+                                ),
                             ],
                             property={"edgeVisibility": True},
                             colorDataRange=self.value_range,
@@ -98,7 +211,20 @@ class SurfaceApp(WebvizPluginABC):
                         dash_vtk.GeometryRepresentation(
                             id="vtk-contours-representation",
                             children=[
-                                dash_vtk.Mesh(id="vtk-contours-mesh", state={}),
+                                dash_vtk.PolyData(
+                                    id="vtk-contours-polydata",
+                                    children=[
+                                        dash_vtk.PointData(
+                                            [
+                                                dash_vtk.DataArray(
+                                                    id="vtk-contours-array",
+                                                    registration="setScalars",
+                                                    name="Elevation",
+                                                )
+                                            ]
+                                        )
+                                    ],
+                                ),
                             ],
                             property={
                                 "color": "black",
@@ -108,11 +234,33 @@ class SurfaceApp(WebvizPluginABC):
                         ),
                     ],
                 ),
+                dcc.Graph(
+                    id="overview",
+                    figure=self._overview_figure(),
+                    style={"height": "30vh", "width": "30vh"},
+                ),
+                html.Pre(id="tile-status"),
+                dcc.Dropdown(
+                    id="contour-interval",
+                    options=[
+                        {"label": f"Contours every {interval:g}", "value": interval}
+                        for interval in (
+                            factor * self.contours.default_interval
+                            for factor in (0.5, 1, 2, 5)
+                        )
+                    ],
+                    value=self.contours.default_interval,
+                    placeholder="No contours",
+                    style={"width": "30vh"},
+                ),
                 html.Button(
                     id="click",
                     style={"fontSize": "10em"},
                     children="click",
                 ),
+                dcc.Store(id="mesh-hashes", data={}),
+                dcc.Store(id="sent-at"),
                 dcc.Store(id="dummy"),
+                perf_panel(),
             ],
         )
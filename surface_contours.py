@@ -0,0 +1,217 @@
+"""Contour lines of regular surfaces with vectorized marching squares.
+
+The generic VTK contour filter treats a surface as an arbitrary mesh and
+is re-run on every update. On a regular lattice, contouring is a
+marching squares pass where every cell and level is classified by which
+of its corners are above the level, done here with numpy over all cells
+crossing a level at once. Contours are computed per surface tile and
+cached by (surface, tile, level set), so panning, flipping and switching
+back to an interval reuse them, and the default level set is precomputed
+in a background thread after load.
+"""
+import logging
+import math
+import threading
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pyvista
+
+from geometry_cache import GEOMETRY_CACHE
+from perf import span
+from surface_tiles import SCALAR_NAME, SurfaceTiles
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# Number of contour levels aimed at by the default interval
+DEFAULT_LEVEL_COUNT = 10
+
+# Cell edges as (corner, corner), corners counter-clockwise from (i, j)
+CORNER_OFFSETS = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+CELL_EDGES = np.array([[0, 1], [1, 2], [2, 3], [3, 0]])
+
+
+def nice_interval(
+    value_range: Tuple[float, float], count: int = DEFAULT_LEVEL_COUNT
+) -> float:
+    """Round interval (1, 2 or 5 times a power of ten) giving about `count` levels"""
+    span_ = abs(value_range[1] - value_range[0]) or 1.0
+    magnitude = 10 ** math.floor(math.log10(span_ / count))
+    for factor in (1, 2, 5, 10):
+        if span_ / (factor * magnitude) <= count:
+            return float(factor * magnitude)
+    return float(10 * magnitude)
+
+
+def contour_levels(value_range: Tuple[float, float], interval: float) -> np.ndarray:
+    """Multiples of `interval` within `value_range`"""
+    vmin, vmax = value_range
+    first = math.ceil(vmin / interval)
+    last = math.floor(vmax / interval)
+    return np.arange(first, last + 1) * interval
+
+
+def marching_squares(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, levels: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Contour lines of the (n, m) node arrays at `levels`.
+
+    Returns points (k, 3) at the contour level, VTK line connectivity
+    (2, a, b, ...) and the level of each point. Points on an edge are
+    shared by the segments of neighbouring cells. Cells with undefined
+    (NaN) corners are skipped. Saddle cells are resolved with the mean of
+    the corners.
+    """
+    x, y, z = (np.asarray(values, dtype=float) for values in (x, y, z))
+    levels = np.sort(np.asarray(levels, dtype=float))
+    n, m = z.shape
+    if n < 2 or m < 2 or not len(levels):
+        return np.empty((0, 3)), np.empty(0, dtype=np.int64), np.empty(0)
+
+    # Levels crossing each cell, min < level <= max. Undefined cells have
+    # a NaN min and max, and cross none.
+    corners = [z[:-1, :-1], z[1:, :-1], z[1:, 1:], z[:-1, 1:]]
+    cell_min = np.minimum(np.minimum(corners[0], corners[1]), np.minimum(*corners[2:]))
+    cell_max = np.maximum(np.maximum(corners[0], corners[1]), np.maximum(*corners[2:]))
+    first_level = np.searchsorted(levels, cell_min.ravel(), side="right")
+    level_count = np.searchsorted(levels, cell_max.ravel(), side="right") - first_level
+    level_count[~np.isfinite(cell_min.ravel() + cell_max.ravel())] = 0
+    level_count = np.maximum(level_count, 0)
+
+    # One row per crossing (cell, level) pair, with its (4,) corner nodes
+    cells = np.repeat(np.arange(level_count.size), level_count)
+    if not len(cells):
+        return np.empty((0, 3)), np.empty(0, dtype=np.int64), np.empty(0)
+    level_index = np.repeat(first_level, level_count) + (
+        np.arange(len(cells))
+        - np.repeat(np.cumsum(level_count) - level_count, level_count)
+    )
+    level = levels[level_index]
+    ci, cj = np.divmod(cells, m - 1)
+    nodes = (ci[:, None] + CORNER_OFFSETS[:, 0]) * m + (
+        cj[:, None] + CORNER_OFFSETS[:, 1]
+    )
+    values = z.ravel()[nodes]
+    above = values >= level[:, None]
+    case = (above * (1, 2, 4, 8)).sum(axis=1)
+
+    # Crossed edges per row, in edge order
+    a, b = CELL_EDGES[:, 0], CELL_EDGES[:, 1]
+    crossed = above[:, a] != above[:, b]
+    # Saddles have all four edges crossed, pair them around the corners
+    # that are cut off from each other
+    saddle = (case == 5) | (case == 10)
+    center_above = values.mean(axis=1) >= level
+    pair_next = saddle & (above[:, 0] == center_above)
+
+    rows, edges = np.nonzero(crossed)
+    counts = crossed.sum(axis=1)
+    offsets = np.cumsum(counts) - counts
+    # Regular cells: one segment between their two crossed edges.
+    # Saddles: edges (0, 1), (2, 3) or (3, 0), (1, 2).
+    local = np.where(
+        ~saddle[:, None],
+        np.array([[0, 1, -1, -1]]),
+        np.where(pair_next[:, None], [[0, 1, 2, 3]], [[3, 0, 1, 2]]),
+    )
+    pairs = np.where(saddle, 2, 1)
+    segment_rows = np.repeat(np.arange(len(nodes)), pairs)
+    segment_index = np.arange(len(segment_rows)) - np.repeat(
+        np.cumsum(pairs) - pairs, pairs
+    )
+    start = offsets[segment_rows] + local[segment_rows, 2 * segment_index]
+    end = offsets[segment_rows] + local[segment_rows, 2 * segment_index + 1]
+
+    # Edges are keyed by level, lower node and direction (i or j), so
+    # neighbouring cells share the point where a contour crosses
+    node_a = nodes[rows, a[edges]]
+    node_b = nodes[rows, b[edges]]
+    direction = (np.abs(node_a - node_b) == 1).astype(np.int64)
+    keys = (level_index[rows] * n * m + np.minimum(node_a, node_b)) * 2 + direction
+    za, zb = values[rows, a[edges]], values[rows, b[edges]]
+    t = (level[rows] - za) / (zb - za)
+
+    _, first, point_ids = np.unique(keys, return_index=True, return_inverse=True)
+    node_a, node_b, t = node_a[first], node_b[first], t[first]
+    flat_x, flat_y = x.ravel(), y.ravel()
+    points = np.column_stack(
+        [
+            flat_x[node_a] + t * (flat_x[node_b] - flat_x[node_a]),
+            flat_y[node_a] + t * (flat_y[node_b] - flat_y[node_a]),
+            level[rows[first]],
+        ]
+    )
+    segments = point_ids[np.column_stack([start, end])]
+    lines = np.column_stack([np.full(len(segments), 2), segments]).ravel()
+    return points, lines, points[:, 2].copy()
+
+
+class SurfaceContours:
+    """Contours of the tiles of a surface, cached per level set"""
+
+    def __init__(self, source_file: str, tiles: SurfaceTiles) -> None:
+        self.source_file = source_file
+        self.tiles = tiles
+        self.default_interval = nice_interval(tiles.value_range)
+        self._precompute: Optional[threading.Thread] = None
+
+    def levels(self, interval: Optional[float] = None) -> np.ndarray:
+        return contour_levels(self.tiles.value_range, interval or self.default_interval)
+
+    def tile_contours(
+        self, level: int, i: int, j: int, interval: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(points, lines, values) of one tile, computed once per level set"""
+        levels = self.levels(interval)
+        key = GEOMETRY_CACHE.key(
+            self.source_file,
+            kind="contours",
+            tile=(level, i, j),
+            levels=tuple(levels.tolist()),
+        )
+        _, contours = GEOMETRY_CACHE.get_or_compute(
+            key, lambda: (None, marching_squares(*self.tiles.tile(level, i, j), levels))
+        )
+        return contours
+
+    def contours(
+        self,
+        level: int,
+        tiles: Sequence[Tuple[int, int]],
+        interval: Optional[float] = None,
+    ) -> pyvista.PolyData:
+        """Contours of `tiles` merged into one polydata with an "Elevation" array"""
+        points, lines, values = [], [], []
+        offset = 0
+        for i, j in tiles:
+            tile_points, tile_lines, tile_values = self.tile_contours(
+                level, i, j, interval
+            )
+            tile_lines = tile_lines.reshape(-1, 3).copy()
+            tile_lines[:, 1:] += offset
+            offset += len(tile_points)
+            points.append(tile_points)
+            lines.append(tile_lines.ravel())
+            values.append(tile_values)
+        if not offset:
+            return pyvista.PolyData()
+        contours = pyvista.PolyData(np.concatenate(points), lines=np.concatenate(lines))
+        contours.point_data[SCALAR_NAME] = np.concatenate(values)
+        return contours
+
+    def precompute(self, intervals: Sequence[Optional[float]] = (None,)) -> None:
+        """Compute the contours of all tiles in a background thread.
+
+        Coarse levels are done first, as they are shown first.
+        """
+
+        def _run():
+            for interval in intervals:
+                with span("precompute_contours", f"interval={interval}"):
+                    for level in range(self.tiles.finest + 1):
+                        for i, j in self.tiles.visible_tiles(level):
+                            self.tile_contours(level, i, j, interval)
+
+        self._precompute = threading.Thread(target=_run, daemon=True)
+        self._precompute.start()
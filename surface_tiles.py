@@ -0,0 +1,242 @@
+"""Quadtree tiles of regular surfaces at multiple resolutions.
+
+A full resolution surface (millions of nodes) is too large to send to the
+browser in one payload, and most of it is either outside the view or
+drawn at a resolution the screen cannot show. The surface is therefore
+split into a quadtree: level 0 is a single tile covering the whole
+surface, and every level below splits each tile in four at twice the
+resolution, down to the full resolution. All tiles have at most
+`tile_size` cells per side, so a view is served by picking the finest
+level where the tiles intersecting the visible extent stay within a tile
+budget.
+
+Tiles are node arrays (x, y, z) in surface index space, sampled with a
+stride of 2^(finest level - level). Neighbouring tiles share their border
+nodes, so tiles at one level join without gaps. They are written once as
+.npy files next to the surface file and memory-mapped when served.
+"""
+import json
+import logging
+import math
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyvista
+
+from grid_store import _replace, staged_cache
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+# Cells per tile side
+TILE_SIZE = 128
+
+# Tiles sent for one view, a 4 x 4 block of tiles
+MAX_TILES = 16
+
+SCALAR_NAME = "Elevation"
+
+# (xmin, xmax, ymin, ymax) in map coordinates
+Extent = Tuple[float, float, float, float]
+
+CACHE_VERSION = 1
+
+
+def _tile_nodes(start: int, span: int, stride: int, count: int) -> np.ndarray:
+    """Node indices of a tile along one axis, always including its end node"""
+    end = min(start + span, count - 1)
+    return np.unique(np.append(np.arange(start, end, stride), end))
+
+
+def tile_mesh(nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Points, VTK quad connectivity and elevation of a (3, n, m) tile.
+
+    Undefined nodes have a NaN z. They are dropped with the quads touching
+    them, so holes in the surface are not drawn.
+    """
+    x, y, z = (np.asarray(values, dtype=float) for values in nodes)
+    defined = np.isfinite(z)
+    point_ids = np.full(z.shape, -1, dtype=np.int64)
+    point_ids[defined] = np.arange(defined.sum())
+
+    corners = np.stack(
+        [
+            point_ids[:-1, :-1],
+            point_ids[1:, :-1],
+            point_ids[1:, 1:],
+            point_ids[:-1, 1:],
+        ],
+        axis=-1,
+    ).reshape(-1, 4)
+    corners = corners[(corners >= 0).all(axis=1)]
+    polys = np.column_stack([np.full(len(corners), 4), corners]).ravel()
+    points = np.column_stack([x[defined], y[defined], z[defined]])
+    return points, polys, z[defined]
+
+
+class SurfaceTiles:
+    """Tile pyramid of a surface cached in `directory`"""
+
+    def __init__(self, directory: Path, manifest: dict) -> None:
+        self.directory = Path(directory)
+        self.manifest = manifest
+        self.tile_size: int = manifest["tile_size"]
+        # Tiles along (i, j) per level, coarsest first
+        self.levels: List[Tuple[int, int]] = [tuple(c) for c in manifest["levels"]]
+        self.value_range: Tuple[float, float] = tuple(manifest["value_range"])
+        self._bounds: Dict[str, Extent] = {
+            name: tuple(bounds) for name, bounds in manifest["bounds"].items()
+        }
+
+    @property
+    def finest(self) -> int:
+        return len(self.levels) - 1
+
+    @property
+    def extent(self) -> Extent:
+        return self._bounds[self.tile_name(0, 0, 0)]
+
+    @staticmethod
+    def tile_name(level: int, i: int, j: int) -> str:
+        return f"{level}-{i}-{j}"
+
+    @staticmethod
+    def cache_dir(surface_file: str) -> Path:
+        return Path(surface_file).with_suffix(".tiles")
+
+    @classmethod
+    def build(
+        cls,
+        xi: np.ndarray,
+        yi: np.ndarray,
+        zi: np.ndarray,
+        directory: Path,
+        tile_size: int = TILE_SIZE,
+        extra: Optional[dict] = None,
+    ) -> "SurfaceTiles":
+        """Write all tiles of the (ncol, nrow) node arrays to `directory`.
+
+        The tiles are staged and the directory replaced when complete, so
+        workers starting at the same time never read a partial pyramid.
+        """
+        zi = np.ma.filled(np.ma.asarray(zi, dtype=float), fill_value=np.nan)
+        ncol, nrow = zi.shape
+        finest = max(0, math.ceil(math.log2(max(ncol - 1, nrow - 1, 1) / tile_size)))
+        directory = Path(directory)
+        with staged_cache(directory) as staging:
+            levels, bounds = [], {}
+            for level in range(finest + 1):
+                stride = 2 ** (finest - level)
+                span = tile_size * stride
+                counts = (
+                    math.ceil((ncol - 1) / span) or 1,
+                    math.ceil((nrow - 1) / span) or 1,
+                )
+                levels.append(counts)
+                for i in range(counts[0]):
+                    columns = _tile_nodes(i * span, span, stride, ncol)
+                    for j in range(counts[1]):
+                        rows = _tile_nodes(j * span, span, stride, nrow)
+                        index = np.ix_(columns, rows)
+                        nodes = np.stack([xi[index], yi[index], zi[index]])
+                        name = cls.tile_name(level, i, j)
+                        np.save(staging / f"{name}.npy", nodes)
+                        bounds[name] = [
+                            float(nodes[0].min()),
+                            float(nodes[0].max()),
+                            float(nodes[1].min()),
+                            float(nodes[1].max()),
+                        ]
+
+            manifest = {
+                **(extra or {}),
+                "version": CACHE_VERSION,
+                "tile_size": tile_size,
+                "shape": [ncol, nrow],
+                "levels": levels,
+                "value_range": [float(np.nanmin(zi)), float(np.nanmax(zi))],
+                "bounds": bounds,
+            }
+            # Written last, so a partially written pyramid is never considered valid
+            _replace(
+                staging / "manifest.json",
+                lambda file: file.write(json.dumps(manifest).encode()),
+            )
+        return cls(directory, manifest)
+
+    @classmethod
+    def load_or_build(
+        cls,
+        surface_file: str,
+        read_surface: Callable[[], Tuple[np.ndarray, np.ndarray, np.ndarray]],
+        tile_size: int = TILE_SIZE,
+    ) -> "SurfaceTiles":
+        """Load the tiles cached next to `surface_file`, building them if stale.
+
+        `read_surface` returns the (x, y, z) node arrays and is only called
+        when the tiles are built, so a cached surface is never read.
+        """
+        directory = cls.cache_dir(surface_file)
+        stat = Path(surface_file).stat()
+        source = {"source_mtime": stat.st_mtime_ns, "source_size": stat.st_size}
+        try:
+            manifest = json.loads((directory / "manifest.json").read_text())
+        except (OSError, ValueError):
+            manifest = {}
+        if (
+            manifest.get("version") == CACHE_VERSION
+            and manifest.get("tile_size") == tile_size
+            and all(manifest.get(key) == value for key, value in source.items())
+        ):
+            return cls(directory, manifest)
+        return cls.build(*read_surface(), directory, tile_size, extra=source)
+
+    def tile(self, level: int, i: int, j: int) -> np.ndarray:
+        """(3, n, m) x, y, z nodes of a tile, memory-mapped"""
+        return np.load(
+            self.directory / f"{self.tile_name(level, i, j)}.npy", mmap_mode="r"
+        )
+
+    def visible_tiles(
+        self, level: int, extent: Optional[Extent] = None
+    ) -> List[Tuple[int, int]]:
+        """(i, j) of the tiles at `level` intersecting `extent` (all if None)"""
+        ni, nj = self.levels[level]
+        tiles = [(i, j) for i in range(ni) for j in range(nj)]
+        if extent is None:
+            return tiles
+        xmin, xmax, ymin, ymax = extent
+        visible = []
+        for i, j in tiles:
+            txmin, txmax, tymin, tymax = self._bounds[self.tile_name(level, i, j)]
+            if txmin <= xmax and txmax >= xmin and tymin <= ymax and tymax >= ymin:
+                visible.append((i, j))
+        return visible
+
+    def level_for_extent(
+        self, extent: Optional[Extent] = None, max_tiles: int = MAX_TILES
+    ) -> int:
+        """Finest level showing `extent` with at most `max_tiles` tiles"""
+        for level in range(self.finest, 0, -1):
+            if len(self.visible_tiles(level, extent)) <= max_tiles:
+                return level
+        return 0
+
+    def mesh(self, level: int, tiles: Sequence[Tuple[int, int]]) -> pyvista.PolyData:
+        """Tiles merged into one quad mesh with an "Elevation" point array"""
+        points, polys, values = [], [], []
+        offset = 0
+        for i, j in tiles:
+            tile_points, tile_polys, tile_values = tile_mesh(self.tile(level, i, j))
+            tile_polys = tile_polys.reshape(-1, 5)
+            tile_polys[:, 1:] += offset
+            offset += len(tile_points)
+            points.append(tile_points)
+            polys.append(tile_polys.ravel())
+            values.append(tile_values)
+        if not points:
+            return pyvista.PolyData()
+        mesh = pyvista.PolyData(np.concatenate(points), np.concatenate(polys))
+        mesh.point_data[SCALAR_NAME] = np.concatenate(values)
+        return mesh
@@ -0,0 +1,29 @@
+import numpy as np
+import pyvista
+
+from camera import section_camera
+
+
+def test_empty_section_has_no_camera():
+    assert section_camera(pyvista.PolyData().bounds, [[0, 0], [1, 0]]) is None
+    assert section_camera((1, -1, 1, -1, 1, -1), [[0, 0], [1, 0]]) is None
+
+
+def test_camera_looks_perpendicular_onto_section():
+    polyline = np.array([[0.0, 0.0, 0.0], [100.0, 100.0, 0.0]])
+    camera = section_camera((0, 100, 0, 100, -50, 0), polyline)
+    position = np.array(camera["position"])
+    tangent = np.array([1.0, 1.0, 0.0]) / np.sqrt(2)
+
+    np.testing.assert_allclose(np.linalg.norm(position), 1)
+    np.testing.assert_allclose(position @ tangent, 0, atol=1e-12)
+    np.testing.assert_allclose(position[2], 0, atol=1e-12)
+    # The polyline runs left to right: screen right = direction x view up
+    direction = -position
+    right = np.cross(direction, camera["view_up"])
+    np.testing.assert_allclose(right, tangent, atol=1e-12)
+
+
+def test_degenerate_polyline():
+    camera = section_camera((0, 1, 0, 1, 0, 1), [[5.0, 5.0]])
+    assert np.isfinite(camera["position"]).all()
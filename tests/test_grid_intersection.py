@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_grid
+from column_index import segment_hits_boxes
+from grid_intersection import GridIntersector
+
+
+@pytest.fixture(name="intersector", scope="module")
+def fixture_intersector():
+    return GridIntersector(synthetic_grid(12, 10, 3, inactive_fraction=0.2))
+
+
+def _polylines(intersector, seed=0):
+    """Random walks like well paths, with a repeated and a zero length segment"""
+    rng = np.random.default_rng(seed)
+    xmin, xmax, ymin, ymax = intersector.xy_bounds
+    walks = [
+        np.cumsum(
+            np.vstack(
+                [rng.uniform([xmin, ymin], [xmax, ymax]), rng.normal(0, 40, (20, 2))]
+            ),
+            axis=0,
+        )
+        for _ in range(5)
+    ]
+    diagonal = np.array([[xmin, ymin], [xmax, ymax], [xmax, ymax], [xmin, ymax]])
+    return walks + [diagonal, diagonal]
+
+
+def test_candidates_match_column_scan(intersector):
+    polylines = _polylines(intersector)
+    p0, p1, lengths, _ = (
+        np.concatenate(arrays)
+        for arrays in zip(*[intersector._segments(p, False) for p in polylines])
+    )
+    segments, cells = intersector._candidate_cells(p0, p1, lengths)
+
+    boxes = intersector.index.column_boxes
+    for segment in range(len(p0)):
+        expected = np.empty(0, dtype=int)
+        if lengths[segment] > 0:
+            columns = np.flatnonzero(
+                segment_hits_boxes(p0[segment], p1[segment], boxes)
+            )
+            expected = intersector.column_cells(columns)
+        np.testing.assert_array_equal(cells[segments == segment], expected)
+    assert np.all(np.diff(segments) >= 0)
+
+
+def test_batch_matches_single_sections(intersector):
+    polylines = _polylines(intersector)
+    for section, polyline in zip(intersector.intersect_many(polylines), polylines):
+        single = intersector.intersect(polyline)
+        np.testing.assert_array_equal(section.points, single.points)
+        np.testing.assert_array_equal(
+            section.cell_data["cell_id"], single.cell_data["cell_id"]
+        )
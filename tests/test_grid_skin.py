@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import pyvista
+from vtkmodules.vtkFiltersGeometry import vtkExplicitStructuredGridSurfaceFilter
+
+import grid_skin
+from benchmarks.synthetic import synthetic_grid
+from column_index import HIDDEN_CELL
+from grid_properties import CELL_IDS_NAME
+from grid_skin import extract_skin
+
+
+def _vtk_skin(grid):
+    skin_filter = vtkExplicitStructuredGridSurfaceFilter()
+    skin_filter.SetInputData(grid)
+    skin_filter.PassThroughCellIdsOn()
+    skin_filter.Update()
+    return pyvista.wrap(skin_filter.GetOutput())
+
+
+def _quad_points(skin):
+    return np.asarray(skin.points)[skin.faces.reshape(-1, 5)[:, 1:]]
+
+
+def _merged_grid(ni, nj, nk, seed=0):
+    """Grid with shared corner points, so faces between cells are connected"""
+    x, y, z = np.meshgrid(
+        np.arange(ni + 1.0), np.arange(nj + 1.0), -np.arange(nk + 1.0), indexing="ij"
+    )
+    grid = pyvista.StructuredGrid(x, y, z).cast_to_explicit_structured_grid()
+    grid.compute_connectivity(inplace=True)
+    rng = np.random.default_rng(seed)
+    grid.hide_cells(np.flatnonzero(rng.random(grid.n_cells) < 0.2), inplace=True)
+    return grid
+
+
+@pytest.fixture(name="grid", params=["synthetic", "merged"])
+def fixture_grid(request):
+    if request.param == "synthetic":
+        return synthetic_grid(6, 5, 4, inactive_fraction=0.2)
+    return _merged_grid(6, 5, 4)
+
+
+def _assert_same_skin(skin, reference):
+    assert skin.n_cells == reference.n_cells
+    assert set(skin.cell_data[CELL_IDS_NAME]) == set(reference.cell_data[CELL_IDS_NAME])
+    np.testing.assert_array_equal(
+        skin.cell_data[CELL_IDS_NAME], reference.cell_data[CELL_IDS_NAME]
+    )
+    np.testing.assert_array_equal(_quad_points(skin), _quad_points(reference))
+
+
+def test_skin_matches_vtk_filter(grid):
+    hidden = (np.asarray(grid.cell_data["vtkGhostType"]) & HIDDEN_CELL) != 0
+    assert hidden.any()
+    skin = extract_skin(grid)
+    _assert_same_skin(skin, _vtk_skin(grid))
+    assert not hidden[skin.cell_data[CELL_IDS_NAME]].any()
+
+
+def test_threaded_skin_matches_vtk_filter(grid, monkeypatch):
+    monkeypatch.setattr(grid_skin, "MIN_SLAB_CELLS", 1)
+    _assert_same_skin(extract_skin(grid, threads=3), _vtk_skin(grid))
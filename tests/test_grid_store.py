@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_grid
+from grid_store import (
+    CELL_IDS_NAME,
+    read_cell_property,
+    read_manifest,
+    write_cell_property,
+    write_grid_cache,
+)
+
+
+@pytest.fixture(name="directory")
+def fixture_directory(tmp_path):
+    directory = tmp_path / "grid.npycache"
+    write_grid_cache(synthetic_grid(4, 3, 2), directory)
+    return directory
+
+
+def test_property_is_listed(directory):
+    write_cell_property(directory, "pressure", np.arange(24.0))
+    assert read_manifest(directory)["properties"] == ["pressure"]
+    np.testing.assert_array_equal(
+        read_cell_property(directory, "pressure"), np.arange(24.0)
+    )
+
+
+def test_replaced_property_keeps_mapped_values(directory):
+    write_cell_property(directory, "pressure", np.zeros(24))
+    mapped = read_cell_property(directory, "pressure")
+    write_cell_property(directory, "pressure", np.ones(24))
+
+    np.testing.assert_array_equal(mapped, np.zeros(24))
+    np.testing.assert_array_equal(read_cell_property(directory, "pressure"), 1)
+    assert read_manifest(directory)["properties"] == ["pressure"]
+    assert [path.name for path in directory.glob("*.tmp-*")] == []
+
+
+@pytest.mark.parametrize("name", ["vtkGhostType", "ConnectivityFlags", CELL_IDS_NAME])
+def test_grid_arrays_are_rejected(directory, name):
+    before = (directory / "manifest.json").read_text()
+    with pytest.raises(ValueError):
+        write_cell_property(directory, name, np.zeros(24))
+    assert (directory / "manifest.json").read_text() == before
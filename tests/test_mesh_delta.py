@@ -0,0 +1,20 @@
+import numpy as np
+import pyvista
+
+from mesh_delta import delta_update, polydata_arrays
+
+
+def test_missing_field_is_left_out():
+    polydata = pyvista.Plane(i_resolution=2, j_resolution=2)
+    arrays = polydata_arrays(polydata, field_to_keep="scalar")
+    assert set(arrays) == {"points", "polys"}
+
+    outputs, _ = delta_update(arrays, ["points", "polys", "scalars"], None)
+    assert outputs[2] == []
+
+
+def test_field_is_kept():
+    polydata = pyvista.Plane(i_resolution=2, j_resolution=2)
+    polydata.cell_data["scalar"] = np.arange(polydata.n_cells, dtype=float)
+    arrays = polydata_arrays(polydata, field_to_keep="scalar")
+    np.testing.assert_array_equal(arrays["scalars"], np.arange(4))
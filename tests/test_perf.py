@@ -0,0 +1,39 @@
+import json
+import os
+
+import pytest
+
+from perf import PerfRecorder
+
+
+@pytest.fixture(name="recorder")
+def fixture_recorder(tmp_path):
+    recorder = PerfRecorder(echo=False)
+    recorder.configure(jsonl_path=tmp_path / "perf.jsonl")
+    return recorder
+
+
+def _append(path, record):
+    with open(path, "a") as log:
+        log.write(json.dumps(record) + "\n")
+
+
+def test_ingest_log_adds_records_of_other_processes(recorder):
+    recorder.record({"stage": "slice", "pid": os.getpid(), "seconds": 0.1})
+    _append(recorder.jsonl_path, {"stage": "slice", "pid": -1, "seconds": 0.3})
+
+    assert recorder.ingest_log() == 1
+    assert recorder.stats()["slice"]["count"] == 2
+    # Already ingested records are not added again
+    assert recorder.ingest_log() == 0
+
+
+def test_ingest_log_waits_for_complete_lines(recorder):
+    line = json.dumps({"stage": "slice", "pid": -1, "seconds": 0.3}) + "\n"
+    with open(recorder.jsonl_path, "a") as log:
+        log.write(line[:10])
+    assert recorder.ingest_log() == 0
+
+    with open(recorder.jsonl_path, "a") as log:
+        log.write(line[10:])
+    assert recorder.ingest_log() == 1
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+import pyvista
+from vtk.util.numpy_support import vtk_to_numpy
+
+xtgeo = pytest.importorskip("xtgeo")
+
+from grid_properties import SCALAR_NAME
+from grid_store import read_grid_cache, read_unstructured_cache
+from roff2vtk import refine_cell_values, refine_vtk_geometries, write_refined_cache
+from vtu_output import write_vtu
+
+REFINE = 3
+
+
+def _corners(ni, nj, nk, seed=0):
+    """Corner array of a grid with sloping, unevenly thick layers"""
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.arange(ni + 1.0), np.arange(nj + 1.0), indexing="ij")
+    depth = np.cumsum(rng.uniform(1, 3, (ni + 1, nj + 1, nk + 1)), axis=2)
+    pillars = np.stack(
+        np.broadcast_arrays(x[..., None], y[..., None], 1000 + x[..., None] - depth),
+        axis=-1,
+    )
+
+    def _split(array, axis):
+        # Inner nodes are shared by two cells, so appear twice
+        inner = np.repeat(
+            np.take(array, range(1, array.shape[axis] - 1), axis), 2, axis
+        )
+        first = np.take(array, [0], axis)
+        last = np.take(array, [-1], axis)
+        return np.concatenate((first, inner, last), axis)
+
+    corners = _split(_split(_split(pillars, 0), 1), 2)
+    return (ni + 1, nj + 1, nk + 1), corners.reshape(-1, 3, order="F")
+
+
+def _in_memory(dims, corners, inactive, scalars):
+    """The grid `convert` built before refinement was streamed"""
+    scalars = {
+        name: refine_cell_values(values, dims, REFINE)
+        for name, values in scalars.items()
+    }
+    dims, corners, inactive = refine_vtk_geometries(dims, corners, inactive, REFINE)
+    grid = pyvista.ExplicitStructuredGrid(dims, corners)
+    grid.compute_connectivity(inplace=True)
+    grid.hide_cells(inactive, inplace=True)
+    grid.flip_z(inplace=True)
+    for index, (name, values) in enumerate(scalars.items()):
+        grid.cell_data[name] = values
+        if index == 0:
+            grid.cell_data[SCALAR_NAME] = values
+    return grid
+
+
+@pytest.fixture(name="grids")
+def fixture_grids(tmp_path):
+    dims, corners = _corners(4, 3, 2)
+    inactive = np.array([1, 5, 13, 22])
+    ncells = 4 * 3 * 2
+    scalars = {
+        "poro": np.linspace(0.1, 0.3, ncells),
+        "facies": np.arange(ncells, dtype=np.int32) % 3,
+    }
+    reference = _in_memory(dims, corners, inactive, scalars)
+    directory = tmp_path / "streamed.npycache"
+    refined_dims = write_refined_cache(
+        dims, corners, inactive, scalars, REFINE, directory
+    )
+    assert tuple(refined_dims) == tuple(reference.dimensions)
+    return reference, directory
+
+
+def test_streamed_cache_matches_in_memory_grid(grids):
+    reference, directory = grids
+    streamed = read_grid_cache(directory)
+
+    assert streamed.n_cells == reference.n_cells
+    np.testing.assert_array_equal(streamed.points, reference.points)
+    np.testing.assert_array_equal(
+        vtk_to_numpy(streamed.GetCells().GetConnectivityArray()),
+        vtk_to_numpy(reference.GetCells().GetConnectivityArray()),
+    )
+    for name in reference.cell_data.keys():
+        np.testing.assert_array_equal(
+            streamed.cell_data[name], reference.cell_data[name], err_msg=name
+        )
+
+
+def test_streamed_vtu_matches_in_memory_vtu(grids, tmp_path):
+    reference, directory = grids
+    write_vtu(reference, tmp_path / "reference.vtu")
+    write_vtu(read_unstructured_cache(directory), tmp_path / "streamed.vtu")
+    expected = pyvista.read(tmp_path / "reference.vtu")
+    written = pyvista.read(tmp_path / "streamed.vtu")
+
+    np.testing.assert_array_equal(written.points, expected.points)
+    np.testing.assert_array_equal(written.cells, expected.cells)
+    np.testing.assert_array_equal(written.celltypes, expected.celltypes)
+    assert written.cell_data.keys() == expected.cell_data.keys()
+    for name in expected.cell_data.keys():
+        np.testing.assert_array_equal(
+            written.cell_data[name], expected.cell_data[name], err_msg=name
+        )
+
+
+def test_refined_geometry_matches_refine_vertically():
+    grid = xtgeo.create_box_grid((4, 3, 2), increment=(10.0, 10.0, 5.0))
+    dims, corners, inactive = grid.get_vtk_geometries()
+    refined = grid.copy()
+    refined.refine_vertically(REFINE)
+    expected_dims, expected_corners, _ = refined.get_vtk_geometries()
+
+    refined_dims, refined_corners, _ = refine_vtk_geometries(
+        dims, corners, inactive, REFINE
+    )
+    assert tuple(refined_dims) == tuple(expected_dims)
+    np.testing.assert_allclose(refined_corners, expected_corners)
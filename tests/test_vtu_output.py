@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from vtu_output import partition_cells
+
+
+def _brute_force(dims, partition, size):
+    ni, nj, nk = (d - 1 for d in dims)
+    i, j, k = np.unravel_index(np.arange(ni * nj * nk), (ni, nj, nk), order="F")
+    if partition == "k":
+        return [np.flatnonzero(k // size == piece) for piece in range(-(-nk // size))]
+    return [
+        np.flatnonzero((i // size == bi) & (j // size == bj))
+        for bi in range(-(-ni // size))
+        for bj in range(-(-nj // size))
+    ]
+
+
+@pytest.mark.parametrize("partition", ["k", "ij"])
+@pytest.mark.parametrize("dims", [(5, 4, 3), (12, 7, 9), (2, 2, 2)])
+@pytest.mark.parametrize("size", [1, 3, 10])
+def test_pieces_hold_their_cells_in_grid_order(dims, partition, size):
+    pieces = partition_cells(dims, partition, size)
+    expected = _brute_force(dims, partition, size)
+    assert len(pieces) == len(expected)
+    for piece, cells in zip(pieces.values(), expected):
+        np.testing.assert_array_equal(piece["cells"], cells)
+
+
+def test_piece_ranges():
+    pieces = partition_cells((6, 4, 3), "ij", 2)
+    assert list(pieces) == ["i0-j0", "i0-j2", "i2-j0", "i2-j2", "i4-j0", "i4-j2"]
+    assert pieces["i4-j2"]["i"] == [4, 5]
+    assert pieces["i4-j2"]["j"] == [2, 3]
+    assert pieces["i4-j2"]["k"] == [0, 2]
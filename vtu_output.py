@@ -0,0 +1,243 @@
+"""Compressed and partitioned .vtu output for large grids.
+
+`pyvista.save` writes inline base64 encoded arrays, a third larger than
+the data and slow to decode. `write_vtu` writes the arrays as raw
+appended binary instead, compressed block by block with zlib, lz4 (much
+faster to decompress) or lzma (smallest).
+
+`write_partitioned` splits a grid into pieces of whole k-layers or of
+i/j column blocks through all layers, written as .vtu files referenced
+by a .pvtu file. A JSON manifest next to it records the index range and
+bounds of each piece, so `PartitionedGrid` can read only the pieces
+needed, e.g. the visible layers or the columns hit by an intersection.
+Opening the .pvtu with `pyvista.read` gives the whole grid.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+from xml.etree import ElementTree
+
+import numpy as np
+import pyvista
+from vtkmodules.vtkIOXML import vtkXMLUnstructuredGridWriter
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+COMPRESSORS = ("none", "zlib", "lz4", "lzma")
+PARTITIONS = ("k", "ij")
+
+# Grid cell id of each cell in a piece, added by `extract_cells`
+CELL_IDS_NAME = "vtkOriginalCellIds"
+
+
+def write_vtu(grid, path: Union[str, Path], compression: str = "zlib") -> int:
+    """Write `grid` as .vtu with raw appended, compressed arrays.
+
+    An ExplicitStructuredGrid is written as an unstructured grid with its
+    BLOCK_I/J/K cell arrays, as by `pyvista.save`, so it can be cast back.
+    Returns the file size.
+    """
+    if compression not in COMPRESSORS:
+        raise ValueError(f"Unknown compression {compression!r}, use {COMPRESSORS}")
+    if isinstance(grid, pyvista.ExplicitStructuredGrid):
+        grid = grid.cast_to_unstructured_grid()
+    path = Path(path)
+    writer = vtkXMLUnstructuredGridWriter()
+    writer.SetFileName(str(path))
+    writer.SetInputData(grid)
+    writer.SetDataModeToAppended()
+    writer.EncodeAppendedDataOff()
+    {
+        "none": writer.SetCompressorTypeToNone,
+        "zlib": writer.SetCompressorTypeToZLib,
+        "lz4": writer.SetCompressorTypeToLZ4,
+        "lzma": writer.SetCompressorTypeToLZMA,
+    }[compression]()
+    if not writer.Write():
+        raise OSError(f"Could not write {path}")
+    return path.stat().st_size
+
+
+def partition_cells(
+    dims: Sequence[int], partition: str = "k", size: int = 10
+) -> Dict[str, Dict]:
+    """Cell ids and (i, j, k) ranges of each piece, by piece name.
+
+    Pieces hold `size` k-layers ("k"), or blocks of `size` x `size`
+    columns through all layers ("ij"). Cell ids are in the F order of
+    ExplicitStructuredGrid.
+    """
+    if partition not in PARTITIONS:
+        raise ValueError(f"Unknown partition {partition!r}, use {PARTITIONS}")
+    ni, nj, nk = (int(d) - 1 for d in dims)
+
+    def _piece(cells, i_range, j_range, k_range):
+        return {"cells": cells, "i": i_range, "j": j_range, "k": k_range}
+
+    if partition == "k":
+        # Cells of a layer are contiguous in F order
+        return {
+            f"k{k0}": _piece(
+                np.arange(k0 * ni * nj, min(k0 + size, nk) * ni * nj),
+                [0, ni],
+                [0, nj],
+                [k0, min(k0 + size, nk)],
+            )
+            for k0 in range(0, nk, size)
+        }
+
+    # Piece of each cell in one pass, then cells grouped by piece with a
+    # stable sort, which keeps them in grid order within each piece
+    nbi, nbj = -(-ni // size), -(-nj // size)
+    column_piece = (np.arange(ni)[:, None] // size) * nbj + np.arange(nj) // size
+    piece_of_cell = np.tile(column_piece.ravel(order="F"), nk)
+    cells = np.argsort(piece_of_cell, kind="stable")
+    bounds = np.searchsorted(piece_of_cell[cells], np.arange(nbi * nbj + 1))
+    pieces = {}
+    for bi in range(nbi):
+        for bj in range(nbj):
+            piece = bi * nbj + bj
+            i0, j0 = bi * size, bj * size
+            pieces[f"i{i0}-j{j0}"] = _piece(
+                cells[bounds[piece] : bounds[piece + 1]],
+                [i0, min(i0 + size, ni)],
+                [j0, min(j0 + size, nj)],
+                [0, nk],
+            )
+    return pieces
+
+
+def _xml_type(array: np.ndarray) -> str:
+    kind = {"i": "Int", "u": "UInt", "f": "Float"}[array.dtype.kind]
+    return f"{kind}{array.dtype.itemsize * 8}"
+
+
+def _write_pvtu(
+    path: Path, piece: pyvista.UnstructuredGrid, sources: List[str]
+) -> None:
+    """Index file of the pieces, declaring the arrays of the first one"""
+    root = ElementTree.Element(
+        "VTKFile", type="PUnstructuredGrid", version="1.0", byte_order="LittleEndian"
+    )
+    grid = ElementTree.SubElement(root, "PUnstructuredGrid", GhostLevel="0")
+
+    def _declare(parent, name, array):
+        array = np.asarray(array)
+        ElementTree.SubElement(
+            parent,
+            "PDataArray",
+            type=_xml_type(array),
+            Name=name,
+            NumberOfComponents=str(1 if array.ndim == 1 else array.shape[1]),
+        )
+
+    for tag, data in (("PPointData", piece.point_data), ("PCellData", piece.cell_data)):
+        parent = ElementTree.SubElement(grid, tag)
+        for name in data.keys():
+            _declare(parent, name, data[name])
+    _declare(ElementTree.SubElement(grid, "PPoints"), "Points", piece.points)
+    for source in sources:
+        ElementTree.SubElement(grid, "Piece", Source=source)
+    ElementTree.ElementTree(root).write(path, xml_declaration=True)
+
+
+def write_partitioned(
+    grid: Union[pyvista.ExplicitStructuredGrid, pyvista.UnstructuredGrid],
+    path: Union[str, Path],
+    partition: str = "k",
+    size: int = 10,
+    compression: str = "zlib",
+    dimensions: Optional[Sequence[int]] = None,
+) -> Dict:
+    """Write `grid` as a .pvtu with one .vtu per piece, returning the manifest.
+
+    Pieces are written to a directory named after the .pvtu. Inactive
+    cells are kept, hidden as in the grid, so pieces keep whole layers or
+    columns. An UnstructuredGrid with the cells of an explicit structured
+    grid, e.g. a mapped grid cache, is split as is, given its `dimensions`.
+    """
+    path = Path(path).with_suffix(".pvtu")
+    directory = path.with_suffix("")
+    directory.mkdir(parents=True, exist_ok=True)
+    if isinstance(grid, pyvista.ExplicitStructuredGrid):
+        dimensions = grid.dimensions
+        unstructured = grid.cast_to_unstructured_grid()
+    elif dimensions is None:
+        raise ValueError("The dimensions of an unstructured grid are required")
+    else:
+        unstructured = grid
+
+    pieces, sources, first = {}, [], None
+    for name, piece in partition_cells(dimensions, partition, size).items():
+        if not len(piece["cells"]):
+            continue
+        cells = unstructured.extract_cells(piece.pop("cells"))
+        source = f"{directory.name}/{name}.vtu"
+        piece["nbytes"] = write_vtu(cells, path.parent / source, compression)
+        piece["n_cells"] = cells.n_cells
+        piece["bounds"] = list(cells.bounds)
+        pieces[source] = piece
+        sources.append(source)
+        first = first if first is not None else cells
+
+    _write_pvtu(path, first, sources)
+    manifest = {
+        "dimensions": [int(d) for d in dimensions],
+        "partition": partition,
+        "size": size,
+        "compression": compression,
+        "pieces": pieces,
+    }
+    PartitionedGrid.manifest_file(path).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+class PartitionedGrid:
+    """Pieces of a grid written by `write_partitioned`, read on demand"""
+
+    def __init__(self, pvtu_file: Union[str, Path]) -> None:
+        self.path = Path(pvtu_file)
+        self.manifest = json.loads(self.manifest_file(self.path).read_text())
+        self.pieces: Dict[str, Dict] = self.manifest["pieces"]
+
+    @staticmethod
+    def manifest_file(pvtu_file: Union[str, Path]) -> Path:
+        return Path(pvtu_file).with_suffix(".partitions.json")
+
+    def pieces_for_layers(self, k_min: int, k_max: int) -> List[str]:
+        """Pieces with cells in layers k_min <= k <= k_max"""
+        return [
+            source
+            for source, piece in self.pieces.items()
+            if piece["k"][0] <= k_max and piece["k"][1] > k_min
+        ]
+
+    def pieces_for_columns(self, columns: np.ndarray) -> List[str]:
+        """Pieces holding any of the (n, 2) i, j columns"""
+        columns = np.atleast_2d(columns)
+        return [
+            source
+            for source, piece in self.pieces.items()
+            if (
+                (columns[:, 0] >= piece["i"][0])
+                & (columns[:, 0] < piece["i"][1])
+                & (columns[:, 1] >= piece["j"][0])
+                & (columns[:, 1] < piece["j"][1])
+            ).any()
+        ]
+
+    def read(self, sources: Optional[Sequence[str]] = None) -> pyvista.UnstructuredGrid:
+        """Pieces merged into one grid, all if `sources` is None.
+
+        Cells keep their grid cell id in `CELL_IDS_NAME` and their
+        BLOCK_I/J/K indices.
+        """
+        sources = list(self.pieces) if sources is None else list(sources)
+        grids = [pyvista.read(self.path.parent / source) for source in sources]
+        if not grids:
+            return pyvista.UnstructuredGrid()
+        if len(grids) == 1:
+            return grids[0]
+        return grids[0].merge(grids[1:], merge_points=False)
@@ -0,0 +1,127 @@
+"""Curtain sections along well trajectories.
+
+A well trajectory is sampled densely (often every meter or less), but a
+vertical curtain only depends on its path in map view, and most of those
+samples are nearly collinear. The trajectory is therefore simplified in
+XY with Douglas-Peucker to a tolerance relative to the grid cell size
+before intersecting, so the number of segments, and the slicing time,
+follows the curvature of the well rather than its sampling density.
+"""
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+# Curtain tolerance as a fraction of the lateral grid cell size
+DEFAULT_TOLERANCE = 0.1
+
+
+def read_trajectory(path: Union[str, Path]) -> np.ndarray:
+    """(n, 3) x, y, z of a well trajectory file.
+
+    RMS well files (.rmswell, .w) are read with xtgeo, other files as
+    whitespace or comma separated columns x, y, z where lines that are not
+    numbers (headers, comments) are skipped.
+    """
+    path = Path(path)
+    if path.suffix.lower() in (".rmswell", ".w"):
+        import xtgeo
+
+        dataframe = xtgeo.well_from_file(path).dataframe
+        return dataframe[["X_UTME", "Y_UTMN", "Z_TVDSS"]].to_numpy(dtype=float)
+
+    rows = []
+    for line in path.read_text().splitlines():
+        try:
+            rows.append([float(v) for v in line.replace(",", " ").split()[:3]])
+        except ValueError:
+            continue
+    points = np.array([row for row in rows if len(row) == 3], dtype=float)
+    if len(points) < 2:
+        raise ValueError(f"No x, y, z trajectory found in {path}")
+    return points
+
+
+def simplify_polyline(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker simplification of `points` in XY.
+
+    Keeps the end points and every vertex needed to stay within
+    `tolerance` of the original path in map view. Distances are to the
+    segments (not the infinite lines), so hooks and reversals survive.
+    """
+    points = np.asarray(points, dtype=float)
+    xy = points[:, :2]
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        relative = xy[start + 1 : end] - xy[start]
+        length2 = segment @ segment
+        t = np.clip(relative @ segment / length2, 0, 1) if length2 > 0 else 0.0
+        distance = np.hypot(*(relative - np.multiply.outer(t, segment)).T)
+        index = int(np.argmax(distance))
+        if distance[index] > tolerance:
+            middle = start + 1 + index
+            keep[middle] = True
+            stack.extend([(start, middle), (middle, end)])
+    return points[keep]
+
+
+def lateral_cell_size(intersector) -> float:
+    """Typical cell size in map view of the grid behind a GridIntersector"""
+    xmin, xmax, ymin, ymax = intersector.xy_bounds
+    ni, nj, _nk = (d - 1 for d in intersector.dims)
+    return float(np.sqrt((xmax - xmin) * (ymax - ymin) / (ni * nj)))
+
+
+def curtain_polyline(
+    trajectory: np.ndarray,
+    tolerance: float,
+    vertical_direction: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Polyline to intersect for a curtain along `trajectory`.
+
+    A (near) vertical well has no direction in map view, its curtain is
+    then a section through the well in `vertical_direction` (east-west by
+    default).
+    """
+    trajectory = np.asarray(trajectory, dtype=float)
+    xy = trajectory[:, :2]
+    if np.ptp(xy, axis=0).max() <= tolerance:
+        direction = np.asarray(
+            vertical_direction if vertical_direction is not None else (1.0, 0.0)
+        )
+        center = trajectory.mean(axis=0)
+        offset = np.append(direction / np.hypot(*direction), 0) * max(tolerance, 1)
+        return np.array([center - offset, center + offset])
+    return simplify_polyline(trajectory, tolerance)
+
+
+class WellCurtain:
+    """Simplified curtain polyline of a well, for a given grid"""
+
+    def __init__(self, trajectory: np.ndarray, tolerance: float) -> None:
+        self.trajectory = np.asarray(trajectory, dtype=float)
+        self.tolerance = tolerance
+        self.polyline = curtain_polyline(self.trajectory, tolerance)
+
+    @classmethod
+    def from_file(
+        cls,
+        path: Union[str, Path],
+        intersector,
+        fraction: float = DEFAULT_TOLERANCE,
+    ) -> "WellCurtain":
+        """Curtain of the well in `path`, in grid coordinates.
+
+        Apps map the polyline to view coordinates with `ViewTransform`.
+        """
+        return cls(read_trajectory(path), fraction * lateral_cell_size(intersector))
+
+    def intersect(self, intersector, **kwargs):
+        """Section along the curtain, see `GridIntersector.intersect`"""
+        return intersector.intersect(self.polyline, **kwargs)